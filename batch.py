@@ -0,0 +1,161 @@
+import argparse
+import concurrent.futures
+import json
+import logging
+import sys
+
+import machine
+from isa import read_code
+
+# Job fields and their defaults (same as machine.py ones)
+JOB_DEFAULTS = {
+    "input": "",
+    "engine": machine.parser.get_default("engine"),
+    "mem_size": machine.parser.get_default("mem_size"),
+    "cache_size": machine.parser.get_default("cache_size"),
+    "start_adr": machine.parser.get_default("start_adr"),
+    "io_adr": machine.parser.get_default("io_adr"),
+    "tick_limit": machine.parser.get_default("tick_limit"),
+}
+
+# Vector jobs sharing all of these are simulated together by one lockstep engine
+VECTOR_GROUP_FIELDS = ("source", "mem_size", "cache_size", "start_adr", "io_adr", "tick_limit")
+
+# Every worker process parses each program only once
+_codes = {}
+
+
+def init_worker():
+    # Halt / tick limit warnings of every job are of no use here
+    logging.disable(logging.WARNING)
+
+
+def load_code(source: str):
+    if source not in _codes:
+        _codes[source] = read_code(source)
+    return _codes[source]
+
+
+def job_result(job: dict, outcome) -> dict:
+    result = {"id": job["id"], "source": job["source"]}
+    if isinstance(outcome, Exception):
+        # Any machine error is just a job result
+        result.update({"error": type(outcome).__name__, "message": str(outcome)})
+    else:
+        output, ticks, miss_rate, stop = outcome
+        result.update({"output": output, "ticks": ticks, "miss_rate": miss_rate, "stop": stop})
+    return result
+
+
+def run_job(job: dict) -> list[dict]:
+    job = {**JOB_DEFAULTS, **job}
+    try:
+        control = machine.build_control_unit(
+            load_code(job["source"]),
+            job["input"],
+            job["engine"],
+            job["mem_size"],
+            job["cache_size"],
+            job["start_adr"],
+            job["io_adr"],
+        )
+        outcome = (*control.simulate(job["tick_limit"]), control._stop_reason)
+    except Exception as e:
+        outcome = e
+    return [job_result(job, outcome)]
+
+
+def run_vector_jobs(jobs: list[dict]) -> list[dict]:
+    job = jobs[0]
+    try:
+        # numpy is only required when there are vector jobs
+        from vector_unit import VectorMachines
+
+        machines = VectorMachines(
+            load_code(job["source"]),
+            [vector_job["input"] for vector_job in jobs],
+            job["mem_size"],
+            job["cache_size"],
+            job["start_adr"],
+            job["io_adr"],
+        )
+        outcomes = machines.simulate(job["tick_limit"])
+    except Exception as e:
+        outcomes = [e] * len(jobs)
+    return [job_result(job, outcome) for job, outcome in zip(jobs, outcomes)]
+
+
+def group_vector_jobs(jobs: list[dict]) -> tuple[list[dict], list[list[dict]]]:
+    scalar_jobs = []
+    vector_groups = {}
+    for job in jobs:
+        job = {**JOB_DEFAULTS, **job}
+        if job["engine"] == "vector":
+            vector_groups.setdefault(tuple(job[field] for field in VECTOR_GROUP_FIELDS), []).append(job)
+        else:
+            scalar_jobs.append(job)
+    return scalar_jobs, list(vector_groups.values())
+
+
+def read_jobs(manifest) -> list[dict]:
+    jobs = []
+    for line_n, line in enumerate(manifest, 1):
+        if line.strip() == "":
+            continue
+        job = json.loads(line)
+        job.setdefault("id", line_n)
+        jobs.append(job)
+    return jobs
+
+
+def main(args):
+    with open(args.manifest, encoding="utf-8") as file:
+        scalar_jobs, vector_groups = group_vector_jobs(read_jobs(file))
+
+    out = open(args.out_file, "w", encoding="utf-8") if args.out_file else sys.stdout
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as executor:
+            futures = [executor.submit(run_job, job) for job in scalar_jobs]
+            futures += [executor.submit(run_vector_jobs, group) for group in vector_groups]
+            # Results are streamed in completion order
+            for future in concurrent.futures.as_completed(futures):
+                for result in future.result():
+                    out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+parser = argparse.ArgumentParser(
+    description="Runs many stack machine simulations on a process pool",
+    epilog='Manifest line example: {"id": "sort-1", "source": "sort.o", "input": "abc\\r", "cache_size": 128}',
+)
+parser.add_argument(
+    "manifest",
+    metavar="MANIFEST",
+    help="a jsonl file with one job per line. Job fields: source (required), id, input, engine, "
+    "mem_size, cache_size, start_adr, io_adr, tick_limit. Jobs with vector engine (requires numpy) "
+    "and the same program & machine configuration are simulated together in lockstep",
+)
+parser.add_argument(
+    "-o",
+    "--output_file",
+    dest="out_file",
+    metavar="OUT",
+    required=False,
+    help="file to write jsonl results to. Default: stdout",
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    dest="workers",
+    type=int,
+    metavar="WORKERS",
+    required=False,
+    default=None,
+    help="number of worker processes. Default: number of CPUs",
+)
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,38 @@
+import json
+import logging
+
+import batch
+import forthc
+from isa import write_code
+
+
+def test_batch_results(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    target = str(tmp_path / "cat.o")
+    with open("programs/cat.f", encoding="utf-8") as file:
+        write_code(target, forthc.translate(file.read(), 0, 10))
+
+    manifest = tmp_path / "jobs.jsonl"
+    jobs = [
+        {"id": "micro", "source": target, "input": "Lorem", "engine": "micro"},
+        {"id": "fast", "source": target, "input": "Lorem", "engine": "fast"},
+        {"id": "limit", "source": target, "input": "Lorem", "tick_limit": 100},
+        {"id": "vector-1", "source": target, "input": "Lorem", "engine": "vector"},
+        {"id": "vector-2", "source": target, "input": "Ipsum", "engine": "vector"},
+        {"id": "missing", "source": str(tmp_path / "missing.o")},
+    ]
+    manifest.write_text("\n".join(map(json.dumps, jobs)), encoding="utf-8")
+    out = tmp_path / "results.jsonl"
+
+    batch.main(batch.parser.parse_args([str(manifest), "-o", str(out), "-w", "2"]))
+
+    results = {result["id"]: result for result in map(json.loads, out.read_text(encoding="utf-8").splitlines())}
+    assert results["micro"]["output"] == "Lorem"
+    assert results["micro"]["stop"] == "buffer_empty"
+    assert {key: results["fast"][key] for key in ("output", "ticks", "miss_rate")} == {
+        key: results["micro"][key] for key in ("output", "ticks", "miss_rate")
+    }
+    assert results["limit"]["stop"] == "tick_limit"
+    assert results["vector-1"] == {**results["micro"], "id": "vector-1"}
+    assert results["vector-2"]["output"] == "Ipsum"
+    assert results["missing"]["error"] == "FileNotFoundError"
@@ -0,0 +1,281 @@
+import argparse
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import pathlib
+import resource
+import sys
+import time
+
+import forthc
+import machine
+
+# Benchmark workloads: every program of programs/ (with inputs like the golden
+# tests ones) and synthetic ones growing with scale. Each workload is compiled &
+# simulated in a fresh worker process, so its peak RSS is its own.
+
+PROGRAMS_DIR = pathlib.Path(__file__).parent / "programs"
+IO_ADR = 0
+START_ADR = 10
+# Every workload halts long before it
+TICK_LIMIT = 1_000_000_000
+
+PROGRAM_INPUTS = {
+    "bubble_sort": "banananmanandotherwordstocheckcacheefficient\r",
+    "cat": "Lorem Ipsum",
+    "guess_game": "7\r12\r",
+    "hello_user_name": "OneLoneCoder Fan\r",
+}
+
+SORT_SOURCE = """variable buffer sallot {capacity}
+: get_data
+    1 begin
+        dup key dup 13 = if
+            drop 1 - buffer ! leave
+        else
+            swap buffer + ! 1 +
+        then
+    dup {capacity} 1 + = until
+drop
+;
+get_data
+: bubble_sort
+    begin
+        1
+        buffer @ 1 - 1 do
+            buffer i + 1 + @ buffer i + @ < if
+                drop 0
+                buffer i + 1 + @
+                buffer i + @
+                buffer i + 1 + !
+                buffer i + !
+            then
+        loop
+    until
+;
+bubble_sort
+: print_data
+    buffer @ 1 do
+        buffer i + @ emit
+    loop
+;
+print_data"""
+
+LOOP_SOURCE = """variable acc
+: spin
+    0 acc !
+    {size} 1 do
+        i 7 mod acc @ + acc !
+    loop
+;
+spin acc @ ."""
+
+STREAM_SOURCE = """: cat
+    begin
+        key dup dup if
+            emit
+        then
+    0 = until
+;
+cat"""
+
+# Report fields compared with the baseline ones
+RESULT_FIELDS = ("ticks", "miss_rate", "output_length", "stop")
+
+
+def program_workloads() -> list[dict]:
+    return [
+        {"name": path.stem, "source": path.read_text(encoding="utf-8"), "input": PROGRAM_INPUTS.get(path.stem, "")}
+        for path in sorted(PROGRAMS_DIR.glob("*.f"))
+    ]
+
+
+def synthetic_workloads(scale: int) -> list[dict]:
+    size = 64 * scale
+    # Reversed letters are the worst case of bubble sort
+    letters = "".join(chr(ord("z") - i % 26) for i in range(size))
+    return [
+        {
+            "name": f"sort-{size}",
+            # Room for one more letter, so the input always ends with a carriage return
+            "source": SORT_SOURCE.format(capacity=size + 1),
+            "input": letters + "\r",
+            "mem_size": max(1024, size + 512),
+        },
+        {"name": f"loop-{20000 * scale}", "source": LOOP_SOURCE.format(size=20000 * scale), "input": ""},
+        {"name": f"stream-{2048 * scale}", "source": STREAM_SOURCE, "input": "Lorem ipsum dolor sit\n" * (93 * scale)},
+    ]
+
+
+def run_workload(workload: dict, engine: str, repeat: int) -> dict:
+    """Best compile & simulation times of repeat runs"""
+    # Halt warnings of every run are of no use here
+    logging.disable(logging.WARNING)
+    compile_times = []
+    run_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        code = forthc.translate(workload["source"], IO_ADR, START_ADR)
+        compile_times.append(time.perf_counter() - start)
+        control = machine.build_control_unit(
+            code,
+            workload["input"],
+            engine,
+            workload.get("mem_size", 1024),
+            machine.parser.get_default("cache_size"),
+            START_ADR,
+            IO_ADR,
+        )
+        start = time.perf_counter()
+        output, ticks, miss_rate = control.simulate(TICK_LIMIT)
+        run_times.append(time.perf_counter() - start)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "compile_seconds": min(compile_times),
+        "run_seconds": min(run_times),
+        "ticks": ticks,
+        "ticks_per_second": ticks / min(run_times),
+        "miss_rate": miss_rate,
+        "output_length": len(output),
+        "stop": control._stop_reason,
+        # Linux reports KiB, macOS bytes
+        "peak_rss_kib": max_rss // 1024 if sys.platform == "darwin" else max_rss,
+    }
+
+
+def run_benchmarks(workloads: list[dict], engines: list[str], repeat: int) -> dict:
+    results = {}
+    # A fresh (spawned, not forked) process per task & one at a time: no RSS is shared and no run slows another down
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as executor:
+        futures = {
+            f"{workload['name']}/{engine}": executor.submit(run_workload, workload, engine, repeat)
+            for workload in workloads
+            for engine in engines
+        }
+        for key, future in futures.items():
+            results[key] = future.result()
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Workloads simulated slower than baseline ones by more than threshold (a fraction)"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for field in RESULT_FIELDS:
+            if result[field] != base[field]:
+                logging.warning("%s: %s is %s, baseline one is %s", key, field, result[field], base[field])
+        if result["ticks_per_second"] < base["ticks_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{key}: {result['ticks_per_second']:.0f} ticks/s, baseline {base['ticks_per_second']:.0f} ticks/s"
+            )
+    return regressions
+
+
+def format_results(results: dict, baseline: dict) -> str:
+    lines = [
+        f"{'workload':<28} {'compile ms':>10} {'ticks':>10} {'ticks/s':>10} {'vs base':>8} {'RSS KiB':>9} {'miss':>7}"
+    ]
+    for key, result in results.items():
+        base = baseline.get(key)
+        change = f"{result['ticks_per_second'] / base['ticks_per_second'] - 1:+.1%}" if base else "-"
+        lines.append(
+            f"{key:<28} {result['compile_seconds'] * 1000:>10.2f} {result['ticks']:>10} "
+            f"{result['ticks_per_second']:>10.0f} {change:>8} {result['peak_rss_kib']:>9} {result['miss_rate']:>7.2%}"
+        )
+    return "\n".join(lines)
+
+
+def main(args) -> list[str]:
+    """Prints results and returns the regressions found"""
+    workloads = [] if args.synthetic_only else program_workloads()
+    workloads += synthetic_workloads(args.scale)
+    if args.workloads:
+        workloads = [workload for workload in workloads if workload["name"] in args.workloads]
+    results = run_benchmarks(workloads, args.engines or ["fast"], args.repeat)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+    print(format_results(results, baseline))
+    regressions = find_regressions(results, baseline, args.threshold)
+    for regression in regressions:
+        logging.error("Throughput regression: %s", regression)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"scale": args.scale, "repeat": args.repeat, "results": results}, file, indent=2)
+    return regressions
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmarks forthc & the stack machine on programs/ and synthetic workloads",
+    epilog="Regression gate: benchmark.py --save base.json, then benchmark.py --baseline base.json",
+)
+parser.add_argument(
+    "-e",
+    "--engine",
+    dest="engines",
+    action="append",
+    choices=machine.ENGINES.keys(),
+    help="engine to benchmark, may be given several times. Default: fast",
+)
+parser.add_argument(
+    "--scale",
+    dest="scale",
+    type=int,
+    default=1,
+    help="size of synthetic workloads: sort of 64 * SCALE letters, loop of 20000 * SCALE iterations "
+    "and stream of about 2048 * SCALE characters. Default: 1",
+)
+parser.add_argument(
+    "-r",
+    "--repeat",
+    dest="repeat",
+    type=int,
+    default=3,
+    help="runs of every workload, the best times are taken. Default: 3",
+)
+parser.add_argument(
+    "-w",
+    "--workload",
+    dest="workloads",
+    action="append",
+    metavar="NAME",
+    help="benchmark only the workload with this name (a program name or e.g. sort-64), may be given several times",
+)
+parser.add_argument(
+    "--synthetic-only",
+    dest="synthetic_only",
+    action="store_true",
+    help="skip programs/",
+)
+parser.add_argument(
+    "--save",
+    dest="save",
+    metavar="FILE",
+    help="write results as a json baseline",
+)
+parser.add_argument(
+    "--baseline",
+    dest="baseline",
+    metavar="FILE",
+    help="compare with the baseline results, workloads not in it are not compared",
+)
+parser.add_argument(
+    "--threshold",
+    dest="threshold",
+    type=float,
+    default=0.25,
+    help="ticks per second fraction a workload may lose against the baseline before it is a regression. Default: 0.25",
+)
+if __name__ == "__main__":
+    logging.basicConfig(format="[%(levelname)s] %(message)s")
+    args = parser.parse_args()
+    if len(main(args)) > 0:
+        sys.exit(1)
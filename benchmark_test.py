@@ -0,0 +1,41 @@
+import contextlib
+import io
+import json
+
+import benchmark
+import forthc
+import machine
+
+
+def test_synthetic_sort_is_sorted():
+    sort = benchmark.synthetic_workloads(1)[0]
+    control = machine.build_control_unit(
+        forthc.translate(sort["source"], benchmark.IO_ADR, benchmark.START_ADR),
+        sort["input"],
+        "fast",
+        sort["mem_size"],
+    )
+    output, _, _ = control.simulate(benchmark.TICK_LIMIT)
+    assert output == "".join(sorted(sort["input"][:-1]))
+
+
+def test_baseline_regression_gate(tmp_path):
+    base = tmp_path / "base.json"
+
+    def run(*options: str) -> list[str]:
+        args = ["-r", "1", "-w", "hello", "-w", "cat", "-e", "fast", "-e", "micro", *options]
+        with contextlib.redirect_stdout(io.StringIO()):
+            return benchmark.main(benchmark.parser.parse_args(args))
+
+    assert run("--save", str(base)) == []
+    results = json.loads(base.read_text(encoding="utf-8"))["results"]
+    assert set(results) == {"hello/fast", "hello/micro", "cat/fast", "cat/micro"}
+    assert results["hello/fast"]["ticks"] == results["hello/micro"]["ticks"]
+    assert results["cat/fast"]["stop"] == "buffer_empty"
+    assert all(result["ticks_per_second"] > 0 and result["peak_rss_kib"] > 0 for result in results.values())
+
+    results["hello/fast"]["ticks_per_second"] *= 100
+    base.write_text(json.dumps({"results": results}), encoding="utf-8")
+    # Short runs are noisy, only the 100 times faster baseline must fail
+    (regression,) = run("--baseline", str(base), "--threshold", "0.9")
+    assert regression.startswith("hello/fast")
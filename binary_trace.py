@@ -0,0 +1,438 @@
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import struct
+import sys
+import zlib
+
+from control_unit import control_repr
+from datapath import datapath_repr
+from memory_unit import memory_repr
+from snapshot import decode_objects
+from tracer import JournalTracer, Tracer
+
+# Binary trace: what JournalTracer would log, but as per-tick deltas of the
+# journal state (tick, mPC, PC, TOS, ALU, AR, MEM, IR, stacks) and compact
+# memory/cache event records. Layout:
+#
+#   MAGIC | segment... | footer json | footer offset (u64 little endian)
+#
+# Every segment starts with a keyframe (the whole journal state) followed by
+# tick deltas & events of up to KEYFRAME_INTERVAL ticks. Footer has the
+# segment index (first tick, offset, length, crc32) and the objects table.
+# Instructions & other non-int values are stored in the objects table and
+# referenced by index. Every object is also defined inline right before its
+# first reference, so equal byte prefixes of two traces mean equal runs.
+#
+# Numbers are LEB128 varints, signed ones zigzag encoded. Values (TOS, ALU,
+# stack items, ...) are zigzag(int) * 2 for ints and index * 2 + 1 for objects.
+
+MAGIC = b"SMTRACE1"
+KEYFRAME_INTERVAL = 4096
+
+KEYFRAME = 0
+TICK = 1
+DEFINE = 2
+FINISH = 3
+
+# Tracer event -> argument kinds: i - signed int, o - "read"/"write", b - bool
+EVENTS = {
+    "prefetch_wait": "i",
+    "io_access": "oi",
+    "cache_access": "oibi",
+    "memory_transfer": "oi",
+    "cache_fill_write": "i",
+    "cache_insert": "i",
+    "line_evicted": "i",
+    "prefetch_start": "i",
+    "cache_lookup": "ib",
+    "prefetch_planned": "i",
+    "wait_total": "i",
+}
+EVENT_KINDS = {name: 16 + i for i, name in enumerate(EVENTS)}
+EVENT_NAMES = {kind: name for name, kind in EVENT_KINDS.items()}
+OPS = ["read", "write"]
+
+# Journal state fields in delta mask bit order, stacks come after them
+FIELDS = ["ticks", "mpc", "pc", "tos", "alu", "ar", "data", "ir"]
+VALUE_FIELDS = {"tos", "alu", "data", "ir"}
+DS_BIT = 1 << len(FIELDS)
+RS_BIT = DS_BIT << 1
+
+
+def zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def unzigzag(value: int) -> int:
+    return value >> 1 if value & 1 == 0 else -((value + 1) >> 1)
+
+
+def put_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def get_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return (result, pos)
+        shift += 7
+
+
+def stack_delta(prev: list, cur: list) -> int:
+    """Length of the common bottom part of two stacks"""
+    common = min(len(prev), len(cur))
+    if prev[:common] == cur[:common]:
+        return common
+    keep = 0
+    while prev[keep] == cur[keep]:
+        keep += 1
+    return keep
+
+
+class BinaryTracer(Tracer):
+    """Writes binary trace to a binary file object, the trace is complete after close"""
+
+    enabled = True
+
+    def __init__(self, file, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self._file = file
+        self._interval = keyframe_interval
+        self._segment = bytearray()
+        # Offset of the current segment in file
+        self._offset = len(MAGIC)
+        # (first tick, offset, length, crc32) of written segments
+        self._index = []
+        self._first_tick = None
+        self._ticks_left = 0
+        self._objects = []
+        self._refs = {}
+        self._prev = None
+        self._ds = []
+        self._rs = []
+        file.write(MAGIC)
+
+    def _value(self, value) -> int:
+        if type(value) is int:
+            return zigzag(value) << 1
+        ref = self._refs.get(id(value))
+        if ref is None:
+            ref = self._refs[id(value)] = len(self._objects)
+            self._objects.append(value)
+            text = json.dumps(value).encode("utf-8")
+            self._segment.append(DEFINE)
+            put_varint(self._segment, len(text))
+            self._segment += text
+        return ref << 1 | 1
+
+    def _put_stack(self, record: bytearray, prev: list, cur: list):
+        keep = stack_delta(prev, cur)
+        put_varint(record, keep)
+        put_varint(record, len(cur) - keep)
+        for item in cur[keep:]:
+            put_varint(record, self._value(item))
+
+    def _end_segment(self):
+        if self._first_tick is not None:
+            self._file.write(self._segment)
+            self._index.append([self._first_tick, self._offset, len(self._segment), zlib.crc32(self._segment)])
+            self._offset += len(self._segment)
+            self._segment = bytearray()
+
+    def tick(self, control_unit):
+        dp = control_unit._dp
+        mem = control_unit._mem
+        state = [control_unit._ticks, control_unit._mPC, dp._PC, dp._TOS, dp._ALU, mem._AR, mem._data, dp._IR]
+        ds, rs = dp._DS.stack, dp._RS.stack
+        record = bytearray()
+        if self._ticks_left == 0:
+            self._end_segment()
+            self._first_tick = state[0]
+            self._ticks_left = self._interval
+            record.append(KEYFRAME)
+            for name, value in zip(FIELDS, state, strict=True):
+                put_varint(record, self._value(value) if name in VALUE_FIELDS else zigzag(value))
+            self._put_stack(record, [], ds)
+            self._put_stack(record, [], rs)
+        else:
+            self._put_delta(record, state, ds, rs)
+        self._ticks_left -= 1
+        self._segment += record
+        self._prev = state
+        self._ds = list(ds)
+        self._rs = list(rs)
+
+    def _put_delta(self, record: bytearray, state: list, ds: list, rs: list):
+        prev = self._prev
+        mask = 0
+        fields = bytearray()
+        for bit, (name, value, prev_value) in enumerate(zip(FIELDS, state, prev, strict=True)):
+            # Objects are compared by identity just as they are referenced
+            if value is prev_value or (type(value) is int and type(prev_value) is int and value == prev_value):
+                continue
+            mask |= 1 << bit
+            if name == "ticks":
+                put_varint(fields, zigzag(value - prev_value))
+            elif name in VALUE_FIELDS:
+                put_varint(fields, self._value(value))
+            else:
+                put_varint(fields, zigzag(value))
+        if ds != self._ds:
+            mask |= DS_BIT
+            self._put_stack(fields, self._ds, ds)
+        if rs != self._rs:
+            mask |= RS_BIT
+            self._put_stack(fields, self._rs, rs)
+        record.append(TICK)
+        put_varint(record, mask)
+        record += fields
+
+    def _event(self, name: str, *args):
+        self._segment.append(EVENT_KINDS[name])
+        for kind, arg in zip(EVENTS[name], args, strict=True):
+            put_varint(self._segment, OPS.index(arg) if kind == "o" else zigzag(int(arg)))
+
+    def prefetch_wait(self, ticks: int):
+        self._event("prefetch_wait", ticks)
+
+    def io_access(self, op: str, ticks: int):
+        self._event("io_access", op, ticks)
+
+    def cache_access(self, op: str, adr: int, hit: bool, ticks: int):
+        self._event("cache_access", op, adr, hit, ticks)
+
+    def memory_transfer(self, op: str, ticks: int):
+        self._event("memory_transfer", op, ticks)
+
+    def cache_fill_write(self, ticks: int):
+        self._event("cache_fill_write", ticks)
+
+    def cache_insert(self, adr: int):
+        self._event("cache_insert", adr)
+
+    def line_evicted(self, adr: int):
+        self._event("line_evicted", adr)
+
+    def prefetch_start(self, adr: int):
+        self._event("prefetch_start", adr)
+
+    def cache_lookup(self, adr: int, hit: bool):
+        self._event("cache_lookup", adr, hit)
+
+    def prefetch_planned(self, tick: int):
+        self._event("prefetch_planned", tick)
+
+    def wait_total(self, ticks: int):
+        self._event("wait_total", ticks)
+
+    def finish(self, control_unit, output: str):
+        # Final dumps are written once, so they are kept as journal text
+        messages = []
+        JournalTracer(lambda msg, *args: messages.append(msg % args if args else msg)).finish(control_unit, output)
+        text = json.dumps(messages).encode("utf-8")
+        self._segment.append(FINISH)
+        put_varint(self._segment, len(text))
+        self._segment += text
+
+    def close(self):
+        self._end_segment()
+        footer = json.dumps({"segments": self._index, "objects": self._objects}).encode("utf-8")
+        self._file.write(footer)
+        self._file.write(struct.pack("<Q", self._offset))
+        self._file.flush()
+
+
+class TraceReader:
+    """Reads a binary trace: segment by segment, so any tick range is rendered without decoding the rest"""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            # Only the read segments are paged in
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        assert self._data[: len(MAGIC)] == MAGIC, f"Not a binary trace: {path}"
+        (footer_offset,) = struct.unpack("<Q", self._data[-8:])
+        footer = json.loads(self._data[footer_offset:-8])
+        self.segments = footer["segments"]
+        self._objects = decode_objects(footer["objects"])
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self) -> TraceReader:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def segment_bytes(self, i: int) -> bytes:
+        _, offset, length, _ = self.segments[i]
+        return self._data[offset : offset + length]
+
+    def _value(self, value: int):
+        return self._objects[value >> 1] if value & 1 else unzigzag(value >> 1)
+
+    def _get_stack(self, data: bytes, pos: int, prev: list) -> tuple[list, int]:
+        keep, pos = get_varint(data, pos)
+        count, pos = get_varint(data, pos)
+        stack = prev[:keep]
+        for _ in range(count):
+            value, pos = get_varint(data, pos)
+            stack.append(self._value(value))
+        return (stack, pos)
+
+    def _get_state(self, data: bytes, pos: int, kind: int, state: dict) -> int:
+        mask = -1
+        if kind == TICK:
+            mask, pos = get_varint(data, pos)
+        else:
+            state["ds"] = state["rs"] = []
+        for bit, name in enumerate(FIELDS):
+            if mask & 1 << bit:
+                value, pos = get_varint(data, pos)
+                if name in VALUE_FIELDS:
+                    state[name] = self._value(value)
+                elif name == "ticks" and kind == TICK:
+                    state[name] += unzigzag(value)
+                else:
+                    state[name] = unzigzag(value)
+        if mask & DS_BIT:
+            state["ds"], pos = self._get_stack(data, pos, state["ds"])
+        if mask & RS_BIT:
+            state["rs"], pos = self._get_stack(data, pos, state["rs"])
+        return pos
+
+    def records(self, i: int):
+        """
+        Decoded records of a segment: ("tick", state dict), (event name, args) and ("finish", messages).
+        State dict is updated in place
+        """
+        data = self.segment_bytes(i)
+        state = {}
+        pos = 0
+        while pos < len(data):
+            kind = data[pos]
+            pos += 1
+            if kind in (KEYFRAME, TICK):
+                pos = self._get_state(data, pos, kind, state)
+                yield ("tick", state)
+            elif kind in (DEFINE, FINISH):
+                length, pos = get_varint(data, pos)
+                if kind == FINISH:
+                    yield ("finish", json.loads(data[pos : pos + length]))
+                pos += length
+            else:
+                name = EVENT_NAMES[kind]
+                args = []
+                for arg_kind in EVENTS[name]:
+                    value, pos = get_varint(data, pos)
+                    args.append(OPS[value] if arg_kind == "o" else unzigzag(value))
+                yield (
+                    name,
+                    [bool(arg) if arg_kind == "b" else arg for arg_kind, arg in zip(EVENTS[name], args, strict=True)],
+                )
+
+    def tick_entries(self, i: int):
+        """(tick, journal messages of the tick & events after it) of a segment"""
+        messages = []
+        journal = JournalTracer(lambda msg, *args: messages.append(msg % args if args else msg))
+        tick = None
+        for name, args in self.records(i):
+            if name == "tick":
+                if tick is not None:
+                    yield (tick, messages[:])
+                    messages.clear()
+                tick = args["ticks"]
+                dp_text = datapath_repr(args["tos"], args["alu"], args["ds"], args["rs"], args["pc"], args["ir"])
+                journal.tick(control_repr(tick, args["mpc"], dp_text, memory_repr(args["ar"], args["data"])))
+            elif name == "finish":
+                messages.extend(args)
+            else:
+                getattr(journal, name)(*args)
+        if tick is not None:
+            yield (tick, messages[:])
+
+    def render(self, start: int = 0, end: int | None = None, prefix: str = "[JRNL] ") -> str:
+        """Journal text of ticks from start up to (not including) end, as machine.py -j would log it"""
+        first = 0
+        for i, segment in enumerate(self.segments):
+            if segment[0] <= start:
+                first = i
+        lines = []
+        for i in range(first, len(self.segments)):
+            if end is not None and self.segments[i][0] >= end:
+                break
+            for tick, messages in self.tick_entries(i):
+                if tick >= start and (end is None or tick < end):
+                    lines += [f"{prefix}{message}\n" for message in messages]
+        return "".join(lines)
+
+
+def first_divergence(a: TraceReader, b: TraceReader) -> tuple[int, list, list] | None:
+    """
+    First tick with different journal entries in two traces: (tick, messages of a, messages of b),
+    None if traces are the same. Only the first segment with different bytes is decoded
+    """
+    for i in range(min(len(a.segments), len(b.segments))):
+        if a.segments[i][2:] != b.segments[i][2:] or a.segment_bytes(i) != b.segment_bytes(i):
+            break
+    else:
+        if len(a.segments) == len(b.segments):
+            return None
+        i = min(len(a.segments), len(b.segments))
+        longer = a if len(a.segments) > len(b.segments) else b
+        tick, messages = next(longer.tick_entries(i))
+        return (tick, messages, []) if longer is a else (tick, [], messages)
+
+    entries_b = b.tick_entries(i) if i < len(b.segments) else iter(())
+    for entry_a in a.tick_entries(i) if i < len(a.segments) else iter(()):
+        entry_b = next(entries_b, None)
+        if entry_a != entry_b:
+            return (entry_a[0], entry_a[1], entry_b[1] if entry_b is not None else [])
+    entry_b = next(entries_b, None)
+    return None if entry_b is None else (entry_b[0], [], entry_b[1])
+
+
+def main(args):
+    if args.command == "render":
+        with TraceReader(args.trace) as trace:
+            sys.stdout.write(trace.render(args.start, args.end))
+        return
+    with TraceReader(args.trace) as trace, TraceReader(args.other) as other:
+        divergence = first_divergence(trace, other)
+    if divergence is None:
+        print("Traces are the same")
+        return
+    tick, messages_a, messages_b = divergence
+    print(f"First divergence on tick {tick}")
+    print(f"--- {args.trace}")
+    print("\n".join(messages_a) or "(trace ended)")
+    print(f"+++ {args.other}")
+    print("\n".join(messages_b) or "(trace ended)")
+
+
+parser = argparse.ArgumentParser(description="Binary trace (machine.py --trace) reader")
+subparsers = parser.add_subparsers(dest="command", required=True)
+render_parser = subparsers.add_parser("render", help="render ticks of a trace as journal text")
+render_parser.add_argument("trace", metavar="TRACE", help="a binary trace file")
+render_parser.add_argument(
+    "--from", dest="start", type=int, metavar="TICK", default=0, help="first tick to render. Default: 0"
+)
+render_parser.add_argument(
+    "--to", dest="end", type=int, metavar="TICK", default=None, help="tick to stop rendering on. Default: trace end"
+)
+diff_parser = subparsers.add_parser("diff", help="find the first tick two traces differ on")
+diff_parser.add_argument("trace", metavar="TRACE", help="a binary trace file")
+diff_parser.add_argument("other", metavar="OTHER", help="another binary trace file")
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
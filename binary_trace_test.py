@@ -0,0 +1,74 @@
+import contextlib
+import io
+
+import binary_trace
+import forthc
+import machine
+import pytest
+from binary_trace import BinaryTracer, TraceReader, first_divergence
+from isa import write_code
+from tracer import JournalTracer
+
+
+def translate(program: str):
+    with open(f"programs/{program}", encoding="utf-8") as file:
+        return forthc.translate(file.read(), 0, 10)
+
+
+def journal_text(code, buffer: str) -> str:
+    messages = []
+    tracer = JournalTracer(lambda msg, *args: messages.append(msg % args if args else msg))
+    machine.build_control_unit(code, buffer, tracer=tracer).simulate(100000)
+    return "".join(f"[JRNL] {message}\n" for message in messages)
+
+
+def write_trace(path, code, buffer: str) -> TraceReader:
+    with open(path, "wb") as file:
+        tracer = BinaryTracer(file, keyframe_interval=100)
+        machine.build_control_unit(code, buffer, tracer=tracer).simulate(100000)
+        tracer.close()
+    return TraceReader(path)
+
+
+def test_rendered_trace_is_journal(tmp_path):
+    code = translate("hello_user_name.f")
+    journal = journal_text(code, "Bob\r")
+    with write_trace(tmp_path / "trace", code, "Bob\r") as trace:
+        assert len(trace.segments) > 10
+        assert trace.render() == journal
+        # Ticks with memory access are followed by the ones after waiting
+        part = trace.render(1234, 1500)
+    assert trace._data.closed
+    ticks = [int(line.split()[2]) for line in part.splitlines() if line.startswith("[JRNL]   TCK:")]
+    assert ticks[0] >= 1234
+    assert ticks[-1] < 1500
+    assert part in journal
+
+
+def test_first_divergence(tmp_path):
+    code = translate("hello_user_name.f")
+    with (
+        write_trace(tmp_path / "bob", code, "Bob\r") as bob,
+        write_trace(tmp_path / "bot", code, "Bot\r") as bot,
+        write_trace(tmp_path / "same", code, "Bob\r") as same,
+    ):
+        assert first_divergence(bob, same) is None
+
+        tick, bob_messages, bot_messages = first_divergence(bob, bot)
+        assert bob.render(0, tick) == bot.render(0, tick)
+        assert "".join(f"[JRNL] {message}\n" for message in bob_messages) == bob.render(tick, tick + 1)
+        assert bob_messages != bot_messages
+
+
+@pytest.mark.parametrize("engine", ["micro", "fast"])
+def test_machine_trace(engine, tmp_path):
+    source = translate("cat.f")
+    write_code(str(tmp_path / "cat.o"), source)
+    machine.main(
+        machine.parser.parse_args(
+            ["--engine", engine, "--trace", str(tmp_path / "trace"), "-i", "Lorem", str(tmp_path / "cat.o")]
+        )
+    )
+    with contextlib.redirect_stdout(io.StringIO()) as stdout:
+        binary_trace.main(binary_trace.parser.parse_args(["render", str(tmp_path / "trace")]))
+    assert stdout.getvalue() == journal_text(source, "Lorem")
@@ -0,0 +1,134 @@
+from fast_unit import FETCH_TICKS, MAX_INSTRUCTION_TICKS, FastControlUnit, op_store, opcode_to_handler
+from isa import Opcode
+
+# Basic block translation: a run of instructions starting at some PC and ending
+# with the first control transfer is translated into a single python function.
+# Every instruction is still fetched through MemoryUnit (so tick and cache
+# accounting is the same as in FastControlUnit), but decoding and dispatch
+# are done once per block instead of once per executed instruction.
+
+BLOCK_END_OPCODES = {Opcode.JMP, Opcode.JMPZ, Opcode.LOOP, Opcode.CALL, Opcode.RET, Opcode.HALT}
+MAX_BLOCK_LEN = 64
+
+
+def translate_block(start: int, instructions: list, handlers: dict):
+    """
+    Translated block returns True when all of its instructions were executed.
+    If a fetched word is not the one the block was translated from (code was
+    rewritten), the block stops right after that fetch and returns False
+    """
+    namespace = {}
+    body = []
+    for i, instr in enumerate(instructions):
+        adr = start + i
+        namespace[f"ir_{i}"] = instr
+        namespace[f"op_{i}"] = handlers[instr["opcode"]]
+        body += [
+            f"mem._AR = {adr}",
+            "cu._ticks += 1",
+            "cu._ticks += mem.read(cu._ticks)",
+            f"if mem._data is not ir_{i}:",
+            "    return False",
+            f"dp._IR = ir_{i}",
+            f"dp._PC = {adr + 1}",
+            f"cu._ticks += {FETCH_TICKS - 1}",
+            f"op_{i}(cu, dp, ir_{i})",
+        ]
+    src = "\n".join(
+        [
+            f"def block_{start}(cu):",
+            "    dp = cu._dp",
+            "    mem = cu._mem",
+            *["    " + line for line in body],
+            "    return True",
+        ]
+    )
+    exec(compile(src, f"<block {start}>", "exec"), namespace)
+    return namespace[f"block_{start}"]
+
+
+def op_store_invalidating(cu, dp, ir):
+    adr = dp._TOS
+    op_store(cu, dp, ir)
+    if adr in cu._block_adrs:
+        cu._invalidate(adr)
+
+
+block_handlers = {**opcode_to_handler, Opcode.STORE: op_store_invalidating}
+
+
+class BlockControlUnit(FastControlUnit):
+    """
+    FastControlUnit with basic block translation cache. Blocks are translated
+    on first entry and dropped when a STORE hits any of their addresses
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # start adr -> (translated block, instruction count)
+        self._blocks = {}
+        # adr -> start adrs of blocks containing it
+        self._block_adrs = {}
+
+    def _decode(self, ir) -> object:
+        handler = super()._decode(ir)
+        if handler is opcode_to_handler[Opcode.STORE]:
+            handler = op_store_invalidating
+            self._decoded[id(ir)] = (ir, handler)
+        return handler
+
+    def _invalidate(self, adr: int):
+        for start in self._block_adrs.pop(adr, ()):
+            _, length = self._blocks.pop(start, (None, 0))
+            for block_adr in range(start, start + length):
+                if block_adr != adr:
+                    self._block_adrs[block_adr].discard(start)
+
+    def _translate(self, start: int):
+        instructions = []
+        adr = start
+        while adr < len(self._mem._mem) and adr != self._mem._IO_ADR and len(instructions) < MAX_BLOCK_LEN:
+            instr = self._mem.peek(adr)
+            if not isinstance(instr, dict) or instr.get("opcode") not in block_handlers:
+                break
+            instructions.append(instr)
+            if instr["opcode"] in BLOCK_END_OPCODES:
+                break
+            adr += 1
+        if len(instructions) == 0:
+            # Nothing to translate: fetching will fail, let the instruction engine report it
+            return None
+        block = (translate_block(start, instructions, block_handlers), len(instructions))
+        self._blocks[start] = block
+        for block_adr in range(start, start + len(instructions)):
+            self._block_adrs.setdefault(block_adr, set()).add(start)
+        return block
+
+    def _finish_instruction(self):
+        # Block stopped right after fetching some other word than it was translated from
+        dp = self._dp
+        ir = self._mem._data
+        dp._IR = ir
+        dp._PC += 1
+        self._ticks += FETCH_TICKS - 1
+        self._decode(ir)(self, dp, ir)
+
+    def _run(self, tick_limit: int):
+        dp = self._dp
+        blocks = self._blocks
+        safe_limit = tick_limit - MAX_INSTRUCTION_TICKS
+        self._run_to_boundary(tick_limit)
+        while self._mPC == 0 and self._ticks < safe_limit:
+            block = blocks.get(dp._PC)
+            if block is None:
+                block = self._translate(dp._PC)
+                if block is None:
+                    break
+            translated, length = block
+            if self._ticks + length * MAX_INSTRUCTION_TICKS >= tick_limit:
+                break
+            if not translated(self):
+                self._invalidate(dp._PC)
+                self._finish_instruction()
+        # The rest is done instruction by instruction
+        super()._run(tick_limit)
@@ -0,0 +1,142 @@
+from control_unit import (
+    ControlUnit,
+    CUSignal,
+    DPSignal,
+    MemSignal,
+    ResStatus,
+    micro_program,
+    mPCJump,
+    mPCLatch,
+    opcode_to_mprog,
+)
+from datapath import ALUOp, PCLatch, RSPush, TOSLatch
+from exceptions import DataAsInstructionError, HaltError, InstructionAsDataError, MicrocodeJumpFailError
+from memory_unit import ARLatch
+
+# Every micro instruction (a list of signals) is translated into python source
+# of a single function doing exactly what ControlUnit.apply_signal would do for
+# each of its signals in the same order. Functions are compiled once on import.
+
+ALU_CODE = [
+    "if -2147483648 <= res <= 2147483647:",
+    "    dp._V = False",
+    "else:",
+    # Extracting number that fits 32 bit int
+    "    dp._V = True",
+    "    res = ((res + 2147483648) & 4294967295) - 2147483648",
+    "dp._Z = res == 0",
+    "dp._N = res < 0",
+    "dp._ALU = res",
+]
+
+TOS_CHECK_CODE = [
+    "if not isinstance(dp._TOS, int):",
+    "    raise InstructionAsDataError('TOS', dp._TOS)",
+]
+
+IR_OPERAND = 'dp._IR["operand"] if "operand" in dp._IR else dp._IR["data"]'
+
+SIGNAL_CODE = {
+    DPSignal.DSPush: ["dp._DS.push(dp._ALU)"],
+    DPSignal.DSPop: ["dp._DS.pop()"],
+    DPSignal.DSPeek: ["dp._DS.peek()"],
+    DPSignal.RSPop: ["dp._RS.pop()"],
+    DPSignal.RSPeek: ["dp._RS.peek()"],
+    DPSignal.IRLatch: [
+        "dp._IR = mem._data",
+        "if not isinstance(dp._IR, dict):",
+        "    raise DataAsInstructionError('IR', dp._IR)",
+    ],
+    RSPush.ALU: ["dp._RS.push(dp._ALU)"],
+    RSPush.PC: ["dp._RS.push(dp._PC)"],
+    TOSLatch.DS: ["dp._TOS = dp._DS._data", *TOS_CHECK_CODE],
+    TOSLatch.MEM: ["dp._TOS = mem._data", *TOS_CHECK_CODE],
+    TOSLatch.IR: [f"dp._TOS = {IR_OPERAND}", *TOS_CHECK_CODE],
+    TOSLatch.ALU: ["dp._TOS = dp._ALU", *TOS_CHECK_CODE],
+    PCLatch.ALU: ["dp._PC = dp._ALU"],
+    PCLatch.IR: [f"dp._PC = {IR_OPERAND}"],
+    PCLatch.PLUS1: ["dp._PC += 1"],
+    MemSignal.MemWR: ["cu._ticks += mem.write(dp._ALU, cu._ticks)"],
+    MemSignal.MemRD: ["cu._ticks += mem.read(cu._ticks)"],
+    ARLatch.PC: ["mem._AR = dp._PC"],
+    ARLatch.ALU: ["mem._AR = dp._ALU"],
+    CUSignal.Halt: ["raise HaltError()"],
+    mPCLatch.IR: [
+        'if "opcode" not in dp._IR:',
+        "    raise MicrocodeJumpFailError()",
+        'cu._mPC = opcode_to_mprog[dp._IR["opcode"]]',
+    ],
+}
+
+STATUS_FLAG = {ResStatus.N: "dp._N", ResStatus.Z: "dp._Z", ResStatus.V: "dp._V"}
+
+
+def signal_code(signal, namespace: dict) -> list[str]:
+    if isinstance(signal, ALUOp):
+        op_name = f"alu_op_{len(namespace)}"
+        namespace[op_name] = signal.op
+        return [f"res = {op_name}(dp)", *ALU_CODE]
+    if isinstance(signal, mPCJump):
+        if signal.uncond:
+            return [f"cu._mPC = {signal.adr}"]
+        flag = STATUS_FLAG[signal.status]
+        return [f"if {flag if signal.status_val else 'not ' + flag}:", f"    cu._mPC = {signal.adr}"]
+    assert signal in SIGNAL_CODE, f"Unknown micro signal: {signal}"
+    return SIGNAL_CODE[signal]
+
+
+def compile_micro_instruction(mpc: int, micro_instruction: list):
+    namespace = {
+        "opcode_to_mprog": opcode_to_mprog,
+        "DataAsInstructionError": DataAsInstructionError,
+        "HaltError": HaltError,
+        "InstructionAsDataError": InstructionAsDataError,
+        "MicrocodeJumpFailError": MicrocodeJumpFailError,
+    }
+    body = [line for signal in micro_instruction for line in signal_code(signal, namespace)]
+    src = "\n".join([f"def m_{mpc}(cu):", "    dp = cu._dp", "    mem = cu._mem", *["    " + line for line in body]])
+    exec(compile(src, f"<micro {mpc}>", "exec"), namespace)
+    return namespace[f"m_{mpc}"]
+
+
+def compile_micro_program(program: list) -> list:
+    return [compile_micro_instruction(mpc, micro_instruction) for mpc, micro_instruction in enumerate(program)]
+
+
+compiled_program = compile_micro_program(micro_program)
+
+
+class CompiledControlUnit(ControlUnit):
+    """
+    Same machine as ControlUnit, but every micro instruction is executed
+    by a single precompiled function instead of matching signal by signal
+    """
+
+    def _run(self, tick_limit: int):
+        handlers = compiled_program
+        while self._ticks < tick_limit:
+            self._ticks += 1
+            mpc = self._mPC
+            # Will be rewritten on mjump
+            self._mPC = mpc + 1
+            handlers[mpc](self)
+
+    def _run_traced(self, tick_limit: int):
+        handlers = compiled_program
+        tracer = self._tracer
+        while self._ticks < tick_limit:
+            tracer.tick(self)
+            self._ticks += 1
+            mpc = self._mPC
+            # Will be rewritten on mjump
+            self._mPC = mpc + 1
+            handlers[mpc](self)
+
+    def _run_to_boundary(self, tick_limit: int):
+        # Finishing an instruction (e.g. of a restored or tick-limited machine) micro instruction by micro instruction
+        handlers = compiled_program
+        while self._mPC != 0 and self._ticks < tick_limit:
+            self._ticks += 1
+            mpc = self._mPC
+            self._mPC = mpc + 1
+            handlers[mpc](self)
@@ -7,6 +7,7 @@ from datapath import ALUOp, Datapath, PCLatch, RSPush, TOSLatch
 from exceptions import BufferEmptyError, HaltError, MicrocodeJumpFailError
 from isa import Opcode
 from memory_unit import ARLatch, MemoryUnit
+from tracer import NULL_TRACER, Tracer
 
 
 # signals that are not used in DP methods themselves
@@ -189,12 +190,47 @@ opcode_to_mprog = {
 }
 
 
+def micro_path(start: int, n: bool = False, z: bool = True, v: bool = False) -> list[int]:
+    """
+    Micro addresses executed from start until the jump back to instruction fetch
+    (or until halt / IR -> mPC latch), with conditional mjumps resolved by given NZV flags
+    """
+    flags = {ResStatus.N: n, ResStatus.Z: z, ResStatus.V: v}
+    path = []
+    mpc = start
+    while True:
+        path.append(mpc)
+        next_mpc = mpc + 1
+        for instr in micro_program[mpc]:
+            if isinstance(instr, mPCJump) and (instr.uncond or flags[instr.status] == instr.status_val):
+                next_mpc = instr.adr
+            elif instr in (mPCLatch.IR, CUSignal.Halt):
+                return path
+        if next_mpc == 0:
+            return path
+        mpc = next_mpc
+
+
+def control_repr(ticks: int, mpc: int, dp_text: str, mem_text: str) -> str:
+    # Journal text of the machine state on a tick (also rendered from binary traces)
+    m_prog = ", ".join(
+        [
+            f"{type(instr).__name__}.{instr.name}" if isinstance(instr, Enum) else f"{instr}"
+            for instr in micro_program[mpc]
+        ]
+    )
+    return f"{'TCK:': >6} {ticks:5} {dp_text}\n{mem_text}\n{'mPC:': >6} {mpc:5} {'mPROG:': >6} {m_prog}"
+
+
 class ControlUnit:
-    def __init__(self, datapath: Datapath, memory: MemoryUnit):
+    def __init__(self, datapath: Datapath, memory: MemoryUnit, tracer: Tracer = NULL_TRACER):
         self._mPC = 0
         self._dp = datapath
         self._mem = memory
         self._ticks = 0
+        self._tracer = tracer
+        # Why simulation stopped: "halt", "buffer_empty" or "tick_limit"
+        self._stop_reason = None
 
     def apply_signal(self, signal):
         match signal:
@@ -251,44 +287,74 @@ class ControlUnit:
                     if cond:
                         self._mPC = adr
 
-    def simulate(self, tick_limit: int):
+    def _run(self, tick_limit: int):
+        while self._ticks < tick_limit:
+            self._ticks += 1
+            micro_instructions = micro_program[self._mPC]
+            # Will be rewritten on mjump
+            self._mPC += 1
+
+            for instr in micro_instructions:
+                self.apply_signal(instr)
+
+    def _run_traced(self, tick_limit: int):
+        tracer = self._tracer
+        while self._ticks < tick_limit:
+            tracer.tick(self)
+            self._ticks += 1
+            micro_instructions = micro_program[self._mPC]
+            # Will be rewritten on mjump
+            self._mPC += 1
+
+            for instr in micro_instructions:
+                self.apply_signal(instr)
+
+    def advance(self, tick_limit: int):
+        """Runs until tick limit or machine stop (the reason is kept in _stop_reason)"""
         try:
-            while self._ticks < tick_limit:
-                # Separating journal entry into lines for readability
-                lines = str(self).split("\n")
-                for line in lines[:-1]:
-                    logging.debug("%s", line)
-                logging.debug("%s\n", lines[-1])
-                self._ticks += 1
-                micro_instructions = micro_program[self._mPC]
-                # Will be rewritten on mjump
-                self._mPC += 1
-
-                for instr in micro_instructions:
-                    self.apply_signal(instr)
+            # Separate loops, so that disabled tracing isn't even checked on a tick
+            if self._tracer.enabled:
+                self._run_traced(tick_limit)
+            else:
+                self._run(tick_limit)
         except HaltError:
-            logging.warning("Halt!")
+            self._stop_reason = "halt"
         except BufferEmptyError:
+            self._stop_reason = "buffer_empty"
+
+    def retry_read(self):
+        """
+        Rewinds the machine stopped on empty input buffer to the tick of the failed read,
+        so that the read is done again on the next advance (e.g. when more input has come)
+        """
+        assert self._stop_reason == "buffer_empty"
+        # Signals before the read in its micro instruction only latch ALU & AR, so they can be repeated
+        self._ticks -= 1
+        self._mPC -= 1
+        self._stop_reason = None
+
+    def step_instruction(self):
+        """Runs until the next instruction boundary or machine stop"""
+        self.advance(self._ticks + 1)
+        while self._mPC != 0 and self._stop_reason is None:
+            self.advance(self._ticks + 1)
+
+    def simulate(self, tick_limit: int):
+        self.advance(tick_limit)
+        if self._stop_reason == "halt":
+            logging.warning("Halt!")
+        elif self._stop_reason == "buffer_empty":
             logging.warning("Input buffer was empty on fetch!")
         if self._ticks >= tick_limit:
             logging.warning("Tick limit exceeded")
+            self._stop_reason = self._stop_reason or "tick_limit"
         output = "".join(map(chr, self._mem._write_buffer))
         miss_rate = (self._mem._cache._requests - self._mem._cache._hits) / self._mem._cache._requests
         logging.info("Cache miss rate: %.3f%%", miss_rate * 100)
         logging.info("%s", f"Ticks: {self._ticks}")
-        logging.debug("Output Buffer: %s", output)
-        logging.debug("Output Buffer(ASCII codes): %s", ", ".join(map(str, self._mem._write_buffer)))
-        logging.debug("Memory Dump: %s", self._mem._mem)
-        logging.debug("Cache Dump: \n%s", "\n".join([f"{j.line}" for i in self._mem._cache._sets for j in i.entries]))
+        if self._tracer.enabled:
+            self._tracer.finish(self, output)
         return (output, self._ticks, miss_rate)
 
     def __repr__(self) -> str:
-        m_prog = ", ".join(
-            [
-                f"{type(instr).__name__}.{instr.name}" if isinstance(instr, Enum) else f"{instr}"
-                for instr in micro_program[self._mPC]
-            ]
-        )
-        return (
-            f"{'TCK:': >6} {self._ticks:5} {self._dp}\n{self._mem}\n{'mPC:': >6} {self._mPC:5} {'mPROG:': >6} {m_prog}"
-        )
+        return control_repr(self._ticks, self._mPC, str(self._dp), str(self._mem))
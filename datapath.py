@@ -62,6 +62,20 @@ class PCLatch(Enum):
     PLUS1 = 2
 
 
+def datapath_repr(tos, alu, ds: list, rs: list, pc: int, ir) -> str:
+    # Journal text of datapath state (also rendered from binary traces)
+    data_state = f"{'TOS:': >6} {tos:5} {'ALU:': >6} {alu:5}"
+    ds_stack = f"DS (LEN: {len(ds)}): {ds[:-(min(4, len(ds))+1):-1]}..."
+    rs_stack = f"RS (LEN: {len(rs)}): {rs[:-(min(4, len(rs))+1):-1]}..."
+    if "opcode" in ir:
+        instr_token = f"'{ir['token']['val']}'@{ir['token']['line']}:{ir['token']['num']}" if "token" in ir else ""
+        instr_operand = f" {ir['operand']:3}" if "operand" in ir else ""
+        instr_state = f"{'PC:': >6} {pc:5} {'IR:': >6} {ir['opcode'].name}{instr_operand}\t{instr_token}"
+    else:
+        instr_state = f"{'PC:': >6} {pc:5} {'IR:': >6} {ir}"
+    return f"{data_state}\n{ds_stack}\n{rs_stack}\n{instr_state}"
+
+
 class Datapath:
     def __init__(self, start_adr: int, memory: MemoryUnit):
         self._DS: Stack = Stack(128)
@@ -79,22 +93,7 @@ class Datapath:
         self._Mem = memory
 
     def __repr__(self) -> str:
-        data_state = f"{'TOS:': >6} {self._TOS:5} {'ALU:': >6} {self._ALU:5}"
-        ds_stack = f"DS (LEN: {len(self._DS.stack)}): {self._DS.stack[:-(min(4, len(self._DS.stack))+1):-1]}..."
-        rs_stack = f"RS (LEN: {len(self._RS.stack)}): {self._RS.stack[:-(min(4, len(self._RS.stack))+1):-1]}..."
-        if "opcode" in self._IR:
-            instr_token = (
-                f"'{self._IR['token']['val']}'@{self._IR['token']['line']}:{self._IR['token']['num']}"
-                if "token" in self._IR
-                else ""
-            )
-            instr_operand = f" {self._IR['operand']:3}" if "operand" in self._IR else ""
-            instr_state = (
-                f"{'PC:': >6} {self._PC:5} {'IR:': >6} {self._IR['opcode'].name}{instr_operand}\t{instr_token}"
-            )
-        else:
-            instr_state = f"{'PC:': >6} {self._PC:5} {'IR:': >6} {self._IR}"
-        return f"{data_state}\n{ds_stack}\n{rs_stack}\n{instr_state}"
+        return datapath_repr(self._TOS, self._ALU, self._DS.stack, self._RS.stack, self._PC, self._IR)
 
     def ds_push(self):
         self._DS.push(self._ALU)
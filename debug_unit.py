@@ -0,0 +1,141 @@
+import math
+
+from compiled_unit import CompiledControlUnit
+from exceptions import BreakpointHitError
+from fast_unit import FETCH_TICKS, MAX_INSTRUCTION_TICKS, FastControlUnit, op_store
+from isa import Opcode
+
+# Debugging engine: FastControlUnit with breakpoint & watchpoint checks put
+# right into its dispatch loop. A PC breakpoint is a set lookup per instruction,
+# a memory watchpoint is checked by the store handler only and stack depth is
+# compared after every instruction, so nothing else is paid while running
+# between hits. Machine stops on instruction boundary with "breakpoint" stop
+# reason, the hit is kept in DebugControlUnit.hit.
+
+
+def store_hit(adr: int, value) -> BreakpointHitError:
+    return BreakpointHitError("watchpoint", f"[{adr}] <- {value}")
+
+
+def op_watched_store(cu, dp, ir):
+    adr = dp._TOS
+    value = dp._DS.stack[-1] if len(dp._DS.stack) > 0 else None
+    op_store(cu, dp, ir)
+    if adr in cu.watched:
+        raise store_hit(adr, value)
+
+
+class DebugControlUnit(FastControlUnit):
+    """
+    Stops before executing an instruction at a breakpoint PC, after a store to a watched
+    address and after an instruction making data (return) stack deeper than max_ds_depth
+    (max_rs_depth). A depth watchpoint is then moved to the depth reached, so it is hit on
+    every new maximum
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.breakpoints = set()
+        self.watched = set()
+        self.max_ds_depth = None
+        self.max_rs_depth = None
+        # (kind, detail) of the last hit
+        self.hit = None
+        # Breakpoint the machine is stopped at, it is passed on resume
+        self._resume_pc = None
+
+    def _decode(self, ir) -> object:
+        handler = super()._decode(ir)
+        if handler is op_store:
+            handler = op_watched_store
+            self._decoded[id(ir)] = (ir, handler)
+        return handler
+
+    def _check_depth(self):
+        ds_depth = len(self._dp._DS.stack)
+        rs_depth = len(self._dp._RS.stack)
+        if self.max_ds_depth is not None and ds_depth > self.max_ds_depth:
+            self.max_ds_depth = ds_depth
+            raise BreakpointHitError("watchpoint", f"data stack depth {ds_depth}")
+        if self.max_rs_depth is not None and rs_depth > self.max_rs_depth:
+            self.max_rs_depth = rs_depth
+            raise BreakpointHitError("watchpoint", f"return stack depth {rs_depth}")
+
+    def _check_stored(self):
+        """Watchpoint check of the instruction finished micro instruction by micro instruction"""
+        adr = self._mem._AR
+        if self._mPC == 0 and self._dp._IR["opcode"] is Opcode.STORE and adr in self.watched:
+            # Stored value is the current word on the address
+            raise store_hit(adr, self._mem.peek(adr))
+
+    def _run_micro_instruction(self, tick_limit: int):
+        # Close to the tick limit an instruction is run micro instruction by micro instruction
+        CompiledControlUnit._run(self, self._ticks + 1)
+        self._run_to_boundary(tick_limit)
+        self._check_stored()
+
+    def _run(self, tick_limit: int):
+        dp = self._dp
+        mem = self._mem
+        decoded = self._decoded
+        breakpoints = self.breakpoints
+        ds = dp._DS.stack
+        rs = dp._RS.stack
+        max_ds_depth = math.inf if self.max_ds_depth is None else self.max_ds_depth
+        max_rs_depth = math.inf if self.max_rs_depth is None else self.max_rs_depth
+        resume_pc = self._resume_pc
+        self._resume_pc = None
+        safe_limit = tick_limit - MAX_INSTRUCTION_TICKS
+        if self._mPC != 0:
+            # Instruction left unfinished on the previous tick limit
+            self._run_to_boundary(tick_limit)
+            self._check_stored()
+        while self._mPC == 0 and self._ticks < tick_limit:
+            pc = dp._PC
+            if pc in breakpoints:
+                if pc != resume_pc:
+                    raise BreakpointHitError("breakpoint", f"PC {pc}")
+                resume_pc = None
+            if self._ticks < safe_limit:
+                mem._AR = pc
+                self._ticks += 1
+                self._ticks += mem.read(self._ticks)
+                ir = mem._data
+                dp._IR = ir
+                dp._PC = pc + 1
+                self._ticks += FETCH_TICKS - 1
+
+                entry = decoded.get(id(ir))
+                handler = entry[1] if entry is not None and entry[0] is ir else self._decode(ir)
+                handler(self, dp, ir)
+            else:
+                self._run_micro_instruction(tick_limit)
+            if len(ds) > max_ds_depth or len(rs) > max_rs_depth:
+                self._check_depth()
+
+    def _stop(self, hit: BreakpointHitError):
+        self._stop_reason = "breakpoint"
+        self.hit = (hit.kind, hit.detail)
+        if hit.kind == "breakpoint":
+            self._resume_pc = self._dp._PC
+
+    def advance(self, tick_limit: int):
+        try:
+            super().advance(tick_limit)
+        except BreakpointHitError as hit:
+            self._stop(hit)
+
+    def step_instruction(self):
+        """Executes one instruction, a breakpoint at the current PC is not checked"""
+        self._resume_pc = None
+        try:
+            super().step_instruction()
+            if self._stop_reason is None:
+                self._check_depth()
+        except BreakpointHitError as hit:
+            self._stop(hit)
+
+    def resume(self):
+        """Lets the machine stopped on a hit run on"""
+        if self._stop_reason == "breakpoint":
+            self._stop_reason = None
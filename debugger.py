@@ -0,0 +1,216 @@
+import argparse
+import cmd
+import math
+
+import machine
+from isa import Opcode, read_code
+
+# Interactive debugger over the "debug" engine (debug_unit.py). Locations are
+# resolved with the token info forthc puts into instructions:
+#   break 12        - first instructions of source line 12
+#   break *25       - instruction at PC 25
+#   break factorial - start of Forth word factorial (wherever it is called)
+#   watch 66        - stores to address 66
+#   watch counter   - stores to variable counter
+#   depth 8 [rs]    - data (return) stack getting deeper than 8
+
+
+def word_starts(code: list, name: str) -> set[int]:
+    return {
+        instr["operand"]
+        for instr in code
+        if instr.get("opcode") is Opcode.CALL and instr.get("token", {}).get("val") == name
+    }
+
+
+def line_starts(code: list, line: int) -> set[int]:
+    """Addresses where a run of instructions of the source line starts"""
+    lines = {instr["offset"]: instr["token"]["line"] for instr in code if "opcode" in instr and "token" in instr}
+    return {adr for adr, adr_line in lines.items() if adr_line == line and lines.get(adr - 1) != line}
+
+
+def variable_address(code: list, name: str) -> int | None:
+    for instr in code:
+        if instr.get("opcode") is Opcode.PUSH and instr.get("token", {}).get("val") == name:
+            return instr["operand"]
+    return None
+
+
+def resolve_breakpoint(code: list, location: str) -> set[int]:
+    if location.startswith("*"):
+        return {int(location[1:])}
+    if location.isdigit():
+        return line_starts(code, int(location))
+    return word_starts(code, location)
+
+
+def resolve_watchpoint(code: list, location: str) -> int | None:
+    if location.lstrip("-").isdigit():
+        return int(location)
+    return variable_address(code, location)
+
+
+class Debugger(cmd.Cmd):
+    intro = "Stack machine debugger. Type help or ? to list commands"
+    prompt = "(debug) "
+
+    def __init__(self, code: list, debugged: machine.Machine, tick_limit: int, stdin=None, stdout=None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        # Commands piped in are read as is
+        self.use_rawinput = stdin is None
+        self._code = code
+        self._machine = debugged
+        self._control = debugged.control
+        self._tick_limit = tick_limit
+        # Breakpoint number -> (location, PCs)
+        self._breakpoints = {}
+
+    def _print(self, text: str):
+        self.stdout.write(text + "\n")
+
+    def _where(self):
+        control = self._control
+        ir = control._mem.peek(control._dp._PC)
+        token = f" '{ir['token']['val']}' line {ir['token']['line']}" if isinstance(ir, dict) and "token" in ir else ""
+        opcode = ir["opcode"].name if isinstance(ir, dict) and "opcode" in ir else ir
+        self._print(f"PC {control._dp._PC}: {opcode}{token} (tick {control._ticks})")
+
+    def _report_stop(self):
+        output = self._machine.take_output()
+        if output:
+            self._print(f"Output: {output!r}")
+        if self._machine.stop_reason == "breakpoint":
+            kind, detail = self._control.hit
+            self._print(f"{kind.capitalize()} hit: {detail}")
+        elif self._machine.stop_reason is not None:
+            self._print(f"Machine stopped: {self._machine.stop_reason}")
+        elif self._machine.ticks >= self._tick_limit:
+            self._print("Tick limit reached")
+        self._where()
+
+    def _update_breakpoints(self):
+        self._control.breakpoints.clear()
+        for _, pcs in self._breakpoints.values():
+            self._control.breakpoints.update(pcs)
+
+    def do_break(self, arg: str):
+        """break LINE | *PC | WORD: stop before an instruction"""
+        pcs = resolve_breakpoint(self._code, arg.strip())
+        if len(pcs) == 0:
+            self._print(f"No code for {arg.strip()!r}")
+            return
+        number = max(self._breakpoints, default=0) + 1
+        self._breakpoints[number] = (arg.strip(), pcs)
+        self._update_breakpoints()
+        self._print(f"Breakpoint {number} at PC {', '.join(map(str, sorted(pcs)))}")
+
+    def do_watch(self, arg: str):
+        """watch ADDRESS | VARIABLE: stop after a store to the address"""
+        adr = resolve_watchpoint(self._code, arg.strip())
+        if adr is None:
+            self._print(f"No variable {arg.strip()!r}")
+            return
+        self._control.watched.add(adr)
+        self._print(f"Watchpoint on [{adr}]")
+
+    def do_depth(self, arg: str):
+        """depth N [rs]: stop when data (return) stack gets deeper than N, then on every new maximum"""
+        depth, *stack = arg.split()
+        if stack == ["rs"]:
+            self._control.max_rs_depth = int(depth)
+        else:
+            self._control.max_ds_depth = int(depth)
+        self._print(f"Depth watchpoint on {'return' if stack == ['rs'] else 'data'} stack deeper than {depth}")
+
+    def do_delete(self, arg: str):
+        """delete [N]: delete breakpoint N or all breakpoints & watchpoints"""
+        if arg.strip():
+            self._breakpoints.pop(int(arg), None)
+        else:
+            self._breakpoints.clear()
+            self._control.watched.clear()
+            self._control.max_ds_depth = None
+            self._control.max_rs_depth = None
+        self._update_breakpoints()
+
+    def do_info(self, arg: str):
+        """info: list breakpoints & watchpoints"""
+        for number, (location, pcs) in sorted(self._breakpoints.items()):
+            self._print(f"{number}: break {location} (PC {', '.join(map(str, sorted(pcs)))})")
+        for adr in sorted(self._control.watched):
+            self._print(f"watch [{adr}]")
+        for name, depth in (("data", self._control.max_ds_depth), ("return", self._control.max_rs_depth)):
+            if depth is not None:
+                self._print(f"depth of {name} stack > {depth}")
+
+    def do_continue(self, arg: str):
+        """continue: run till a hit, machine stop or tick limit"""
+        self._control.resume()
+        self._machine.run(self._tick_limit)
+        self._report_stop()
+
+    def do_step(self, arg: str):
+        """step [N]: execute N instructions (1 by default)"""
+        self._control.resume()
+        for _ in range(int(arg) if arg.strip() else 1):
+            if self._machine.step() == 0 or self._machine.stop_reason is not None:
+                break
+        self._report_stop()
+
+    def do_regs(self, arg: str):
+        """regs: datapath state"""
+        self._print(str(self._control._dp))
+
+    def do_x(self, arg: str):
+        """x ADDRESS | VARIABLE [N]: N memory words (cached ones if present)"""
+        location, *count = arg.split()
+        adr = resolve_watchpoint(self._code, location)
+        if adr is None:
+            self._print(f"No variable {location!r}")
+            return
+        for word_adr in range(adr, adr + (int(count[0]) if count else 1)):
+            self._print(f"[{word_adr}] {self._control._mem.peek(word_adr)}")
+
+    def do_where(self, arg: str):
+        """where: current instruction"""
+        self._where()
+
+    def do_quit(self, arg: str) -> bool:
+        """quit: leave the debugger"""
+        return True
+
+    do_b = do_break
+    do_c = do_continue
+    do_s = do_step
+    do_q = do_quit
+    do_EOF = do_quit  # noqa: N815 - cmd calls it on end of input
+
+
+def main(args):
+    code = read_code(args.source)
+    control = machine.build_control_unit(
+        code, args.buffer, "debug", args.mem_size, args.cache_size, args.start_adr, args.io_adr
+    )
+    commands = open(args.commands, encoding="utf-8") if args.commands else None
+    try:
+        Debugger(code, machine.Machine(control), args.tick_limit, stdin=commands).cmdloop()
+    finally:
+        if commands is not None:
+            commands.close()
+
+
+parser = argparse.ArgumentParser(description="Stack machine debugger")
+parser.add_argument("source", metavar="SOURCE", help="a json file with translated code")
+parser.add_argument("-i", "--input", dest="buffer", default="", help="IO device input. Default: empty")
+parser.add_argument(
+    "-t", "--ticks", dest="tick_limit", type=float, default=math.inf, help="tick limit. Default: no limit"
+)
+parser.add_argument("-m", "--memory", dest="mem_size", type=int, default=machine.parser.get_default("mem_size"))
+parser.add_argument("-c", "--cache_size", dest="cache_size", type=int, default=machine.parser.get_default("cache_size"))
+parser.add_argument("-s", "--start-adr", dest="start_adr", type=int, default=machine.parser.get_default("start_adr"))
+parser.add_argument("-d", "--device-adr", dest="io_adr", type=int, default=machine.parser.get_default("io_adr"))
+parser.add_argument(
+    "-x", "--commands", dest="commands", metavar="FILE", help="read debugger commands from the file instead of stdin"
+)
+if __name__ == "__main__":
+    main(parser.parse_args())
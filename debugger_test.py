@@ -0,0 +1,81 @@
+import io
+
+import debugger
+import forthc
+import machine
+import pytest
+from fast_unit import MAX_INSTRUCTION_TICKS
+
+
+@pytest.fixture
+def emit_num() -> list:
+    with open("programs/emit_num.f", encoding="utf-8") as file:
+        return forthc.translate(file.read(), 0, 10)
+
+
+def test_locations(emit_num):
+    (word_start,) = debugger.resolve_breakpoint(emit_num, "emit_num")
+    assert emit_num[word_start - 10]["offset"] == word_start
+    assert debugger.resolve_breakpoint(emit_num, "*12") == {12}
+    (line_start,) = debugger.resolve_breakpoint(emit_num, "16")
+    assert emit_num[line_start - 10]["token"]["val"] == "counter"
+    assert debugger.resolve_watchpoint(emit_num, "counter") == emit_num[line_start - 10]["operand"]
+    assert debugger.resolve_breakpoint(emit_num, "missing") == set()
+
+
+def test_hits_keep_results(emit_num):
+    reference = machine.build_control_unit(emit_num, engine="fast").simulate(100000)
+    control = machine.build_control_unit(emit_num, engine="debug")
+    debugged = machine.Machine(control)
+    counter = debugger.resolve_watchpoint(emit_num, "counter")
+    (word_start,) = debugger.resolve_breakpoint(emit_num, "emit_num")
+    control.breakpoints.add(word_start)
+    control.watched.add(counter)
+    control.max_rs_depth = 1
+
+    hits = []
+    while debugged.run(100000) and debugged.stop_reason == "breakpoint":
+        hits.append((*control.hit, debugged.pc))
+        control.resume()
+    assert debugged.stop_reason == "halt"
+    assert (debugged.output, debugged.ticks, debugged.miss_rate) == reference
+
+    assert hits[0] == ("breakpoint", f"PC {word_start}", word_start)
+    assert hits[1] == ("watchpoint", f"[{counter}] <- 0", hits[1][2])
+    # Do loop stashes its bounds on the return stack
+    assert ("watchpoint", "return stack depth 2", hits[-1][2] - 1) in hits
+    assert ("watchpoint", "return stack depth 3", hits[-1][2]) == hits[-1]
+    # Counter is set to 0 and then incremented for all 7 digits
+    assert [detail for _, detail, _ in hits if detail.startswith("[")] == [
+        f"[{counter}] <- {value}" for value in range(8)
+    ]
+
+
+def test_commands(emit_num):
+    commands = io.StringIO("break emit_num\ncontinue\nstep 2\nx counter\ndelete\ncontinue\n")
+    out = io.StringIO()
+    control = machine.build_control_unit(emit_num, engine="debug")
+    debugger.Debugger(emit_num, machine.Machine(control), 100000, stdin=commands, stdout=out).cmdloop()
+    text = out.getvalue()
+    assert "Breakpoint hit" in text
+    assert "Output: '-1561445'" in text
+    assert "Machine stopped: halt" in text
+
+
+def test_watchpoint_near_tick_limit(emit_num):
+    counter = debugger.resolve_watchpoint(emit_num, "counter")
+
+    def first_store(tick_limit: int) -> tuple:
+        control = machine.build_control_unit(emit_num, engine="debug")
+        control.watched.add(counter)
+        debugged = machine.Machine(control)
+        debugged.run(tick_limit)
+        debugged.run(100000)
+        assert debugged.stop_reason == "breakpoint"
+        return (control.hit, debugged.ticks)
+
+    hit, ticks = first_store(100000)
+    assert hit == ("watchpoint", f"[{counter}] <- 0")
+    # Store is run micro instruction by micro instruction, maybe stopping on the tick limit on the way
+    for tick_limit in range(ticks - MAX_INSTRUCTION_TICKS, ticks + 1):
+        assert first_store(tick_limit) == (hit, ticks)
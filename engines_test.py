@@ -0,0 +1,120 @@
+import logging
+import os
+import pathlib
+
+import forthc
+import machine
+import pytest
+from exceptions import DataAsInstructionError
+from isa import Opcode
+from memory_words import MEMORY_BACKENDS
+
+# Inputs for programs that read from IO device
+PROGRAM_INPUTS = {
+    "bubble_sort.f": "banananmanandotherwordstocheckcacheefficient\r",
+    "cat.f": "Lorem Ipsum",
+    "guess_game.f": "5\r12\r",
+    "hello_user_name.f": "OneLoneCoder Fan\r",
+    "ping_pong.f": "ping",
+}
+PROGRAMS = sorted(path.name for path in pathlib.Path("programs").iterdir())
+
+
+def data_word(word):
+    return word["word"] if isinstance(word, dict) and "word" in word else word
+
+
+def simulate(code, engine: str, buffer: str, cache_size: int, tick_limit: int = 300000, memory_backend: str = "list"):
+    control = machine.build_control_unit(code, buffer, engine, cache_size=cache_size, memory_backend=memory_backend)
+    return control.simulate(tick_limit)
+
+
+@pytest.mark.parametrize("cache_size", [32, 128])
+@pytest.mark.parametrize("engine", [engine for engine in machine.ENGINES if engine != "micro"])
+@pytest.mark.parametrize("program", PROGRAMS)
+def test_engine_matches_microcode(program, engine, cache_size, caplog):
+    caplog.set_level(logging.INFO)
+    with open(os.path.join("programs", program), encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    buffer = PROGRAM_INPUTS.get(program, "")
+
+    expected = simulate(code, "micro", buffer, cache_size)
+    assert simulate(code, engine, buffer, cache_size) == expected
+
+
+@pytest.mark.parametrize("memory_backend", ["compact", "paged"])
+@pytest.mark.parametrize("engine", ["micro", "block"])
+@pytest.mark.parametrize("program", PROGRAMS)
+def test_memory_backend_matches_list(program, engine, memory_backend, caplog):
+    caplog.set_level(logging.INFO)
+    with open(os.path.join("programs", program), encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    buffer = PROGRAM_INPUTS.get(program, "")
+
+    expected = machine.build_control_unit(code, buffer, engine, cache_size=32)
+    control = machine.build_control_unit(code, buffer, engine, cache_size=32, memory_backend=memory_backend)
+    assert control.simulate(300000) == expected.simulate(300000)
+    # Compact memory keeps declared data words as their ints
+    assert list(map(data_word, control._mem._mem)) == list(map(data_word, expected._mem._mem))
+
+
+@pytest.mark.parametrize("tick_limit", [1, 2, 3, 50, 777, 1164])
+@pytest.mark.parametrize("engine", [engine for engine in machine.ENGINES if engine != "micro"])
+def test_engine_stops_on_same_tick(engine, tick_limit):
+    with open(os.path.join("programs", "emit_num.f"), encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+
+    expected = simulate(code, "micro", "", 32, tick_limit)
+    assert simulate(code, engine, "", 32, tick_limit) == expected
+
+
+REWRITTEN_CODE = {
+    # Block with CALL target gets executed, then rewritten and called again
+    "other_block": [
+        {"opcode": Opcode.CALL, "operand": 20, "offset": 10},
+        {"opcode": Opcode.PUSH, "operand": 0, "offset": 11},
+        {"opcode": Opcode.PUSH, "operand": 20, "offset": 12},
+        {"opcode": Opcode.STORE, "offset": 13},
+        {"opcode": Opcode.CALL, "operand": 20, "offset": 14},
+        {"opcode": Opcode.HALT, "offset": 15},
+        {"opcode": Opcode.RET, "offset": 20},
+    ],
+    # Block rewrites its own last instruction
+    "same_block": [
+        {"opcode": Opcode.PUSH, "operand": 0, "offset": 10},
+        {"opcode": Opcode.PUSH, "operand": 13, "offset": 11},
+        {"opcode": Opcode.STORE, "offset": 12},
+        {"opcode": Opcode.HALT, "offset": 13},
+    ],
+}
+
+
+@pytest.mark.parametrize("memory_backend", MEMORY_BACKENDS.keys())
+@pytest.mark.parametrize("engine", machine.ENGINES.keys())
+@pytest.mark.parametrize("code", REWRITTEN_CODE.keys())
+def test_rewritten_code_is_not_executed(engine, code, memory_backend):
+    control = machine.build_control_unit(REWRITTEN_CODE[code], engine=engine, memory_backend=memory_backend)
+    with pytest.raises(DataAsInstructionError):
+        control.simulate(1000)
+
+
+@pytest.mark.parametrize("memory_backend", MEMORY_BACKENDS.keys())
+@pytest.mark.parametrize("engine", machine.ENGINES.keys())
+def test_declared_data_is_not_executed(engine, memory_backend):
+    code = [{"opcode": Opcode.JMP, "operand": 20, "offset": 10}, {"word": 7, "offset": 20}]
+    control = machine.build_control_unit(code, engine=engine, memory_backend=memory_backend)
+    with pytest.raises(DataAsInstructionError, match=r"in IR: 7$"):
+        control.simulate(1000)
+
+
+def test_compact_memory_keeps_declared_data_as_ints():
+    code = forthc.translate('variable x 5 x ! ." hi"', 0, 10)
+    words = machine.build_control_unit(code, memory_backend="compact")._mem._mem
+    declared = [instr for instr in code if "word" in instr]
+    assert len(declared) > 0
+    assert all(type(words[instr["offset"]]) is int and words[instr["offset"]] == instr["word"] for instr in declared)
+    # Only instructions are in the side table
+    assert sorted(words._objects) == [instr["offset"] for instr in code if "opcode" in instr]
+    offsets = [instr["offset"] for instr in code]
+    line = words[min(offsets) : max(offsets) + 1]
+    assert [data_word(word) for word in line] == [data_word(instr) for instr in sorted(code, key=lambda i: i["offset"])]
@@ -45,3 +45,19 @@ class MicrocodeJumpFailError(Exception):
 
     def __init__(self):
         super().__init__("Failed to mjump by opcode")
+
+
+class ResultCacheMismatchError(Exception):
+    """Raised when a stored simulation result differs from the simulated one"""
+
+    def __init__(self, key: str):
+        super().__init__(f"Stored result differs from the simulated one: {key}")
+
+
+class BreakpointHitError(Exception):
+    """Raised when a debugger breakpoint or watchpoint is hit"""
+
+    def __init__(self, kind: str, detail: str):
+        self.kind = kind
+        self.detail = detail
+        super().__init__(f"{kind} hit: {detail}")
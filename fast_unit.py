@@ -0,0 +1,337 @@
+from compiled_unit import CompiledControlUnit
+from control_unit import micro_path, opcode_to_mprog
+from exceptions import (
+    BufferEmptyError,
+    DataAsInstructionError,
+    HaltError,
+    InstructionAsDataError,
+    MicrocodeJumpFailError,
+)
+from isa import Opcode
+from memory_unit import CACHE_EXTRA_TICKS, IO_EXTRA_TICKS, MEM_EXTRA_TICKS
+
+# ISA level engine: one opcode is executed per dispatch and the number of
+# ticks its micro routine would take is added at once. Memory is accessed
+# on the exact tick the micro routine would access it, so MemoryUnit & Cache
+# (including parallel prefetch timing) see the very same requests.
+#
+# Architectural state (stacks, TOS, PC, IR, memory and cache) is exact on every
+# instruction boundary, ALU & NZV latches are not kept since no micro routine
+# reads them before setting.
+
+FETCH_TICKS = len(micro_path(0))
+
+
+def routine_ticks(opcode: Opcode, n: bool = False, z: bool = True, v: bool = False) -> int:
+    return len(micro_path(opcode_to_mprog[opcode], n, z, v))
+
+
+def fit_word(value: int) -> int:
+    if -2147483648 <= value <= 2147483647:
+        return value
+    # Extracting number that fits 32 bit int
+    return ((value + 2147483648) & 4294967295) - 2147483648
+
+
+def ir_operand(ir: dict):
+    return ir["operand"] if "operand" in ir else ir["data"]
+
+
+def latch_tos(dp, value):
+    dp._TOS = value
+    if not isinstance(value, int):
+        raise InstructionAsDataError("TOS", value)
+
+
+# Longest possible memory access: waiting for prefetch (lookup, fetch & write back)
+# and then the same on its own miss, or the IO device delay
+MAX_ACCESS_TICKS = 2 * (CACHE_EXTRA_TICKS + 2 * MEM_EXTRA_TICKS) + IO_EXTRA_TICKS
+MAX_INSTRUCTION_TICKS = (
+    FETCH_TICKS
+    + max(
+        len(micro_path(adr, n, z, v))
+        for adr in opcode_to_mprog.values()
+        for n in (0, 1)
+        for z in (0, 1)
+        for v in (0, 1)
+    )
+    + 2 * MAX_ACCESS_TICKS
+)
+
+
+def op_push(cu, dp, ir):
+    dp._DS.push(dp._TOS)
+    latch_tos(dp, ir_operand(ir))
+    cu._ticks += PUSH_TICKS
+
+
+def op_pop(cu, dp, ir):
+    dp._DS.pop()
+    latch_tos(dp, dp._DS._data)
+    cu._ticks += POP_TICKS
+
+
+def op_dup(cu, dp, ir):
+    dp._DS.push(dp._TOS)
+    cu._ticks += DUP_TICKS
+
+
+def op_swap(cu, dp, ir):
+    dp._RS.push(dp._TOS)
+    dp._DS.pop()
+    latch_tos(dp, dp._DS._data)
+    dp._RS.pop()
+    dp._DS.push(dp._RS._data)
+    cu._ticks += SWAP_TICKS
+
+
+def op_fetch(cu, dp, ir):
+    mem = cu._mem
+    mem._AR = dp._TOS
+    # Memory is read on the first routine tick
+    cu._ticks += 1
+    cu._ticks += mem.read(cu._ticks)
+    latch_tos(dp, mem._data)
+    cu._ticks += FETCH_OP_TICKS - 1
+
+
+def op_store(cu, dp, ir):
+    mem = cu._mem
+    mem._AR = dp._TOS
+    dp._DS.pop()
+    # Memory is written on the second routine tick
+    cu._ticks += 2
+    cu._ticks += mem.write(dp._DS._data, cu._ticks)
+    dp._DS.pop()
+    latch_tos(dp, dp._DS._data)
+    cu._ticks += STORE_TICKS - 2
+
+
+def binary_op(operation, ticks: int):
+    def op(cu, dp, ir):
+        dp._DS.pop()
+        dp._TOS = fit_word(operation(dp._DS._data, dp._TOS))
+        cu._ticks += ticks
+
+    return op
+
+
+def op_equal(cu, dp, ir):
+    dp._DS.pop()
+    dp._TOS = 1 if fit_word(dp._DS._data - dp._TOS) == 0 else 0
+    cu._ticks += EQUAL_TICKS
+
+
+def less_than(a: int, b: int) -> bool:
+    # Just as microcode does it: N xor V of (a - b)
+    diff = a - b
+    overflow = not -2147483648 <= diff <= 2147483647
+    return (fit_word(diff) < 0) != overflow
+
+
+def op_less(cu, dp, ir):
+    dp._DS.pop()
+    dp._TOS = 1 if less_than(dp._DS._data, dp._TOS) else 0
+    cu._ticks += LESS_TICKS
+
+
+def op_greateq(cu, dp, ir):
+    dp._DS.pop()
+    dp._TOS = 0 if less_than(dp._DS._data, dp._TOS) else 1
+    cu._ticks += GREATEQ_TICKS
+
+
+def op_jmpz(cu, dp, ir):
+    is_zero = dp._TOS == 0
+    dp._DS.pop()
+    latch_tos(dp, dp._DS._data)
+    if is_zero:
+        dp._PC = ir_operand(ir)
+        cu._ticks += JMPZ_TAKEN_TICKS
+    else:
+        cu._ticks += JMPZ_TICKS
+
+
+def op_jmp(cu, dp, ir):
+    dp._PC = ir_operand(ir)
+    cu._ticks += JMP_TICKS
+
+
+def op_stash(cu, dp, ir):
+    dp._RS.push(dp._TOS)
+    dp._DS.pop()
+    latch_tos(dp, dp._DS._data)
+    cu._ticks += STASH_TICKS
+
+
+def op_unstash(cu, dp, ir):
+    dp._DS.push(dp._TOS)
+    dp._RS.pop()
+    dp._TOS = fit_word(dp._RS._data)
+    cu._ticks += UNSTASH_TICKS
+
+
+def op_cpstash(cu, dp, ir):
+    dp._DS.push(dp._TOS)
+    dp._RS.peek()
+    dp._TOS = fit_word(dp._RS._data)
+    cu._ticks += CPSTASH_TICKS
+
+
+def op_loop(cu, dp, ir):
+    dp._DS.push(dp._TOS)
+    dp._RS.pop()
+    counter = fit_word(dp._RS._data)
+    dp._RS.peek()
+    if fit_word(counter - dp._RS._data) == 0:
+        dp._RS.pop()
+        dp._DS.pop()
+        latch_tos(dp, dp._DS._data)
+    else:
+        dp._RS.push(fit_word(counter + 1))
+        dp._PC = ir_operand(ir)
+        dp._DS.pop()
+        latch_tos(dp, dp._DS._data)
+    cu._ticks += LOOP_TICKS
+
+
+def op_call(cu, dp, ir):
+    dp._RS.push(dp._PC)
+    dp._PC = ir_operand(ir)
+    cu._ticks += CALL_TICKS
+
+
+def op_ret(cu, dp, ir):
+    dp._RS.pop()
+    dp._PC = fit_word(dp._RS._data)
+    cu._ticks += RET_TICKS
+
+
+def op_halt(cu, dp, ir):
+    cu._ticks += HALT_TICKS
+    raise HaltError()
+
+
+PUSH_TICKS = routine_ticks(Opcode.PUSH)
+POP_TICKS = routine_ticks(Opcode.POP)
+DUP_TICKS = routine_ticks(Opcode.DUP)
+SWAP_TICKS = routine_ticks(Opcode.SWAP)
+FETCH_OP_TICKS = routine_ticks(Opcode.FETCH)
+STORE_TICKS = routine_ticks(Opcode.STORE)
+EQUAL_TICKS = routine_ticks(Opcode.EQUAL)
+LESS_TICKS = routine_ticks(Opcode.LESS)
+GREATEQ_TICKS = routine_ticks(Opcode.GREATEQ)
+JMPZ_TICKS = routine_ticks(Opcode.JMPZ, z=False)
+JMPZ_TAKEN_TICKS = routine_ticks(Opcode.JMPZ, z=True)
+JMP_TICKS = routine_ticks(Opcode.JMP)
+STASH_TICKS = routine_ticks(Opcode.STASH)
+UNSTASH_TICKS = routine_ticks(Opcode.UNSTASH)
+CPSTASH_TICKS = routine_ticks(Opcode.CPSTASH)
+LOOP_TICKS = routine_ticks(Opcode.LOOP)
+CALL_TICKS = routine_ticks(Opcode.CALL)
+RET_TICKS = routine_ticks(Opcode.RET)
+HALT_TICKS = routine_ticks(Opcode.HALT)
+
+opcode_to_handler = {
+    Opcode.PUSH: op_push,
+    Opcode.POP: op_pop,
+    Opcode.DUP: op_dup,
+    Opcode.SWAP: op_swap,
+    Opcode.FETCH: op_fetch,
+    Opcode.STORE: op_store,
+    Opcode.ADD: binary_op(lambda a, b: a + b, routine_ticks(Opcode.ADD)),
+    Opcode.SUB: binary_op(lambda a, b: a - b, routine_ticks(Opcode.SUB)),
+    Opcode.MUL: binary_op(lambda a, b: a * b, routine_ticks(Opcode.MUL)),
+    Opcode.DIV: binary_op(lambda a, b: a // b, routine_ticks(Opcode.DIV)),
+    Opcode.MOD: binary_op(lambda a, b: a % b, routine_ticks(Opcode.MOD)),
+    Opcode.OR: binary_op(lambda a, b: a | b, routine_ticks(Opcode.OR)),
+    Opcode.AND: binary_op(lambda a, b: a & b, routine_ticks(Opcode.AND)),
+    Opcode.EQUAL: op_equal,
+    Opcode.LESS: op_less,
+    Opcode.GREATEQ: op_greateq,
+    Opcode.JMPZ: op_jmpz,
+    Opcode.JMP: op_jmp,
+    Opcode.STASH: op_stash,
+    Opcode.UNSTASH: op_unstash,
+    Opcode.CPSTASH: op_cpstash,
+    Opcode.LOOP: op_loop,
+    Opcode.CALL: op_call,
+    Opcode.RET: op_ret,
+    Opcode.HALT: op_halt,
+}
+
+
+class FastControlUnit(CompiledControlUnit):
+    """
+    Executes a whole instruction per dispatch. Close to the tick limit
+    (and with tracing on) it falls back to compiled micro instructions,
+    so results are identical to ControlUnit ones
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # id(instruction) -> (instruction, handler). Enum hashing is too slow for every dispatch
+        self._decoded = {}
+
+    def _decode(self, ir) -> object:
+        if not isinstance(ir, dict):
+            raise DataAsInstructionError("IR", ir)
+        if "opcode" not in ir:
+            raise MicrocodeJumpFailError()
+        handler = opcode_to_handler[ir["opcode"]]
+        self._decoded[id(ir)] = (ir, handler)
+        return handler
+
+    def _execute_instruction(self):
+        # One iteration of _run loop (kept inline there for speed)
+        dp = self._dp
+        mem = self._mem
+        mem._AR = dp._PC
+        self._ticks += 1
+        self._ticks += mem.read(self._ticks)
+        ir = mem._data
+        dp._IR = ir
+        dp._PC += 1
+        self._ticks += FETCH_TICKS - 1
+
+        entry = self._decoded.get(id(ir))
+        handler = entry[1] if entry is not None and entry[0] is ir else self._decode(ir)
+        handler(self, dp, ir)
+
+    def step_instruction(self):
+        if self._mPC != 0 or self._tracer.enabled:
+            super().step_instruction()
+            return
+        try:
+            self._execute_instruction()
+        except HaltError:
+            self._stop_reason = "halt"
+        except BufferEmptyError:
+            self._stop_reason = "buffer_empty"
+
+    def retry_read(self):
+        if self._mPC == 0 and self._mem._AR != self._dp._PC:
+            # Stopped in the middle of FETCH routine, which is then finished micro instruction by micro instruction
+            self._mPC = opcode_to_mprog[Opcode.FETCH] + 1
+        super().retry_read()
+
+    def _run(self, tick_limit: int):
+        dp = self._dp
+        mem = self._mem
+        decoded = self._decoded
+        safe_limit = tick_limit - MAX_INSTRUCTION_TICKS
+        self._run_to_boundary(tick_limit)
+        # Instructions are only started on instruction boundary
+        while self._mPC == 0 and self._ticks < safe_limit:
+            mem._AR = dp._PC
+            self._ticks += 1
+            self._ticks += mem.read(self._ticks)
+            ir = mem._data
+            dp._IR = ir
+            dp._PC += 1
+            self._ticks += FETCH_TICKS - 1
+
+            entry = decoded.get(id(ir))
+            handler = entry[1] if entry is not None and entry[0] is ir else self._decode(ir)
+            handler(self, dp, ir)
+        super()._run(tick_limit)
@@ -1,7 +1,10 @@
 #!/usr/bin/python3
 import argparse
+import json
 import re
+from pathlib import Path
 
+import forthc_cost
 from forthc_exceptions import (
     BareBeginUntilError,
     BareConditionalError,
@@ -472,6 +475,14 @@ def main(args):
     lines_count = len(src.split("\n"))
     instructions_count = len(code)
     print(f"Translated successfully. Source LoC: {lines_count}  Machine Instructions: {instructions_count}")
+    if args.cost:
+        report = forthc_cost.CostAnalysis(code, args.io_adr).report()
+        # Next to the compiled json: program.o -> program.cost.json
+        report_file = Path(args.target).with_suffix(".cost.json")
+        with open(report_file, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(forthc_cost.format_report(report))
+        print(f"Cost report is written to {report_file}")
 
 
 parser = argparse.ArgumentParser(
@@ -500,6 +511,14 @@ parser.add_argument(
     default=0,
     help="an address mapped to the IO device",
 )
+parser.add_argument(
+    "--cost",
+    dest="cost",
+    action="store_true",
+    help="estimate best & worst tick costs of every word (by loop iterations & recursion depth, "
+    "with cache miss bounds too), flag unbounded begin-until loops and write the report next to TARGET "
+    "as .cost.json",
+)
 if __name__ == "__main__":
     args = parser.parse_args()
     main(args)
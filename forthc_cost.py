@@ -0,0 +1,281 @@
+from control_unit import micro_path, opcode_to_mprog
+from isa import Opcode
+from memory_unit import CACHE_EXTRA_TICKS, IO_EXTRA_TICKS, MEM_EXTRA_TICKS
+
+# Static tick cost of translated code. Every instruction costs the fetch micro
+# routine plus its own one (conditional micro jumps taken both ways), memory
+# accesses hit the cache (which adds no ticks) unless their address is the IO
+# device one pushed right before. Words (code from a CALL target up to its RET)
+# and the main code are walked as control flow graphs: forward jumps are
+# branches, backward JMPZ (until) & LOOP instructions close loops.
+#
+# Costs are polynomials of parameters, each loop is multiplied by its number of
+# iterations per entry (n1, n2, ... unless do-loop bounds are literals) and a
+# recursive word by its recursion depth (r1, ...). Best costs take the cheapest
+# branches, worst ones the most expensive, worst with misses adds the longest
+# wait of every memory access: a prefetch in flight and then its own miss.
+
+MISS_BOUND_TICKS = 2 * (CACHE_EXTRA_TICKS + 2 * MEM_EXTRA_TICKS)
+PREFETCH_WAIT_BOUND_TICKS = CACHE_EXTRA_TICKS + 2 * MEM_EXTRA_TICKS
+MAIN_WORD = "main"
+
+
+def opcode_ticks(opcode: Opcode, flags=None) -> list[int]:
+    """Ticks of the instruction (fetch included) for all NZV flags or the given ones"""
+    fetch = len(micro_path(0))
+    adr = opcode_to_mprog[opcode]
+    all_flags = [(n, z, v) for n in (False, True) for z in (False, True) for v in (False, True)]
+    return [fetch + len(micro_path(adr, *nzv)) for nzv in ([flags] if flags else all_flags)]
+
+
+# Polynomials are dicts: sorted tuple of parameter names (() for constant) -> ticks
+def poly(ticks: int = 0) -> dict:
+    return {(): ticks}
+
+
+def poly_add(a: dict, b: dict) -> dict:
+    result = dict(a)
+    for term, ticks in b.items():
+        result[term] = result.get(term, 0) + ticks
+    return result
+
+
+def poly_scale(a: dict, factor) -> dict:
+    """Multiplies by an int or a parameter name"""
+    if isinstance(factor, int):
+        return {term: ticks * factor for term, ticks in a.items()}
+    return {tuple(sorted((*term, factor))): ticks for term, ticks in a.items()}
+
+
+def poly_bound(a: dict, b: dict, pick) -> dict:
+    # Parameters are >= 1 and ticks >= 0, so the max (min) of every term bounds both
+    return {term: pick(a.get(term, 0), b.get(term, 0)) for term in a.keys() | b.keys()}
+
+
+def evaluate(a: dict, params: dict | None = None) -> int:
+    """Ticks with the given parameter values (1 for the missing ones)"""
+    params = params or {}
+    total = 0
+    for term, ticks in a.items():
+        for name in term:
+            ticks *= params.get(name, 1)
+        total += ticks
+    return total
+
+
+def poly_repr(a: dict) -> str:
+    terms = sorted((term for term, ticks in a.items() if ticks or term == ()), key=lambda term: (len(term), term))
+    return " + ".join("*".join([str(a[term]), *term]) if term else str(a[term]) for term in terms)
+
+
+def merge_bounds(a: list, b: list) -> list:
+    """Bounds of either of two paths: [best, worst, worst with misses]"""
+    return [poly_bound(a[0], b[0], min), poly_bound(a[1], b[1], max), poly_bound(a[2], b[2], max)]
+
+
+class CostAnalysis:
+    """Best, worst & worst with misses cost of every word, see report()"""
+
+    def __init__(self, code: list, io_adr: int = 0):
+        self._code = {instr["offset"]: instr for instr in code if "opcode" in instr}
+        self._io_adr = io_adr
+        self.words = {}
+        self.params = {}
+        # Word start -> name, main code is the one before the first HALT
+        self._names = {}
+        self._ends = {}
+        main_start = min(self._code)
+        pc = main_start
+        while self._code[pc]["opcode"] is not Opcode.HALT:
+            pc += 1
+        self._ends[main_start] = pc + 1
+        self._names[main_start] = MAIN_WORD
+        start = pc + 1
+        while start in self._code:
+            end = start
+            while self._code[end]["opcode"] is not Opcode.RET:
+                end += 1
+            self._ends[start] = end + 1
+            start = end + 1
+        for instr in self._code.values():
+            if instr["opcode"] is Opcode.CALL and "token" in instr:
+                self._names.setdefault(instr["operand"], instr["token"]["val"])
+        for start in self._ends:
+            self._names.setdefault(start, f"@{start}")
+        # Word starts being analysed, to tell recursion
+        self._active = []
+        for start in self._ends:
+            self._word(start)
+
+    def _new_param(self, prefix: str, **info) -> str:
+        name = f"{prefix}{sum(param.startswith(prefix) for param in self.params) + 1}"
+        self.params[name] = info
+        return name
+
+    def _line(self, pc: int):
+        instr = self._code[pc]
+        return instr["token"]["line"] if "token" in instr else None
+
+    def _access_ticks(self, pc: int) -> tuple[int, int]:
+        """Data access ticks with hits & bound with misses"""
+        instr = self._code[pc]
+        if instr["opcode"] not in (Opcode.FETCH, Opcode.STORE):
+            return 0, 0
+        previous = self._code.get(pc - 1)
+        if previous is not None and previous["opcode"] is Opcode.PUSH and previous["operand"] == self._io_adr:
+            return IO_EXTRA_TICKS - 1, IO_EXTRA_TICKS - 1 + PREFETCH_WAIT_BOUND_TICKS
+        return 0, MISS_BOUND_TICKS
+
+    def _bounds(self, pc: int, ticks: list[int]) -> list:
+        hit, miss = self._access_ticks(pc)
+        return [poly(min(ticks) + hit), poly(max(ticks) + hit), poly(max(ticks) + miss + MISS_BOUND_TICKS)]
+
+    def _loop_count(self, start: int, end: int):
+        """Iterations of a do-loop with literal bounds, None if they are computed"""
+        if self._code[end]["opcode"] is not Opcode.LOOP:
+            return None
+        bounds = [self._code.get(pc) for pc in (start - 5, start - 4)]
+        if any(instr is None or instr["opcode"] is not Opcode.PUSH or "token" not in instr for instr in bounds):
+            return None
+        if not all(instr["token"]["val"].lstrip("-").isdigit() for instr in bounds):
+            return None
+        # Counter is compared with the limit before increment
+        count = bounds[0]["operand"] - bounds[1]["operand"] + 1
+        return count if count > 0 else None
+
+    def _edges(self, pc: int) -> list:
+        """(target, [best, worst, worst with misses]) of the instruction on pc"""
+        instr = self._code[pc]
+        opcode = instr["opcode"]
+        if opcode is Opcode.JMPZ and instr["operand"] > pc:
+            # Jumps on zero TOS
+            return [
+                (pc + 1, self._bounds(pc, opcode_ticks(opcode, (False, False, False)))),
+                (instr["operand"], self._bounds(pc, opcode_ticks(opcode, (False, True, False)))),
+            ]
+        if opcode is Opcode.JMP:
+            return [(instr["operand"], self._bounds(pc, opcode_ticks(opcode)))]
+        bounds = self._bounds(pc, opcode_ticks(opcode))
+        if opcode is Opcode.CALL:
+            callee = self._word(instr["operand"])
+            if callee is not None:
+                bounds = [poly_add(bound, cost) for bound, cost in zip(bounds, callee["cost"])]
+        return [(pc + 1, bounds)]
+
+    def _inner_loops(self, start: int, end: int) -> dict:
+        """Start -> back edges of the loops from start to end (but the one of the whole range)"""
+        loops = {}
+        for pc in range(start, end):
+            instr = self._code[pc]
+            if instr["opcode"] in (Opcode.JMPZ, Opcode.LOOP) and instr["operand"] <= pc:
+                if not (instr["operand"] == start and pc + 1 == end):
+                    loops.setdefault(instr["operand"], []).append(pc)
+        return loops
+
+    def _region(self, start: int, end: int, word: dict) -> list:
+        """Bounds of the code from start to end (exclusive), loops inside it are collapsed"""
+        loops = self._inner_loops(start, end)
+        dist = {start: None}
+        for pc in range(start, end):
+            if pc not in dist:
+                continue
+            if pc in loops:
+                loop_end = max(loops[pc])
+                edges = [(loop_end + 1, self._loop(pc, loop_end, word))]
+            else:
+                edges = self._edges(pc)
+            for target, bounds in edges:
+                if dist[pc] is not None:
+                    bounds = [poly_add(a, b) for a, b in zip(dist[pc], bounds)]
+                if target >= end:
+                    target = end
+                dist[target] = bounds if dist.get(target) is None else merge_bounds(dist[target], bounds)
+        return dist.get(end) or [poly(), poly(), poly()]
+
+    def _loop(self, start: int, end: int, word: dict) -> list:
+        count = self._loop_count(start, end)
+        unbounded = self._code[end]["opcode"] is Opcode.JMPZ
+        if count is None:
+            factor = self._new_param(
+                "n",
+                word=word["name"],
+                kind="begin" if unbounded else "do",
+                address=start,
+                line=self._line(end),
+                unbounded=unbounded,
+            )
+            word["params"].append(factor)
+        else:
+            factor = count
+        word["unbounded"] |= unbounded
+        return [poly_scale(bound, factor) for bound in self._region(start, end + 1, word)]
+
+    def _word(self, start: int):
+        """Word analysis, None while it is being analysed (recursive call)"""
+        if start in self._active:
+            for active in self._active[self._active.index(start) :]:
+                self.words[self._names[active]]["recursive"] = True
+            return None
+        name = self._names[start]
+        if name in self.words:
+            return self.words[name]
+        word = {
+            "name": name,
+            "address": start,
+            "line": self._line(start),
+            "params": [],
+            "calls": sorted(
+                {
+                    self._names.get(self._code[pc]["operand"], "?")
+                    for pc in range(start, self._ends[start])
+                    if self._code[pc]["opcode"] is Opcode.CALL
+                }
+            ),
+            "recursive": False,
+            "unbounded": False,
+        }
+        self.words[name] = word
+        self._active.append(start)
+        cost = self._region(start, self._ends[start], word)
+        self._active.pop()
+        if word["recursive"]:
+            depth = self._new_param("r", word=name, kind="recursion", address=start, line=word["line"])
+            word["params"].append(depth)
+            cost = [cost[0], *(poly_scale(bound, depth) for bound in cost[1:])]
+            word["unbounded"] = True
+        for callee in word["calls"]:
+            word["unbounded"] |= self.words.get(callee, {}).get("unbounded", False)
+        word["cost"] = cost
+        return word
+
+    def report(self) -> dict:
+        words = {}
+        for name, word in self.words.items():
+            best, worst, misses = word["cost"]
+            words[name] = {
+                "address": word["address"],
+                "line": word["line"],
+                "best": evaluate(best),
+                "worst": poly_repr(worst),
+                "worst_with_misses": poly_repr(misses),
+                # Only if no parameters are there
+                "worst_ticks": evaluate(worst) if list(worst) == [()] else None,
+                "parameters": word["params"],
+                "calls": word["calls"],
+                "recursive": word["recursive"],
+                "unbounded": word["unbounded"],
+            }
+        return {"words": words, "parameters": self.params, "miss_bound_ticks": MISS_BOUND_TICKS}
+
+
+def format_report(report: dict) -> str:
+    rows = [f"{'word':<16} {'best':>8} {'worst':<32} flags"]
+    for name, word in report["words"].items():
+        flags = ", ".join(flag for flag in ("recursive", "unbounded") if word[flag])
+        rows.append(f"{name:<16} {word['best']:>8} {word['worst']:<32} {flags}")
+    for name, param in report["parameters"].items():
+        where = f"line {param['line']}" if param["line"] is not None else f"address {param['address']}"
+        kind = "recursion depth" if param["kind"] == "recursion" else f"{param['kind']}-loop iterations"
+        note = " (unbounded)" if param.get("unbounded") else ""
+        rows.append(f"{name}: {kind} in {param['word']} at {where}{note}")
+    return "\n".join(rows)
@@ -0,0 +1,66 @@
+import contextlib
+import io
+import json
+
+import forthc
+import machine
+import pytest
+from forthc_cost import CostAnalysis, evaluate
+from perf_counters import PerfCounters
+
+
+def run_without_misses(code: list, buffer: str = "") -> int:
+    """Ticks of the run but memory waits (IO ones are part of the cost)"""
+    counters = PerfCounters()
+    control = machine.build_control_unit(code, buffer, "micro", cache_size=1024, tracer=counters)
+    control.simulate(100000)
+    stats = counters.report()
+    return stats["ticks"] - stats["stall_ticks"]["total"] + stats["stall_ticks"]["io"]
+
+
+@pytest.mark.parametrize(
+    ("source", "params"),
+    [
+        ("1 2 + 3 * drop", {}),
+        (": w 5 1 do i drop loop ; w 7 emit", {}),
+        ('." hi"', {"n1": 2}),
+    ],
+)
+def test_cost_of_branchless_code_is_exact(source, params):
+    code = forthc.translate(source, 0, 10)
+    best, worst, misses = CostAnalysis(code).words["main"]["cost"]
+    ticks = run_without_misses(code)
+    assert evaluate(best, params) == evaluate(worst, params) == ticks
+    assert evaluate(misses, params) > ticks
+
+
+def test_branches_loops_and_recursion_are_bounded():
+    with open("programs/factorial.f", encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    analysis = CostAnalysis(code)
+    report = analysis.report()
+    factorial = report["words"]["factorial"]
+    assert factorial["recursive"]
+    assert factorial["unbounded"]
+    assert report["parameters"][factorial["parameters"][0]]["kind"] == "recursion"
+    assert [param["kind"] for param in report["parameters"].values() if param["word"] == "."] == ["begin", "do"]
+
+    # 10! = 3628800: 10 activations, 7 digits
+    params = {"r1": 10, "n1": 7, "n2": 7}
+    ticks = run_without_misses(code)
+    best, worst, _ = analysis.words["main"]["cost"]
+    assert evaluate(best) <= ticks <= evaluate(worst, params)
+
+    code = forthc.translate(": w 0 begin 1 + dup 3 = until drop ; w", 0, 10)
+    best, worst, _ = CostAnalysis(code).words["main"]["cost"]
+    assert evaluate(best, {"n1": 3}) <= run_without_misses(code) <= evaluate(worst, {"n1": 3})
+
+
+def test_report_is_written_next_to_target(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        forthc.main(forthc.parser.parse_args(["programs/bubble_sort.f", str(tmp_path / "bubble_sort.o"), "--cost"]))
+    report = json.loads((tmp_path / "bubble_sort.cost.json").read_text(encoding="utf-8"))
+    assert report["words"]["print_data"]["unbounded"] is False
+    assert report["words"]["get_data"]["unbounded"] is True
+    assert {param["kind"] for param in report["parameters"].values()} == {"begin", "do"}
+    assert "begin-loop iterations in get_data at line 9 (unbounded)" in out.getvalue()
@@ -0,0 +1,204 @@
+import json
+import logging
+import marshal
+from enum import Enum
+from time import perf_counter_ns
+
+# Host profiling: wall time of the simulator itself. Timers are put around the
+# run loop ("dispatch"), every micro signal kind applied by ControlUnit and the
+# MemoryUnit, Cache, replacement policy & tracer methods of one machine by
+# replacing them with timed wrappers on the instances, so nothing is paid when
+# profiling is off. Every timer keeps its own ("self") time apart from the time
+# of timers nested in it, e.g. Cache.read self time doesn't include Cache.__find.
+
+MEMORY_METHODS = [
+    "read",
+    "write",
+    "_fetch_and_insert",
+    "_MemoryUnit__parallel_prefetch",
+    "_MemoryUnit__io_read",
+    "_MemoryUnit__io_write",
+    "_MemoryUnit__read_miss",
+    "_MemoryUnit__write_miss",
+]
+CACHE_METHODS = [
+    "read",
+    "write",
+    "lookup",
+    "peek",
+    "swap",
+    "line_address",
+    "_Cache__find",
+]
+POLICY_METHODS = ["hit", "victim", "fill"]
+TRACER_METHODS = [
+    "tick",
+    "prefetch_wait",
+    "io_access",
+    "cache_access",
+    "memory_transfer",
+    "cache_fill_write",
+    "cache_insert",
+    "line_evicted",
+    "prefetch_start",
+    "cache_lookup",
+    "prefetch_planned",
+    "wait_total",
+    "finish",
+]
+
+
+def signal_name(signal) -> str:
+    # Same names as in journal micro programs
+    return f"{type(signal).__name__}.{signal.name}" if isinstance(signal, Enum) else type(signal).__name__
+
+
+def method_name(obj, method: str) -> str:
+    # Private methods are shown as written in their class
+    name = type(obj).__name__
+    return f"{name}.{method.replace(f'_{name}__', '__', 1)}"
+
+
+class HostProfiler:
+    def __init__(self):
+        # Timer path (names of enclosing timers) -> [calls, self ns, total ns]
+        self.timers = {}
+        # Timer name -> (file, line, function) of what it times, for pstats
+        self._code = {}
+        self._path = ()
+        # Time of nested timers for every running one (the first is for time outside of all)
+        self._nested = [0]
+
+    def _timed(self, function, name: str, code):
+        self._code.setdefault(name, code)
+
+        def timed(*args):
+            parent = self._path
+            path = self._path = (*parent, name)
+            nested = self._nested
+            nested.append(0)
+            start = perf_counter_ns()
+            try:
+                return function(*args)
+            finally:
+                elapsed = perf_counter_ns() - start
+                self._path = parent
+                own = elapsed - nested.pop()
+                nested[-1] += elapsed
+                timer = self.timers.get(path)
+                if timer is None:
+                    timer = self.timers[path] = [0, 0, 0]
+                timer[0] += 1
+                timer[1] += own
+                timer[2] += elapsed
+
+        return timed
+
+    def _wrap(self, obj, method: str, name: str):
+        function = getattr(obj, method)
+        code = function.__code__
+        setattr(obj, method, self._timed(function, name, (code.co_filename, code.co_firstlineno, code.co_name)))
+
+    def _wrap_signals(self, control):
+        apply_signal = control.apply_signal
+        code = apply_signal.__code__
+        by_name = {}
+
+        def timed_signal(signal):
+            name = signal_name(signal)
+            timed = by_name.get(name)
+            if timed is None:
+                timed = by_name[name] = self._timed(apply_signal, name, (code.co_filename, code.co_firstlineno, name))
+            return timed(signal)
+
+        control.apply_signal = timed_signal
+
+    def instrument(self, control):
+        """Puts timers on the machine (control unit with its memory, cache & tracer)"""
+        self._wrap(control, "_run", "dispatch")
+        self._wrap(control, "_run_traced", "dispatch")
+        self._wrap_signals(control)
+        memory = control._mem
+        for method in MEMORY_METHODS:
+            self._wrap(memory, method, method_name(memory, method))
+        for method in CACHE_METHODS:
+            self._wrap(memory._cache, method, method_name(memory._cache, method))
+        for method in POLICY_METHODS:
+            self._wrap(memory._cache._policy, method, method_name(memory._cache._policy, method))
+        if control._tracer.enabled:
+            # Tracer instance is only used by this machine, the no-op one isn't called
+            for method in TRACER_METHODS:
+                self._wrap(control._tracer, method, f"tracer.{method}")
+
+    def totals(self) -> dict:
+        """Timer name -> [calls, self ns, total ns] summed over all the paths it was called on"""
+        totals = {}
+        for path, (calls, own, total) in self.timers.items():
+            timer = totals.setdefault(path[-1], [0, 0, 0])
+            timer[0] += calls
+            timer[1] += own
+            # Time of the same timer nested in itself is already counted
+            if path[-1] not in path[:-1]:
+                timer[2] += total
+        return totals
+
+    def report(self, ticks: int) -> str:
+        totals = self.totals()
+        wall = sum(total for path, (_, _, total) in self.timers.items() if len(path) == 1)
+        ticks = max(ticks, 1)
+        lines = [
+            f"Host profile: {wall} ns in {ticks} ticks, {wall / ticks:.1f} ns per tick",
+            f"{'timer':<40} {'calls':>10} {'self ns/tick':>13} {'total ns/tick':>14} {'ns/call':>10}",
+        ]
+        for name, (calls, own, total) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append(
+                f"{name:<40} {calls:>10} {own / ticks:>13.1f} {total / ticks:>14.1f} {total / max(calls, 1):>10.1f}"
+            )
+        return "\n".join(lines)
+
+    def pstats(self) -> dict:
+        """Timers in the format of cProfile stats (pstats.Stats loads them dumped with marshal)"""
+        stats = {}
+        for path, (calls, own, total) in self.timers.items():
+            key = self._code[path[-1]]
+            cc, nc, tt, ct, callers = stats.setdefault(key, (0, 0, 0.0, 0.0, {}))
+            stats[key] = (cc + calls, nc + calls, tt + own / 1e9, ct + total / 1e9, callers)
+            if len(path) > 1:
+                caller = self._code[path[-2]]
+                c_cc, c_nc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (c_cc + calls, c_nc + calls, c_tt + own / 1e9, c_ct + total / 1e9)
+        return stats
+
+    def speedscope(self, name: str) -> dict:
+        """Timer paths with their self time as a sampled speedscope profile"""
+        names = sorted({timer for path in self.timers for timer in path})
+        frame_index = {timer: i for i, timer in enumerate(names)}
+        paths = [path for path, timer in self.timers.items() if timer[1] > 0]
+        weights = [self.timers[path][1] for path in paths]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": timer} for timer in names]},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "nanoseconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": [[frame_index[timer] for timer in path] for path in paths],
+                    "weights": weights,
+                }
+            ],
+            "name": name,
+            "exporter": "stack-arch host profile",
+        }
+
+    def export(self, file: str, name: str):
+        """Speedscope json if file name ends with .json, cProfile stats (pstats) otherwise"""
+        if file.endswith(".json"):
+            with open(file, "w", encoding="utf-8") as out:
+                json.dump(self.speedscope(name), out)
+        else:
+            with open(file, "wb") as out:
+                marshal.dump(self.pstats(), out)
+        logging.info("Host profile is written to %s", file)
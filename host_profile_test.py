@@ -0,0 +1,65 @@
+import contextlib
+import io
+import json
+import logging
+import pstats
+
+import forthc
+import machine
+import pytest
+from host_profile import HostProfiler
+from isa import write_code
+
+
+@pytest.fixture
+def hello(tmp_path) -> str:
+    target = str(tmp_path / "hello.o")
+    with open("programs/hello.f", encoding="utf-8") as file:
+        write_code(target, forthc.translate(file.read(), 0, 10))
+    return target
+
+
+def run(target: str, *options: str) -> str:
+    with contextlib.redirect_stdout(io.StringIO()) as stdout:
+        machine.main(machine.parser.parse_args([*options, target]))
+    return stdout.getvalue()
+
+
+@pytest.mark.parametrize("engine", ["micro", "compiled", "fast"])
+def test_profiled_run_is_the_same(hello, engine, caplog):
+    caplog.set_level(logging.INFO)
+    assert run(hello, "--engine", engine, "--host-profile") == run(hello, "--engine", engine)
+    report = next(record.getMessage() for record in caplog.records if record.getMessage().startswith("Host profile"))
+    assert "dispatch" in report
+    assert "Cache.__find" in report
+    if engine == "micro":
+        assert "MemSignal.MemRD" in report
+        assert "ALUOp" in report
+
+
+def test_timers_exclude_nested_ones(hello):
+    profiler = HostProfiler()
+    control = machine.build_control_unit(machine.read_code(hello))
+    profiler.instrument(control)
+    control.simulate(10000)
+    totals = profiler.totals()
+    calls, own, total = totals["Cache.read"]
+    assert calls > 0
+    assert own < total
+    (wall,) = (total for path, (_, _, total) in profiler.timers.items() if path == ("dispatch",))
+    assert sum(own for _, own, _ in totals.values()) == wall
+
+
+def test_exported_profiles(hello, tmp_path):
+    run(hello, "--host-profile", "--host-profile-out", str(tmp_path / "hello.prof"))
+    stats = pstats.Stats(str(tmp_path / "hello.prof"))
+    assert any(function == "__find" for _, _, function in stats.stats)
+
+    run(hello, "--host-profile", "--host-profile-out", str(tmp_path / "hello.json"))
+    with open(tmp_path / "hello.json", encoding="utf-8") as file:
+        profile = json.load(file)
+    frames = [frame["name"] for frame in profile["shared"]["frames"]]
+    (sampled,) = profile["profiles"]
+    assert "dispatch" in frames
+    assert all(frames[sample[0]] == "dispatch" for sample in sampled["samples"])
+    assert sum(sampled["weights"]) == sampled["endValue"]
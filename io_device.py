@@ -0,0 +1,118 @@
+import codecs
+from collections import deque
+
+# Streaming IO device buffers. MemoryUnit only needs len() & popleft() from its
+# input buffer and append() from the output one, so these are used in place of
+# the whole-input deque and whole-output list to keep no more than a chunk of
+# characters in memory. Connection ones back the asyncio socket device (see
+# Machine.serve).
+
+DEFAULT_CHUNK_SIZE = 4096
+
+
+class StreamInput:
+    """
+    Input characters read from a binary stream (file, pipe or stdin) by chunks
+    of up to chunk_size bytes when previous ones are consumed. Only the bytes
+    already available are taken, so an interactive stream is not waited for more.
+    on_wait is called before reading, e.g. to flush an output prompt
+    """
+
+    def __init__(self, stream, chunk_size: int = DEFAULT_CHUNK_SIZE, on_wait=None):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._on_wait = on_wait
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._chars = deque()
+        self._eof = False
+
+    def _fill(self):
+        while len(self._chars) == 0 and not self._eof:
+            if self._on_wait is not None:
+                self._on_wait()
+            read = getattr(self._stream, "read1", self._stream.read)
+            data = read(self._chunk_size)
+            self._eof = len(data) == 0
+            self._chars.extend(self._decoder.decode(data, final=self._eof))
+
+    def __len__(self) -> int:
+        # Number of characters available right now (0 only on the end of stream)
+        self._fill()
+        return len(self._chars)
+
+    def __iter__(self):
+        return iter(self._chars)
+
+    def popleft(self) -> str:
+        self._fill()
+        return self._chars.popleft()
+
+
+class StreamOutput:
+    """
+    Output characters written to a text stream whenever buffer_size of them pile up
+    and on flush. Characters already written aren't kept
+    """
+
+    def __init__(self, stream, buffer_size: int = DEFAULT_CHUNK_SIZE):
+        self._stream = stream
+        self._buffer_size = buffer_size
+        self._pending = []
+        self.written = 0
+
+    def append(self, item: int):
+        self._pending.append(item)
+        if len(self._pending) >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._pending) > 0:
+            self._stream.write("".join(map(chr, self._pending)))
+            self.written += len(self._pending)
+            self._pending.clear()
+        self._stream.flush()
+
+    def __iter__(self):
+        # Written out output is in the stream only
+        return iter(())
+
+
+class ConnectionInput:
+    """
+    Input characters received from a connection. Unlike the other buffers it may be
+    empty for a while: the machine waits for more (see ControlUnit.retry_read) until
+    the connection is closed
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._chars = deque()
+        self.closed = False
+
+    def feed(self, data: bytes):
+        """Adds received data, empty data is the end of the connection"""
+        self.closed = len(data) == 0
+        self._chars.extend(self._decoder.decode(data, final=self.closed))
+
+    def __len__(self) -> int:
+        return len(self._chars)
+
+    def __iter__(self):
+        return iter(self._chars)
+
+    def popleft(self) -> str:
+        return self._chars.popleft()
+
+
+class ConnectionStream:
+    """Text stream over asyncio StreamWriter for StreamOutput, written data is sent by the event loop"""
+
+    def __init__(self, writer):
+        self._writer = writer
+
+    def write(self, text: str):
+        self._writer.write(text.encode("utf-8"))
+
+    def flush(self):
+        # Draining is awaited by the machine between runs
+        pass
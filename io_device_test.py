@@ -0,0 +1,50 @@
+import contextlib
+import io
+import logging
+
+import forthc
+import machine
+from io_device import StreamInput, StreamOutput
+from isa import write_code
+
+
+def test_stream_input_decodes_split_characters():
+    chars = StreamInput(io.BytesIO("Привет, мир".encode()), chunk_size=1)
+    assert "".join(chars.popleft() for _ in range(len("Привет, мир"))) == "Привет, мир"
+    assert len(chars) == 0
+
+
+def test_stream_output_is_bounded():
+    stream = io.StringIO()
+    output = StreamOutput(stream, buffer_size=3)
+    for char in "Hello":
+        output.append(ord(char))
+    assert stream.getvalue() == "Hel"
+    output.flush()
+    assert stream.getvalue() == "Hello"
+    assert list(output) == []
+
+
+def test_streamed_cat(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    target = str(tmp_path / "cat.o")
+    with open("programs/cat.f", encoding="utf-8") as file:
+        write_code(target, forthc.translate(file.read(), 0, 10))
+    text = "Lorem ipsum dolor sit amet\n" * 200
+    (tmp_path / "input").write_text(text, encoding="utf-8")
+
+    def run(*options: str) -> str:
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            machine.main(machine.parser.parse_args([*options, "--engine", "fast", "-t", "10000000", target]))
+        return stdout.getvalue()
+
+    expected = run("-i", text)
+    assert expected.startswith(text)
+    stats = expected[len(text) :]
+
+    streamed = run(
+        "--input-file", str(tmp_path / "input"), "--stream-output", str(tmp_path / "output"), "--io-buffer", "64"
+    )
+    assert (tmp_path / "output").read_text(encoding="utf-8") == text
+    assert streamed == stats
+    assert run("--input-file", str(tmp_path / "input"), "--stream-output", "-") == expected
@@ -0,0 +1,78 @@
+import logging
+from collections import deque
+
+# Bounded journal: log text is split into blocks by empty lines (just as golden
+# tests cut their logs) and only the first & last blocks are kept, so memory use
+# doesn't depend on how many ticks were run. Kept blocks are written on close in
+# the golden log layout: head, ".....", middle, ".....", tail.
+
+ELISION = "....."
+
+
+class RingJournalHandler(logging.Handler):
+    """
+    Keeps blocks first ones and the last ones in a ring, everything is written if
+    fewer than 3 * blocks were logged. With sample_period a window of blocks is
+    sampled every sample_period blocks and the latest one dropped from the tail
+    ring is written as the middle, otherwise the middle is left out
+    """
+
+    def __init__(self, stream, blocks: int = 50, sample_period: int = 0):
+        super().__init__()
+        self._stream = stream
+        self._blocks = blocks
+        self._period = sample_period
+        self._head = []
+        self._middle = deque(maxlen=blocks)
+        # (index, block) of complete blocks, long enough to have all of them if there are fewer than 3 * blocks
+        self._tail = deque(maxlen=2 * blocks - 1)
+        # Text after the last complete block
+        self._partial = ""
+        self._count = 0
+        self._closed = False
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            text = self._partial + self.format(record) + "\n"
+        except Exception:
+            self.handleError(record)
+            return
+        *blocks, self._partial = text.split("\n\n")
+        for block in blocks:
+            self._add(block)
+
+    def _add(self, block: str):
+        if len(self._head) < self._blocks:
+            self._head.append(block)
+        else:
+            if len(self._tail) == self._tail.maxlen:
+                self._drop(*self._tail[0])
+            self._tail.append((self._count, block))
+        self._count += 1
+
+    def _drop(self, index: int, block: str):
+        if self._period == 0 or index % self._period >= self._blocks:
+            return
+        if index % self._period == 0:
+            # Window of the next sample
+            self._middle.clear()
+        self._middle.append(block)
+
+    def render(self) -> str:
+        tail = [block for _, block in self._tail]
+        # The text after the last empty line is the last block
+        if self._count + 1 < 3 * self._blocks:
+            return "\n\n".join([*self._head, *tail, self._partial])
+        middle = [*self._middle, ELISION] if len(self._middle) > 0 else []
+        return "\n\n".join([*self._head, ELISION, *middle, *tail[len(tail) - self._blocks + 1 :], self._partial])
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.acquire()
+            try:
+                self._stream.write(self.render())
+                self._stream.flush()
+            finally:
+                self.release()
+        super().close()
@@ -0,0 +1,59 @@
+import io
+import logging
+
+import forthc
+import machine
+import pytest
+from journal_sink import ELISION, RingJournalHandler
+from tracer import JournalTracer
+
+
+def journal(program: str, buffer: str, handler: RingJournalHandler, caplog) -> list[str]:
+    with open(f"programs/{program}", encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    handler.setFormatter(logging.Formatter("[%(levelname).3s] %(message)s"))
+    logging.getLogger().addHandler(handler)
+    try:
+        with caplog.at_level(logging.DEBUG):
+            machine.build_control_unit(code, buffer, tracer=JournalTracer()).simulate(20000)
+    finally:
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+    return caplog.text.split("\n\n")
+
+
+@pytest.mark.parametrize("blocks", [50, 1000])
+def test_head_and_tail_as_in_golden_logs(blocks, caplog):
+    stream = io.StringIO()
+    log_blocks = journal("hello.f", "", RingJournalHandler(stream, blocks), caplog)
+
+    if len(log_blocks) < 3 * blocks:
+        assert stream.getvalue() == caplog.text
+    else:
+        assert stream.getvalue() == "\n\n".join([*log_blocks[:blocks], ELISION, *log_blocks[-blocks:]])
+
+
+def test_sampled_middle(caplog):
+    stream = io.StringIO()
+    log_blocks = journal("hello.f", "", RingJournalHandler(stream, 20, sample_period=300), caplog)
+
+    head, middle, tail = stream.getvalue().split(f"\n\n{ELISION}\n\n")
+    middle = middle.split("\n\n")
+    assert len(middle) == 20
+    assert any(log_blocks[start : start + 20] == middle for start in range(300, len(log_blocks), 300))
+    assert f"{head}\n\n" == caplog.text[: len(head) + 2]
+    assert caplog.text.endswith(f"\n\n{tail}")
+
+
+@pytest.mark.parametrize(
+    ("options", "error"),
+    [
+        (["--journal-ring", "0"], "--journal-ring must be at least 1 block"),
+        (["--journal-ring", "-5"], "--journal-ring must be at least 1 block"),
+        (["--journal-ring", "5", "--journal-sample", "-1"], "--journal-sample can't be negative"),
+    ],
+)
+def test_invalid_ring_is_rejected(options, error, capsys):
+    with pytest.raises(SystemExit):
+        machine.main(machine.parser.parse_args(["programs/cat.f", "-j", *options]))
+    assert error in capsys.readouterr().err
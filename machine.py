@@ -1,28 +1,535 @@
+from __future__ import annotations
+
 import argparse
+import asyncio
+import contextlib
+import json
 import logging
+import math
 import sys
 
+from binary_trace import BinaryTracer
+from block_unit import BlockControlUnit
+from compiled_unit import CompiledControlUnit
 from control_unit import ControlUnit
 from datapath import Datapath
+from debug_unit import DebugControlUnit
+from exceptions import (
+    DataAsInstructionError,
+    InstructionAsDataError,
+    MicrocodeJumpFailError,
+    ResultCacheMismatchError,
+    StackOverflowError,
+    StackUnderflowError,
+)
+from fast_unit import FastControlUnit
+from host_profile import HostProfiler
+from io_device import ConnectionInput, ConnectionStream, StreamInput, StreamOutput
 from isa import read_code
-from memory_unit import Cache, MemoryUnit
+from journal_sink import RingJournalHandler
+from memory_unit import DEFAULT_POLICY, LINE_SIZE, Cache, MemoryUnit, geometry_error
+from memory_words import MEMORY_BACKENDS
+from miss_classifier import MissClassifier
+from perf_counters import PerfCounters
+from replacement import REPLACEMENT_POLICIES
+from result_cache import ResultCache, result_key
+from sampling import SampledSimulation
+from snapshot import fork, read_snapshot, restore_state, write_snapshot
+from stack_distance import AddressRecorder, format_table, miss_curves, write_curves
+from tracer import NULL_TRACER, EventTracer, JournalTracer, TeeTracer, Tracer
+from word_profile import WordProfiler
 
+ENGINES = {
+    "micro": ControlUnit,
+    "compiled": CompiledControlUnit,
+    "fast": FastControlUnit,
+    "block": BlockControlUnit,
+    "debug": DebugControlUnit,
+}
 
-def main(args):
-    code = read_code(args.source)
 
-    cache = Cache(args.cache_size)
-    memory = MemoryUnit(args.io_adr, args.mem_size, code, [*args.buffer], cache)
-    datapath = Datapath(args.start_adr, memory)
-    control = ControlUnit(datapath, memory)
+def make_tracer(args, events_file=None, trace_file=None):
+    if events_file is not None:
+        return EventTracer(lambda event: events_file.write(json.dumps(event) + "\n"))
+    if trace_file is not None:
+        return BinaryTracer(trace_file)
+    if args.journal:
+        return JournalTracer()
+    return NULL_TRACER
+
+
+def build_control_unit(
+    code,
+    buffer: str = "",
+    engine: str = "micro",
+    mem_size: int = 1024,
+    cache_size: int = 64,
+    start_adr: int = 10,
+    io_adr: int = 0,
+    tracer: Tracer = NULL_TRACER,
+    memory_backend: str = "list",
+    cache_line: int = LINE_SIZE,
+    cache_ways: int | None = None,
+    cache_policy: str = DEFAULT_POLICY,
+) -> ControlUnit:
+    cache = Cache(cache_size, cache_line, cache_ways, cache_policy)
+    memory = MemoryUnit(io_adr, mem_size, code, [*buffer], cache, tracer, memory_backend)
+    datapath = Datapath(start_adr, memory)
+    return ENGINES[engine](datapath, memory, tracer)
+
+
+# Errors a program can stop the machine with
+MACHINE_ERRORS = (
+    DataAsInstructionError,
+    InstructionAsDataError,
+    MicrocodeJumpFailError,
+    StackOverflowError,
+    StackUnderflowError,
+    ZeroDivisionError,
+)
+
+
+class Machine:
+    """
+    Embeddable simulation: driven instruction by instruction, until some condition
+    or tick by tick in chunks with the output consumed while the machine runs.
+    Nothing is logged, machine errors (stack overflow, etc.) are raised as is
+    """
+
+    def __init__(self, control: ControlUnit):
+        self.control = control
+        # Output characters already handed out by take_output
+        self._taken = 0
+
+    @classmethod
+    def from_code(cls, code, buffer: str = "", engine: str = "fast", **config) -> Machine:
+        """
+        Config is the rest of build_control_unit arguments: mem_size, cache_size, start_adr, io_adr, tracer,
+        memory_backend, cache_line, cache_ways, cache_policy
+        """
+        return cls(build_control_unit(code, buffer, engine, **config))
+
+    @classmethod
+    def from_state(cls, state: dict, engine: str = "fast", buffer: str | None = None) -> Machine:
+        return cls(restore_state(state, ENGINES[engine], buffer=buffer))
+
+    def fork(self) -> Machine:
+        """Independent copy of the machine in its current state, paged memory is shared copy-on-write"""
+        return Machine(fork(self.control))
+
+    @property
+    def ticks(self) -> int:
+        return self.control._ticks
+
+    @property
+    def pc(self) -> int:
+        return self.control._dp._PC
+
+    @property
+    def stop_reason(self) -> str | None:
+        """Why the machine has stopped ("halt" or "buffer_empty"), None while it can run"""
+        return self.control._stop_reason
+
+    @property
+    def output(self) -> str:
+        return "".join(map(chr, self.control._mem._write_buffer))
+
+    @property
+    def miss_rate(self) -> float:
+        cache = self.control._mem._cache
+        return (cache._requests - cache._hits) / cache._requests if cache._requests else 0.0
+
+    def take_output(self) -> str:
+        """Output produced since the previous call"""
+        buffer = self.control._mem._write_buffer
+        chunk = "".join(map(chr, buffer[self._taken :]))
+        self._taken = len(buffer)
+        return chunk
+
+    def step(self, n: int = 1) -> int:
+        """Executes up to n instructions, returns how many were executed before the machine stopped"""
+        for i in range(n):
+            if self.stop_reason is not None:
+                return i
+            self.control.step_instruction()
+        return n
+
+    def run(self, tick_limit: int) -> tuple[str, int, float]:
+        """Runs until tick limit (counted from the very start) or machine stop"""
+        if self.stop_reason is None:
+            self.control.advance(tick_limit)
+        return (self.output, self.ticks, self.miss_rate)
+
+    def run_until(self, pc: int | None = None, ticks: int | None = None, output_contains: str | None = None) -> str:
+        """
+        Runs until PC is the given one on instruction boundary, ticks are reached or
+        output contains the given string (whichever comes first) or machine stop.
+        Returns why it stopped: "pc", "ticks", "output" or machine stop reason
+        """
+        if pc is None and output_contains is None:
+            # Nothing to check on every instruction
+            self.run(math.inf if ticks is None else ticks)
+            return self.stop_reason or "ticks"
+
+        output_len = -1
+        while self.stop_reason is None:
+            if pc is not None and self.pc == pc:
+                return "pc"
+            if ticks is not None and self.ticks >= ticks:
+                return "ticks"
+            write_buffer = self.control._mem._write_buffer
+            if output_contains is not None and len(write_buffer) != output_len:
+                output_len = len(write_buffer)
+                if output_contains in self.output:
+                    return "output"
+            self.control.step_instruction()
+        return self.stop_reason
+
+    def output_chunks(self, tick_limit: int, chunk_ticks: int = 10000):
+        """Runs until tick limit or machine stop yielding new output after every chunk_ticks ticks"""
+        while self.stop_reason is None and self.ticks < tick_limit:
+            self.run(min(self.ticks + chunk_ticks, tick_limit))
+            chunk = self.take_output()
+            if chunk:
+                yield chunk
+
+    async def run_async(self, tick_limit: int, chunk_ticks: int = 10000) -> tuple[str, int, float]:
+        """Same as run, but gives control back to the event loop after every chunk_ticks ticks"""
+        while self.stop_reason is None and self.ticks < tick_limit:
+            self.run(min(self.ticks + chunk_ticks, tick_limit))
+            await asyncio.sleep(0)
+        return (self.output, self.ticks, self.miss_rate)
+
+    async def output_chunks_async(self, tick_limit: int, chunk_ticks: int = 10000):
+        """Same as output_chunks, but gives control back to the event loop after every chunk"""
+        while self.stop_reason is None and self.ticks < tick_limit:
+            self.run(min(self.ticks + chunk_ticks, tick_limit))
+            chunk = self.take_output()
+            if chunk:
+                yield chunk
+            await asyncio.sleep(0)
+
+    async def serve(
+        self, reader, writer, tick_limit: int, chunk_ticks: int = 10000, buffer_size: int = 4096
+    ) -> tuple[int, float]:
+        """
+        Runs with the IO device connected to asyncio streams: input is what is received,
+        output is sent as soon as a chunk of ticks is done. Reading an input character that
+        hasn't come yet suspends the machine (letting the event loop run the others) till it comes.
+        Input ends with the connection. Returns ticks & cache miss rate
+        """
+        memory = self.control._mem
+        received = ConnectionInput()
+        output = StreamOutput(ConnectionStream(writer), buffer_size)
+        for item in memory._write_buffer:
+            output.append(item)
+        memory._read_buffer = received
+        memory._write_buffer = output
+        try:
+            while self.ticks < tick_limit:
+                self.run(min(self.ticks + chunk_ticks, tick_limit))
+                output.flush()
+                await writer.drain()
+                if self.stop_reason == "buffer_empty" and not received.closed:
+                    self.control.retry_read()
+                    received.feed(await reader.read(buffer_size))
+                elif self.stop_reason is not None:
+                    break
+                else:
+                    await asyncio.sleep(0)
+        finally:
+            # Output up to a machine error is sent too
+            output.flush()
+        return (self.ticks, self.miss_rate)
+
+
+async def start_server(
+    address: str, make_machine, tick_limit: int, chunk_ticks: int = 10000, buffer_size: int = 4096
+) -> asyncio.Server:
+    """Serves every connection to address (HOST:PORT or unix:PATH) by a new machine from make_machine()"""
+
+    async def handle(reader, writer):
+        machine = make_machine()
+        try:
+            ticks, miss_rate = await machine.serve(reader, writer, tick_limit, chunk_ticks, buffer_size)
+            if machine.stop_reason is None:
+                stop_connection(writer, "Tick limit exceeded")
+            else:
+                logging.info("Connection served. Cache miss rate: %.3f%% Ticks: %d", miss_rate * 100, ticks)
+        except MACHINE_ERRORS as error:
+            stop_connection(writer, str(error))
+        finally:
+            writer.close()
+
+    if address.startswith("unix:"):
+        return await asyncio.start_unix_server(handle, address.removeprefix("unix:"))
+    host, port = address.rsplit(":", 1)
+    return await asyncio.start_server(handle, host, int(port))
+
+
+def stop_connection(writer, reason: str):
+    """Tells the client why its machine has been stopped"""
+    logging.warning("Connection stopped: %s", reason)
+    writer.write(f"\nError: {reason}\n".encode())
+
+
+async def listen(args):
+    # Every connection gets its own machine, but the program is parsed once
+    program = read_program(args)
+    server = await start_server(
+        args.listen,
+        lambda: Machine(make_control_unit(args, NULL_TRACER, program)),
+        args.tick_limit,
+        buffer_size=args.io_buffer,
+    )
+    async with server:
+        await server.serve_forever()
+
+
+def read_program(args):
+    """Machine state of --load-state or code of SOURCE"""
+    return read_snapshot(args.load_state) if args.load_state else read_code(args.source)
+
 
+def make_control_unit(args, tracer: Tracer, program=None) -> ControlUnit:
+    """Machine of args, program is the read_program(args) one if it's already read"""
+    program = read_program(args) if program is None else program
+    if args.load_state:
+        # Empty input doesn't replace the one saved
+        return restore_state(program, ENGINES[args.engine], tracer, args.buffer or None)
+    return build_control_unit(
+        program,
+        args.buffer,
+        args.engine,
+        args.mem_size,
+        args.cache_size,
+        args.start_adr,
+        args.io_adr,
+        tracer,
+        args.memory_backend,
+        **cache_config(args),
+    )
+
+
+def cache_config(args) -> dict:
+    """build_control_unit arguments of cache geometry & replacement policy"""
+    return {"cache_line": args.cache_line, "cache_ways": args.cache_ways, "cache_policy": args.cache_policy}
+
+
+def attach_streams(args, control: ControlUnit, stack: contextlib.ExitStack):
+    """Replaces IO device buffers with the streaming ones, streams are flushed & closed with the stack"""
+    memory = control._mem
+    output = None
+    if args.stream_output:
+        if args.stream_output == "-":
+            stream = sys.stdout
+        else:
+            stream = stack.enter_context(open(args.stream_output, "w", encoding="utf-8"))
+        output = StreamOutput(stream, args.io_buffer)
+        # Output of a loaded machine goes first
+        for item in memory._write_buffer:
+            output.append(item)
+        stack.callback(output.flush)
+        memory._write_buffer = output
+    if args.input_file:
+        stream = sys.stdin.buffer if args.input_file == "-" else stack.enter_context(open(args.input_file, "rb"))
+        # Pending output (e.g. a prompt) is shown before waiting for input
+        memory._read_buffer = StreamInput(stream, args.io_buffer, output.flush if output is not None else None)
+
+
+def simulate_sampled(args, control: ControlUnit) -> dict:
+    sampled = SampledSimulation(control._dp, control._mem, args.sample_period, args.sample_ticks, ENGINES[args.engine])
+    return sampled.simulate(args.tick_limit)
+
+
+def simulate_cached(args) -> tuple[str, int, float]:
+    code = read_code(args.source)
+    results = ResultCache(args.result_cache, args.result_cache_size)
+    config = cache_config(args)
+    # Results with the default cache are keyed just as before it was configurable
+    is_default = config == {"cache_line": LINE_SIZE, "cache_ways": None, "cache_policy": DEFAULT_POLICY}
+    key = result_key(
+        code,
+        args.buffer,
+        args.mem_size,
+        args.cache_size,
+        args.start_adr,
+        args.io_adr,
+        args.tick_limit,
+        None if is_default else config,
+    )
+    stored = results.get(key) if args.result_cache_mode != "bypass" else None
+    if stored is not None and args.result_cache_mode == "use":
+        logging.info("Result is taken from cache: %s", key)
+        return (stored["output"], stored["ticks"], stored["miss_rate"])
+
+    control = build_control_unit(
+        code,
+        args.buffer,
+        args.engine,
+        args.mem_size,
+        args.cache_size,
+        args.start_adr,
+        args.io_adr,
+        memory_backend=args.memory_backend,
+        **config,
+    )
     output, ticks, miss_rate = control.simulate(args.tick_limit)
+    result = {"output": output, "ticks": ticks, "miss_rate": miss_rate, "stop": control._stop_reason}
+    if stored is not None and stored != result:
+        raise ResultCacheMismatchError(key)
+    results.put(key, result)
+    return (output, ticks, miss_rate)
+
+
+def make_analyses(args) -> dict:
+    """Tracers of the run analyses asked for by their options"""
+    analyses = {}
+    if args.stats:
+        analyses["stats"] = PerfCounters()
+    if args.word_profile:
+        analyses["word_profile"] = WordProfiler()
+    if args.cache_heatmap:
+        analyses["cache_heatmap"] = MissClassifier()
+    if args.miss_curves:
+        analyses["miss_curves"] = AddressRecorder()
+    return analyses
+
+
+def write_analyses(args, analyses: dict):
+    if "stats" in analyses:
+        stats = analyses["stats"].report()
+        if args.stats_file:
+            with open(args.stats_file, "w", encoding="utf-8") as file:
+                json.dump(stats, file, indent=2)
+        else:
+            print(json.dumps(stats, indent=2))
+    if "word_profile" in analyses:
+        logging.info("%s", analyses["word_profile"].table(args.word_profile_top))
+        with open(args.word_profile, "w", encoding="utf-8") as file:
+            file.write(analyses["word_profile"].collapsed())
+    if "cache_heatmap" in analyses:
+        logging.info("%s", analyses["cache_heatmap"].summary())
+        analyses["cache_heatmap"].export(args.cache_heatmap)
+    if "miss_curves" in analyses:
+        curves = miss_curves(analyses["miss_curves"])
+        logging.info("%s", format_table(curves))
+        write_curves(args.miss_curves, curves)
+
+
+# Options of detailed runs only (dest by option), sampled runs fast-forward past them
+UNSAMPLED_OPTIONS = {
+    "--journal": "journal",
+    "--events": "events_file",
+    "--trace": "trace_file",
+    "--save-state": "save_state",
+    "--host-profile": "host_profile",
+    "--stats": "stats",
+    "--word-profile": "word_profile",
+    "--cache-heatmap": "cache_heatmap",
+    "--miss-curves": "miss_curves",
+}
+
+
+def error_repr(error: float, digits: int) -> str:
+    """Confidence interval half width, n/a if there is none (too few samples)"""
+    return f"{error:.{digits}f}" if math.isfinite(error) else "n/a"
+
+
+def check_args(args):
+    """Rejects the values & combinations of options argparse doesn't check"""
+    if args.source is None and args.load_state is None:
+        parser.error("Either SOURCE or --load-state is required")
+    cache_error = geometry_error(args.cache_size, args.cache_line, args.cache_ways)
+    if cache_error is not None:
+        parser.error(cache_error)
+    if args.journal_ring is not None and args.journal_ring < 1:
+        parser.error("--journal-ring must be at least 1 block")
+    if args.journal_sample < 0:
+        parser.error("--journal-sample can't be negative")
+    if args.save_state and (args.input_file or args.stream_output):
+        # Streams are neither read ahead nor kept, so their state can't be saved
+        parser.error("--save-state can't be used with --input-file or --stream-output")
+
+
+def main(args):
+    check_args(args)
+    if args.listen:
+        asyncio.run(listen(args))
+        return
+    if args.sample_period:
+        unsampled = [option for option, dest in UNSAMPLED_OPTIONS.items() if getattr(args, dest)]
+        if unsampled:
+            parser.error(f"{', '.join(unsampled)} can't be used with --sample")
+        with contextlib.ExitStack() as stack:
+            # Only the sampled ticks are simulated in detail, so there is nothing to trace
+            control = make_control_unit(args, NULL_TRACER)
+            attach_streams(args, control, stack)
+            result = simulate_sampled(args, control)
+        print(
+            f"{result['output']}\n"
+            f"Cache miss rate: {result['miss_rate'] * 100:.3f}% ± {error_repr(result['miss_rate_error'] * 100, 3)}% "
+            f"Ticks: {result['ticks']} ± {error_repr(result['ticks_error'], 0)} "
+            f"(estimated from {result['samples']} samples, 95% confidence)"
+        )
+        return
+    # Journal, events, traces, machine states & streams can't be taken from the cache
+    uncacheable = (
+        args.journal,
+        args.events_file,
+        args.trace_file,
+        args.load_state,
+        args.save_state,
+        args.input_file,
+        args.stream_output,
+        args.host_profile,
+        args.stats,
+        args.word_profile,
+        args.cache_heatmap,
+        args.miss_curves,
+    )
+    if args.result_cache and not any(uncacheable):
+        output, ticks, miss_rate = simulate_cached(args)
+        print(f"{output}\nCache miss rate: {miss_rate * 100:.3f}% Ticks: {ticks}")
+        return
+    simulate_run(args)
+
+
+def simulate_run(args):
+    """Single simulation with all the tracing, profiling & state saving asked for"""
+    with contextlib.ExitStack() as stack:
+        events_file = stack.enter_context(open(args.events_file, "w", encoding="utf-8")) if args.events_file else None
+        trace_file = stack.enter_context(open(args.trace_file, "wb")) if args.trace_file else None
+        tracer = make_tracer(args, events_file, trace_file)
+        if isinstance(tracer, BinaryTracer):
+            # Trace is complete only with its index
+            stack.callback(tracer.close)
+        analyses = make_analyses(args)
+        if len(analyses) > 0:
+            tracer = TeeTracer(tracer, *analyses.values()) if tracer.enabled else TeeTracer(*analyses.values())
+        control = make_control_unit(args, tracer)
+        attach_streams(args, control, stack)
+        profiler = None
+        if args.host_profile:
+            profiler = HostProfiler()
+            profiler.instrument(control)
+            start_ticks = control._ticks
+        output, ticks, miss_rate = control.simulate(args.tick_limit)
+    if profiler is not None:
+        logging.info("%s", profiler.report(ticks - start_ticks))
+        if args.host_profile_out:
+            profiler.export(args.host_profile_out, args.source or args.load_state)
+    if args.save_state:
+        write_snapshot(args.save_state, control)
     print(f"{output}\nCache miss rate: {miss_rate * 100:.3f}% Ticks: {ticks}")
+    write_analyses(args, analyses)
 
 
 parser = argparse.ArgumentParser(description="Basic stack machine emulator", epilog="It's a miracle it actually runs!")
 
-parser.add_argument("source", metavar="SOURCE", help="a json file containing code to run")
+parser.add_argument(
+    "source", metavar="SOURCE", nargs="?", help="a json file containing code to run. Not needed with --load-state"
+)
 parser.add_argument(
     "-i",
     "--input",
@@ -73,6 +580,18 @@ parser.add_argument(
     default=0,
     help="an address mapped to the IO device. Default: 0",
 )
+parser.add_argument(
+    "--memory-backend",
+    dest="memory_backend",
+    choices=MEMORY_BACKENDS.keys(),
+    required=False,
+    default="list",
+    help="how memory words are kept: list - a python list of words, "
+    "compact - 32 bit array of data words with instructions in a side table (for large -m), "
+    "paged - pages allocated on first write, shared copy-on-write by forked machines, "
+    "only they are dumped in journal (for large mostly untouched -m). "
+    "Doesn't change simulation results. Default: list",
+)
 parser.add_argument(
     "-j",
     "--journal",
@@ -97,7 +616,238 @@ parser.add_argument(
     metavar="SIZE",
     required=False,
     default=64,
-    help="size of cache in words. Must be a power of 2 and greater than 16. Default: 64",
+    help="size of cache in words. Must be a power of 2 and hold at least 4 lines without --cache-ways. Default: 64",
+)
+parser.add_argument(
+    "--cache-line",
+    dest="cache_line",
+    type=int,
+    metavar="WORDS",
+    default=LINE_SIZE,
+    help=f"size of cache line in words, a power of 2. Default: {LINE_SIZE}",
+)
+parser.add_argument(
+    "--cache-ways",
+    dest="cache_ways",
+    type=int,
+    metavar="WAYS",
+    default=None,
+    help="associativity of cache (1 for direct mapped, size / line for fully associative). Default: 1/4 of lines",
+)
+parser.add_argument(
+    "--cache-policy",
+    dest="cache_policy",
+    choices=REPLACEMENT_POLICIES.keys(),
+    default=DEFAULT_POLICY,
+    help=f"replacement policy of cache. Default: {DEFAULT_POLICY}",
+)
+parser.add_argument(
+    "--engine",
+    dest="engine",
+    choices=ENGINES.keys(),
+    required=False,
+    default="micro",
+    help="simulation engine: micro - signal by signal microcode interpretation, "
+    "compiled - precompiled micro instructions, fast - instruction by instruction with known micro routine lengths, "
+    "block - fast with basic blocks translated into python functions, "
+    "debug - fast with debugger breakpoint & watchpoint checks (see debugger.py). "
+    "All give identical output, ticks and cache miss rate. Default: micro",
+)
+parser.add_argument(
+    "-e",
+    "--events",
+    dest="events_file",
+    metavar="EVENTS",
+    required=False,
+    help="file to write structured execution events to (one json object per line). Replaces journal if both are set",
+)
+parser.add_argument(
+    "--trace",
+    dest="trace_file",
+    metavar="TRACE",
+    required=False,
+    help="file to write binary execution trace to: journal as per-tick deltas with keyframes. "
+    "Rendered into journal text & compared with binary_trace.py. Events replace it if both are set",
+)
+parser.add_argument(
+    "--save-state",
+    dest="save_state",
+    metavar="STATE",
+    required=False,
+    help="file to save the complete machine state to when simulation stops (e.g. on tick limit)",
+)
+parser.add_argument(
+    "--load-state",
+    dest="load_state",
+    metavar="STATE",
+    required=False,
+    help="start from the machine state saved with --save-state instead of SOURCE. "
+    "Ticks (and the -t limit) are counted from the start of the saved run, "
+    "non-empty -i replaces the input left unread in the saved machine",
+)
+parser.add_argument(
+    "--sample",
+    dest="sample_period",
+    type=int,
+    metavar="PERIOD",
+    required=False,
+    help="estimate ticks & cache miss rate by sampling: every PERIOD instructions a short sample is simulated "
+    "by the chosen engine, everything else is executed functionally (output is still exact). Can't be used with journal, "
+    "events, trace, profiles, stats, cache analyses & --save-state",
+)
+parser.add_argument(
+    "--sample-ticks",
+    dest="sample_ticks",
+    type=int,
+    metavar="TICKS",
+    required=False,
+    default=1000,
+    help="length of every sample in ticks (with --sample). Default: 1000",
+)
+parser.add_argument(
+    "--result-cache",
+    dest="result_cache",
+    metavar="DIR",
+    required=False,
+    help="directory of cached results: a run with the same code, input, memory & cache sizes, addresses "
+    "and tick limit isn't simulated again. Not used with journal, events or machine states",
+)
+parser.add_argument(
+    "--result-cache-size",
+    dest="result_cache_size",
+    type=int,
+    metavar="BYTES",
+    required=False,
+    default=64 * 1024 * 1024,
+    help="size limit of the result cache directory, least recently used results are evicted. Default: 64 MiB",
+)
+parser.add_argument(
+    "--result-cache-mode",
+    dest="result_cache_mode",
+    choices=["use", "bypass", "verify"],
+    required=False,
+    default="use",
+    help="use - take results from the cache, bypass - always simulate (and store the result), "
+    "verify - always simulate and fail if the stored result differs. Default: use",
+)
+parser.add_argument(
+    "--input-file",
+    dest="input_file",
+    metavar="PATH",
+    required=False,
+    help="file (or pipe) to read IO device input from as the program consumes it, - for stdin. Replaces -i",
+)
+parser.add_argument(
+    "--stream-output",
+    dest="stream_output",
+    metavar="PATH",
+    required=False,
+    help="file to write IO device output to while the program runs, - for stdout. "
+    "Streamed output isn't repeated before the final statistics",
+)
+parser.add_argument(
+    "--io-buffer",
+    dest="io_buffer",
+    type=int,
+    metavar="SIZE",
+    required=False,
+    default=4096,
+    help="how many input bytes are read & output characters are held at once with streams. Default: 4096",
+)
+parser.add_argument(
+    "--listen",
+    dest="listen",
+    metavar="ADDRESS",
+    required=False,
+    help="serve connections to a local socket (HOST:PORT for TCP or unix:PATH) instead of a single run: "
+    "every connection gets its own machine with IO device input received from it and output sent to it. "
+    "-t limits ticks of every machine",
+)
+parser.add_argument(
+    "--journal-ring",
+    dest="journal_ring",
+    type=int,
+    metavar="BLOCKS",
+    required=False,
+    help="with -j keep only the first & last BLOCKS journal blocks (separated by empty lines) in memory "
+    "and write them when simulation ends in golden logs layout, so memory use doesn't grow with ticks",
+)
+parser.add_argument(
+    "--journal-sample",
+    dest="journal_sample",
+    type=int,
+    metavar="PERIOD",
+    required=False,
+    default=0,
+    help="with --journal-ring also sample a window of BLOCKS blocks every PERIOD blocks, "
+    "the latest one before the last blocks is written in the middle. Default: 0 (no middle)",
+)
+parser.add_argument(
+    "--host-profile",
+    dest="host_profile",
+    action="store_true",
+    help="time the simulator itself: run loop, every micro signal kind, memory, cache & tracer methods. "
+    "A table of host ns per simulated tick is logged",
+)
+parser.add_argument(
+    "--host-profile-out",
+    dest="host_profile_out",
+    metavar="FILE",
+    required=False,
+    help="with --host-profile also write the timers as speedscope profile (FILE ending with .json) "
+    "or cProfile stats to be loaded by pstats (otherwise)",
+)
+parser.add_argument(
+    "--stats",
+    dest="stats",
+    choices=["json"],
+    required=False,
+    help="collect performance counters of the simulated machine: instructions & CPI, count & ticks of every opcode, "
+    "stall ticks by cause, max stack depths, read & write miss rates and executions of every micro address. "
+    "Counters need tick tracing, so instruction level engines run micro instructions then",
+)
+parser.add_argument(
+    "--stats-file",
+    dest="stats_file",
+    metavar="FILE",
+    required=False,
+    help="write --stats counters to the file. Default: stdout after the output",
+)
+parser.add_argument(
+    "--word-profile",
+    dest="word_profile",
+    metavar="FILE",
+    required=False,
+    help="attribute every tick (memory & IO waits included) to its instruction, source line and stack of "
+    "Forth words (by CALL/RET), write the stacks to FILE in collapsed format for flamegraphs "
+    "and log the top words, lines and instructions. Needs tick tracing, just as --stats",
+)
+parser.add_argument(
+    "--word-profile-top",
+    dest="word_profile_top",
+    type=int,
+    metavar="N",
+    required=False,
+    default=15,
+    help="number of words, lines and instructions in --word-profile tables. Default: 15",
+)
+parser.add_argument(
+    "--cache-heatmap",
+    dest="cache_heatmap",
+    metavar="FILE",
+    required=False,
+    help="classify cache misses as compulsory, capacity (a fully associative LRU cache of the same size misses too) "
+    "or conflict ones, log the totals and write per address & per line access/miss counters of instruction "
+    "fetches and data accesses to FILE (csv if it ends with .csv, json otherwise). Needs tick tracing, just as --stats",
+)
+parser.add_argument(
+    "--miss-curves",
+    dest="miss_curves",
+    metavar="FILE",
+    required=False,
+    help="record the cache accesses and predict LRU miss rates of all power of two cache sizes & associativities "
+    "(stack distance analysis) and ticks of the machine's cache geometry, log the table and write json plot data "
+    "to FILE. Needs tick tracing, just as --stats",
 )
 if __name__ == "__main__":
     args = parser.parse_args()
@@ -108,14 +858,26 @@ if __name__ == "__main__":
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
 
-    stdout_handler = logging.StreamHandler(sys.stdout)
-    stdout_handler.setFormatter(formatter)
-    stdout_handler.setLevel(logging.DEBUG if args.journal and not args.out_file else logging.INFO)
-    logger.addHandler(stdout_handler)
-    if args.out_file:
+    # Bounded journal replaces the whole one wherever it would go
+    ring = args.journal and args.journal_ring is not None
+    if not ring or args.out_file:
+        stdout_handler = logging.StreamHandler(sys.stdout)
+        stdout_handler.setFormatter(formatter)
+        stdout_handler.setLevel(logging.DEBUG if args.journal and not args.out_file else logging.INFO)
+        logger.addHandler(stdout_handler)
+    if args.out_file and not ring:
         file_handler = logging.FileHandler(args.out_file, mode="w", encoding="utf-8")
         file_handler.setFormatter(formatter)
         file_handler.setLevel(logging.DEBUG if args.journal else logging.INFO)
         logger.addHandler(file_handler)
+    if ring:
+        journal_stream = open(args.out_file, "w", encoding="utf-8") if args.out_file else sys.stdout
+        journal_handler = RingJournalHandler(journal_stream, args.journal_ring, args.journal_sample)
+        journal_handler.setFormatter(formatter)
+        logger.addHandler(journal_handler)
 
     main(args)
+    if ring:
+        journal_handler.close()
+        if args.out_file:
+            journal_stream.close()
@@ -0,0 +1,176 @@
+import asyncio
+import contextlib
+import io
+
+import forthc
+import pytest
+from binary_trace import TraceReader
+from control_unit import MemSignal, micro_program, opcode_to_mprog
+from isa import Opcode, write_code
+from machine import Machine, build_control_unit, main, parser, start_server
+
+
+def translate(program: str):
+    with open(f"programs/{program}", encoding="utf-8") as file:
+        return forthc.translate(file.read(), 0, 10)
+
+
+@pytest.mark.parametrize("engine", ["micro", "fast", "block"])
+def test_step(engine):
+    code = translate("hello_user_name.f")
+    expected = build_control_unit(code, "Bob\r").simulate(100000)
+    machine = Machine.from_code(code, "Bob\r", engine)
+
+    first = build_control_unit(code, "Bob\r")
+    first.step_instruction()
+    assert machine.step() == 1
+    assert machine.ticks == first._ticks
+    assert machine.pc == first._dp._PC
+    steps = 1
+    while machine.stop_reason is None:
+        steps += machine.step(100)
+    assert machine.stop_reason == "halt"
+    assert machine.step() == 0
+    assert (machine.output, machine.ticks, machine.miss_rate) == expected
+    assert steps > 100
+
+
+def test_run_until():
+    code = translate("hello_user_name.f")
+    expected = build_control_unit(code, "Bob\r").simulate(100000)
+    machine = Machine.from_code(code, "Bob\r")
+
+    assert machine.run_until(ticks=500) == "ticks"
+    assert machine.ticks == 500
+    get_name = next(instr["operand"] for instr in code if instr.get("opcode") == Opcode.CALL)
+    assert machine.run_until(pc=get_name) == "pc"
+    assert machine.pc == get_name
+    assert machine.run_until(output_contains="Hello") == "output"
+    assert machine.output.endswith("Hello")
+    assert machine.run_until() == "halt"
+    assert machine.run(100000) == expected
+
+
+def test_output_chunks():
+    code = translate("hello_user_name.f")
+    expected, _, _ = build_control_unit(code, "Bob\r").simulate(100000)
+    machine = Machine.from_code(code, "Bob\r")
+
+    chunks = list(machine.output_chunks(100000, chunk_ticks=300))
+    assert len(chunks) > 1
+    assert "".join(chunks) == expected
+
+
+def test_machines_on_one_event_loop():
+    code = translate("hello_user_name.f")
+    machines = [Machine.from_code(code, name) for name in ["Alice\r", "Bob\r"]]
+
+    async def collect(machine):
+        return [chunk async for chunk in machine.output_chunks_async(100000, chunk_ticks=300)]
+
+    async def run_all():
+        return await asyncio.gather(*[collect(machine) for machine in machines])
+
+    alice, bob = asyncio.run(run_all())
+    assert "".join(alice).endswith("Hello, Alice")
+    assert "".join(bob).endswith("Hello, Bob")
+    assert asyncio.run(machines[0].run_async(100000))[0] == "".join(alice)
+
+
+@pytest.mark.parametrize("engine", ["micro", "compiled", "fast", "block"])
+def test_input_arriving_later(engine):
+    code = translate("hello_user_name.f")
+    expected = build_control_unit(code, "Bob\r").simulate(100000)
+    machine = Machine.from_code(code, "", engine)
+
+    # Waiting for input takes no ticks
+    for char in "Bob\r":
+        assert machine.run_until() == "buffer_empty"
+        machine.control.retry_read()
+        machine.control._mem._read_buffer.append(char)
+    assert machine.run(100000) == expected
+
+
+def test_served_connections(tmp_path):
+    code = translate("hello_user_name.f")
+    address = f"unix:{tmp_path / 'machine.sock'}"
+
+    async def talk(name: str) -> str:
+        reader, writer = await asyncio.open_unix_connection(address.removeprefix("unix:"))
+        prompt = await reader.readuntil(b":")
+        # Name is only sent when asked for, so the machine has to wait for it
+        writer.write(f"{name}\r".encode())
+        rest = await reader.read()
+        writer.close()
+        return (prompt + rest).decode()
+
+    async def run_all():
+        async with await start_server(address, lambda: Machine.from_code(code), 100000):
+            return await asyncio.gather(talk("Alice"), talk("Bob"))
+
+    alice, bob = asyncio.run(run_all())
+    assert alice == build_control_unit(code, "Alice\r").simulate(100000)[0]
+    assert bob.endswith("Hello, Bob")
+
+
+@pytest.mark.parametrize(
+    ("source", "reason"),
+    [
+        ('." hi" drop', "Stack underflow"),
+        ('." hi" 1 0 /', "integer division or modulo by zero"),
+        ('." hi" : w begin 0 until ; w', "Tick limit exceeded"),
+    ],
+)
+def test_connection_stopped_with_reason(source, reason, tmp_path, caplog):
+    code = forthc.translate(source, 0, 10)
+    address = f"unix:{tmp_path / 'machine.sock'}"
+
+    async def talk() -> str:
+        reader, writer = await asyncio.open_unix_connection(address.removeprefix("unix:"))
+        received = await reader.read()
+        writer.close()
+        return received.decode()
+
+    async def run_all():
+        async with await start_server(address, lambda: Machine.from_code(code), 10000):
+            return await talk()
+
+    # Output so far is sent as well
+    assert asyncio.run(run_all()) == f"hi\nError: {reason}\n"
+    assert f"Connection stopped: {reason}" in caplog.text
+
+
+def test_trace_is_written_with_result_cache(tmp_path):
+    target = str(tmp_path / "hello.o")
+    write_code(target, translate("hello.f"))
+    for _ in range(2):
+        trace = tmp_path / "trace"
+        trace.unlink(missing_ok=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(parser.parse_args([target, "--result-cache", str(tmp_path / "results"), "--trace", str(trace)]))
+        # Both on the first run & when the result is cached
+        with TraceReader(trace) as reader:
+            assert len(reader.segments) > 0
+            assert reader.render().startswith("[JRNL] ")
+
+
+@pytest.mark.parametrize("engine", ["micro", "compiled", "fast", "block"])
+def test_retried_read_is_run_once(engine):
+    code = translate("cat.f")
+    reference = Machine.from_code(code, "", "micro")
+    machine = Machine.from_code(code, "", engine)
+    for stopped in (reference, machine):
+        assert stopped.run_until() == "buffer_empty"
+        stopped.control.retry_read()
+
+    # Rewound to the read micro instruction of FETCH routine, just like the microcoded machine
+    control = machine.control
+    read_mpc = opcode_to_mprog[Opcode.FETCH]
+    assert MemSignal.MemRD in micro_program[read_mpc]
+    assert (control._mPC, control._ticks) == (reference.control._mPC, reference.control._ticks)
+    assert control._mPC == read_mpc
+    control._mem._read_buffer.extend("ab")
+    control.advance(control._ticks + 1)
+    # Neither skipped nor repeated: one character is read & the routine goes on
+    assert control._mPC == read_mpc + 1
+    assert list(control._mem._read_buffer) == ["b"]
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
-import logging
-from collections import namedtuple
+from collections import deque
 from enum import Enum
 
 from exceptions import BufferEmptyError
+from memory_words import MEMORY_BACKENDS
+from replacement import REPLACEMENT_POLICIES
+from tracer import NULL_TRACER, Tracer
 
+# Default geometry: lines of LINE_SIZE words in ENTRIES_PER_SET sets (all the rest are ways)
 LINE_SIZE = 4
 ENTRIES_PER_SET = 4
+DEFAULT_POLICY = "bit-plru"
 
 IO_EXTRA_TICKS = 10
 MEM_EXTRA_TICKS = 10
@@ -18,6 +22,23 @@ CACHE_EXTRA_TICKS = 1
 EMPTY_LINE_TAG = -1
 
 
+def is_power_of_2(value: int) -> bool:
+    return value > 0 and value & (value - 1) == 0
+
+
+def geometry_error(size: int, line_size: int, ways: int | None) -> str | None:
+    """Why a cache can't have the geometry (see Cache), None if it can"""
+    if not is_power_of_2(size):
+        return "Cache size must be a power of 2"
+    if not is_power_of_2(line_size):
+        return "Line size must be a power of 2"
+    if ways is None:
+        return None if size > line_size * ENTRIES_PER_SET else "Set size is too small"
+    if not is_power_of_2(ways):
+        return "Ways must be a power of 2"
+    return None if size >= line_size * ways else "Cache size is too small for the ways"
+
+
 class CacheEntry:
     def __init__(self, tag: int, line: list, is_dirty: bool):
         self.tag = tag
@@ -26,97 +47,109 @@ class CacheEntry:
 
 
 class CacheSet:
-    def __init__(self):
-        self.entries = [CacheEntry(EMPTY_LINE_TAG, [0] * LINE_SIZE, False) for i in range(ENTRIES_PER_SET)]
-        self.plrum = [False] * ENTRIES_PER_SET
-
+    """Entries of one set by way and the way of every line in it by tag"""
 
-DecodedAddress = namedtuple("DecodedAdr", ["word", "line", "tag"])
+    def __init__(self, ways: int, line_size: int):
+        self.entries = [CacheEntry(EMPTY_LINE_TAG, [0] * line_size, False) for i in range(ways)]
+        self.tags = {}
 
 
 class Cache:
-    def __init__(self, set_size: int):
-        assert set_size > LINE_SIZE * ENTRIES_PER_SET, "Set size is too small"
-        assert set_size & (set_size - 1) == 0, "Set size must be a power of 2"
-
-        set_count = set_size // (LINE_SIZE * ENTRIES_PER_SET)
-
-        self._sets = [CacheSet() for j in range(set_count)]
+    """
+    Set associative cache of size words: lines of line_size words, ways lines per set
+    (by default as many as there are for ENTRIES_PER_SET sets) & a replacement policy
+    """
+
+    def __init__(self, size: int, line_size: int = LINE_SIZE, ways: int | None = None, policy: str = DEFAULT_POLICY):
+        error = geometry_error(size, line_size, ways)
+        assert error is None, error
+        if ways is None:
+            ways = size // (line_size * ENTRIES_PER_SET)
+
+        self.size = size
+        self.line_size = line_size
+        self.ways = ways
+        self.set_count = size // (line_size * ways)
+        self.policy = policy
+        self._policy = REPLACEMENT_POLICIES[policy](self.set_count, ways)
+        self._sets = [CacheSet(ways, line_size) for j in range(self.set_count)]
         self._hits = 0
         self._requests = 0
         self.prefetch_end = (
             0  # In ticks time when background prefetch ends: used to simulate prefetching parallel to execution
         )
 
-    def __decode_adr(self, adr: int) -> DecodedAddress:
-        return DecodedAddress(
-            adr % LINE_SIZE, (adr // LINE_SIZE) % ENTRIES_PER_SET, (adr // LINE_SIZE // ENTRIES_PER_SET)
-        )
-
-    def __get_hit_entries(self, dadr: DecodedAddress) -> list[tuple[CacheEntry, CacheSet]]:
-        valid = [(cache_set.entries[dadr.line], cache_set) for cache_set in self._sets]
-        return list(filter(lambda lc: lc[0].tag == dadr.tag, valid))
-
-    def __update_prlum(self, chosen_set: CacheSet, dadr: DecodedAddress):
-        chosen_set.plrum[dadr.line] = True
-        capacity_reached = all(cache_set.plrum[dadr.line] == 1 for cache_set in self._sets)
-
-        if capacity_reached:
-            for cache_set in self._sets:
-                cache_set.plrum[dadr.line] = False
-            chosen_set.plrum[dadr.line] = True  # Yes, that takes less actions than not setting it to 0
+    def __find(self, adr: int) -> tuple[int, int | None, int]:
+        """Set index, way (None if the line isn't there) & word offset of the address"""
+        line, word = divmod(adr, self.line_size)
+        tag, index = divmod(line, self.set_count)
+        return index, self._sets[index].tags.get(tag), word
 
     def read(self, adr: int) -> object:
         self._requests += 1
-        decoded = self.__decode_adr(adr)
-        hit_entries = self.__get_hit_entries(decoded)
-        if len(hit_entries) == 0:
+        index, way, word = self.__find(adr)
+        if way is None:
             return None
 
         self._hits += 1
-        entry = hit_entries[0][0]
-        chosen_set = hit_entries[0][1]
-
-        self.__update_prlum(chosen_set, decoded)
-        return entry.line[decoded.word]
+        self._policy.hit(index, way)
+        return self._sets[index].entries[way].line[word]
 
     def lookup(self, adr: int):
         # NOTE!: Doesn't get counted in hit rate
-        decoded = self.__decode_adr(adr)
-        hit_entries = self.__get_hit_entries(decoded)
-        if len(hit_entries) != 0:
-            logging.debug("%s", f"Cache hit on lookup {adr}")
-        else:
-            logging.debug("%s", f"Cache miss on lookup {adr}")
-        return len(hit_entries) != 0
+        return self.__find(adr)[1] is not None
+
+    def peek(self, adr: int) -> object:
+        # NOTE!: Neither gets counted in hit rate nor updates replacement state
+        index, way, word = self.__find(adr)
+        if way is None:
+            return None
+        return self._sets[index].entries[way].line[word]
 
     def write(self, adr: int, word: int) -> bool:
         self._requests += 1
-        decoded = self.__decode_adr(adr)
-        hit_entries = self.__get_hit_entries(decoded)
-        if len(hit_entries) == 0:
+        index, way, offset = self.__find(adr)
+        if way is None:
             return False
 
         self._hits += 1
-        entry = hit_entries[0][0]
-        chosen_set = hit_entries[0][1]
-
-        entry.line[decoded.word] = word
+        entry = self._sets[index].entries[way]
+        entry.line[offset] = word
         entry.is_dirty = True
 
-        self.__update_prlum(chosen_set, decoded)
+        self._policy.hit(index, way)
         return True
 
     def swap(self, adr: int, words: list) -> CacheEntry:
-        decoded = self.__decode_adr(adr)
+        tag, index = divmod(adr // self.line_size, self.set_count)
+        cache_set = self._sets[index]
+        way = self._policy.victim(index)
+
+        entry_for_swap = cache_set.entries[way]
+        if cache_set.tags.get(entry_for_swap.tag) == way:
+            del cache_set.tags[entry_for_swap.tag]
+        cache_set.entries[way] = CacheEntry(tag, words, False)
+        cache_set.tags[tag] = way
+        self._policy.fill(index, way)
+        return entry_for_swap
 
-        valid = [(cache_set.entries[decoded.line], cache_set) for cache_set in self._sets]
+    def line_address(self, tag: int, adr: int) -> int:
+        """Start address of the line with the tag in the set of the address"""
+        return (tag * self.set_count + (adr // self.line_size) % self.set_count) * self.line_size
 
-        entry_for_swap, cache_set = next(filter(lambda ec: not ec[1].plrum[decoded.line], valid))
-        new_entry = CacheEntry(decoded.tag, words, False)
-        cache_set.entries[decoded.line] = new_entry
-        cache_set.plrum[decoded.line] = False
-        return entry_for_swap
+    def entries(self):
+        """All entries way by way"""
+        for way in range(self.ways):
+            for cache_set in self._sets:
+                yield cache_set.entries[way]
+
+    def set_entry(self, index: int, way: int, entry: CacheEntry):
+        cache_set = self._sets[index]
+        if cache_set.tags.get(cache_set.entries[way].tag) == way:
+            del cache_set.tags[cache_set.entries[way].tag]
+        cache_set.entries[way] = entry
+        if entry.tag != EMPTY_LINE_TAG:
+            cache_set.tags[entry.tag] = way
 
 
 class ARLatch(Enum):
@@ -124,134 +157,172 @@ class ARLatch(Enum):
     ALU = 1
 
 
+def memory_repr(ar: int, data) -> str:
+    # Journal text of memory unit state (also rendered from binary traces)
+    if isinstance(data, dict):
+        instr_token = (
+            f"'{data['token']['val']}'@{data['token']['line']}:{data['token']['num']}" if "token" in data else ""
+        )
+        instr_operand = f" {data['operand']:3}" if "operand" in data else ""
+        mem_str = f"{'MEM:': >6} {data['opcode'].name}{instr_operand}\t{instr_token}"
+    else:
+        mem_str = f"{'MEM:': >6} {data}"
+    return f"{'ADR:': >6} {ar:5} {mem_str}"
+
+
 class MemoryUnit:
-    def __init__(self, io_adr: int, mem_size: int, code, read_buffer: list, cache: Cache):
+    def __init__(
+        self,
+        io_adr: int,
+        mem_size: int,
+        code,
+        read_buffer: list,
+        cache: Cache,
+        tracer: Tracer = NULL_TRACER,
+        memory_backend: str = "list",
+    ):
         self._cache = cache
+        self._tracer = tracer
+        self._tracing = tracer.enabled
 
         self._AR = 0
 
-        self._mem = [0] * mem_size
+        self._memory_backend = memory_backend
+        self._mem = MEMORY_BACKENDS[memory_backend](mem_size)
         for instr in code:
             self._mem[instr["offset"]] = instr
 
         self._data = 0
         self._IO_ADR = io_adr
         self._write_buffer = []
-        self._read_buffer = read_buffer
+        # Input characters are consumed from the left, any other queue (e.g. a stream one) is used as is
+        self._read_buffer = deque(read_buffer) if isinstance(read_buffer, list) else read_buffer
 
     def __repr__(self) -> str:
-        if isinstance(self._data, dict):
-            instr_token = (
-                f"'{self._data['token']['val']}'@{self._data['token']['line']}:{self._data['token']['num']}"
-                if "token" in self._data
-                else ""
-            )
-            instr_operand = f" {self._data['operand']:3}" if "operand" in self._data else ""
-            mem_str = f"{'MEM:': >6} {self._data['opcode'].name}{instr_operand}\t{instr_token}"
-        else:
-            mem_str = f"{'MEM:': >6} {self._data}"
-        return f"{'ADR:': >6} {self._AR:5} {mem_str}"
+        return memory_repr(self._AR, self._data)
 
-    def __fetch_and_insert(self, adr: int) -> tuple[int, object]:
+    def peek(self, adr: int) -> object:
+        """Current word on address (cached one if present) without any timing or statistics"""
+        word = self._cache.peek(adr)
+        return self._mem[adr] if word is None else word
+
+    def _fetch_and_insert(self, adr: int) -> tuple[int, object]:
         ticks = 0
 
-        line_start = adr - adr % LINE_SIZE
-        line_words = self._mem[line_start : line_start + LINE_SIZE]
+        line_size = self._cache.line_size
+        line_start = adr - adr % line_size
+        line_words = self._mem[line_start : line_start + line_size]
 
         ticks += MEM_EXTRA_TICKS
 
         swapped_entry = self._cache.swap(adr, line_words)
-        logging.debug(
-            "%s",
-            f"Cache insert {adr}",
-        )
+        if self._tracing:
+            self._tracer.cache_insert(adr)
         if swapped_entry.is_dirty:
-            swapped_adr = (
-                swapped_entry.tag * LINE_SIZE * ENTRIES_PER_SET + ((adr // LINE_SIZE) % ENTRIES_PER_SET) * LINE_SIZE
-            )
-            logging.debug(
-                "%s",
-                f"Writing evicted line {swapped_adr} to memory",
-            )
-            self._mem[swapped_adr : swapped_adr + LINE_SIZE] = swapped_entry.line
+            swapped_adr = self._cache.line_address(swapped_entry.tag, adr)
+            if self._tracing:
+                self._tracer.line_evicted(swapped_adr)
+            self._mem[swapped_adr : swapped_adr + line_size] = swapped_entry.line
             ticks += MEM_EXTRA_TICKS
-        return (ticks, line_words[adr % LINE_SIZE])
+        return (ticks, line_words[adr % line_size])
 
     def __parallel_prefetch(self, adr: int, start_tick: int):
-        logging.debug(
-            "%s",
-            f"Started PARALLEL FETCHING of {self._AR + LINE_SIZE}:",
-        )
+        if self._tracing:
+            self._tracer.prefetch_start(adr)
         prefetch_ticks = CACHE_EXTRA_TICKS  # Cache lookup ticks
-        if not self._cache.lookup(adr):
-            fetching_extra_ticks, _ = self.__fetch_and_insert(self._AR + LINE_SIZE)
+        is_hit = self._cache.lookup(adr)
+        if self._tracing:
+            self._tracer.cache_lookup(adr, is_hit)
+        if not is_hit:
+            fetching_extra_ticks, _ = self._fetch_and_insert(adr)
             prefetch_ticks += fetching_extra_ticks
         self._cache.prefetch_end = start_tick + prefetch_ticks
-        logging.debug(
-            "%s\n",
-            f"planned finish on {self._cache.prefetch_end} tick:",
-        )
+        if self._tracing:
+            self._tracer.prefetch_planned(self._cache.prefetch_end)
+
+    def __io_read(self, extra_ticks: int) -> int:
+        if len(self._read_buffer) < 1:
+            raise BufferEmptyError()
+        self._data = ord(self._read_buffer.popleft())
+        extra_ticks += IO_EXTRA_TICKS - 1  # - 1 since current tick is sort of counted
+        if self._tracing:
+            self._tracer.io_access("read", IO_EXTRA_TICKS - 1)
+            self._tracer.wait_total(extra_ticks)
+        return extra_ticks
+
+    def __io_write(self, item, extra_ticks: int) -> int:
+        self._write_buffer.append(item)
+        extra_ticks += IO_EXTRA_TICKS - 1  # - 1 since current tick is counted
+        if self._tracing:
+            self._tracer.io_access("write", IO_EXTRA_TICKS - 1)
+            self._tracer.wait_total(extra_ticks)
+        return extra_ticks
+
+    def __read_miss(self, cur_ticks: int, extra_ticks: int) -> tuple[int, object]:
+        if self._tracing:
+            self._tracer.cache_access("read", self._AR, False, CACHE_EXTRA_TICKS - 1)
+        fetching_extra_ticks, fetched_word = self._fetch_and_insert(self._AR)
+        extra_ticks += fetching_extra_ticks
+        if self._tracing:
+            self._tracer.memory_transfer("read", fetching_extra_ticks)
+
+        # Starting parallel prefetching
+        self.__parallel_prefetch(self._AR + self._cache.line_size, cur_ticks + extra_ticks)
+        return (extra_ticks, fetched_word)
+
+    def __write_miss(self, item, cur_ticks: int, extra_ticks: int) -> int:
+        if self._tracing:
+            self._tracer.cache_access("write", self._AR, False, CACHE_EXTRA_TICKS - 1)
+        fetching_extra_ticks, _ = self._fetch_and_insert(self._AR)
+        extra_ticks += fetching_extra_ticks
+        if self._tracing:
+            self._tracer.memory_transfer("write", fetching_extra_ticks)
+
+        self._cache.write(self._AR, item)
+        extra_ticks += CACHE_EXTRA_TICKS
+        if self._tracing:
+            self._tracer.cache_fill_write(CACHE_EXTRA_TICKS)
+
+        # Starting parallel prefetching
+        self.__parallel_prefetch(self._AR + self._cache.line_size, cur_ticks + extra_ticks)
+        return extra_ticks
 
     def read(self, cur_ticks: int) -> int:
         # Ticks till parallel prefetching ends
         extra_ticks = max(self._cache.prefetch_end - cur_ticks, 0)
-        logging.debug("%s", f"Prefetch finishing: {max(self._cache.prefetch_end - cur_ticks, 0)} extra ticks")
+        if self._tracing:
+            self._tracer.prefetch_wait(extra_ticks)
         if self._AR == self._IO_ADR:
-            if len(self._read_buffer) < 1:
-                raise BufferEmptyError()
-            self._data = ord(self._read_buffer.pop(0))
-            extra_ticks += IO_EXTRA_TICKS - 1  # - 1 since current tick is sort of counted
-            logging.debug("%s", f"IO read: {IO_EXTRA_TICKS - 1} extra ticks")
-            logging.debug("%s\n", f"In total CPU waited for {extra_ticks} extra ticks")
-            return extra_ticks
+            return self.__io_read(extra_ticks)
 
         word = self._cache.read(self._AR)
         extra_ticks += CACHE_EXTRA_TICKS - 1  # - 1 since current tick is sort of counted
         if word is None:
-            logging.debug("%s", f"Cache read {self._AR} miss for {CACHE_EXTRA_TICKS - 1} extra ticks")
-            fetching_extra_ticks, fetched_word = self.__fetch_and_insert(self._AR)
-            extra_ticks += fetching_extra_ticks
-            logging.debug("%s\n", f"Memory store/fetch: {fetching_extra_ticks} extra ticks")
-            word = fetched_word
-
-            # Starting parallel prefetching
-            self.__parallel_prefetch(self._AR + LINE_SIZE, cur_ticks + extra_ticks)
-        else:
-            logging.debug("%s", f"Cache read {self._AR} hit for {CACHE_EXTRA_TICKS - 1} extra ticks")
+            extra_ticks, word = self.__read_miss(cur_ticks, extra_ticks)
+        elif self._tracing:
+            self._tracer.cache_access("read", self._AR, True, CACHE_EXTRA_TICKS - 1)
 
         if isinstance(word, dict) and "word" in word:
             self._data = word["word"]
         else:
             self._data = word
-        logging.debug("%s\n", f"In total CPU waited for {extra_ticks} extra ticks")
+        if self._tracing:
+            self._tracer.wait_total(extra_ticks)
         return extra_ticks
 
     def write(self, item, cur_ticks: int) -> int:
         extra_ticks = max(self._cache.prefetch_end - cur_ticks, 0)
-        logging.debug("%s", f"Prefetch finishing: {max(self._cache.prefetch_end - cur_ticks, 0)} extra ticks")
+        if self._tracing:
+            self._tracer.prefetch_wait(extra_ticks)
         if self._AR == self._IO_ADR:
-            self._write_buffer.append(item)
-            extra_ticks += IO_EXTRA_TICKS - 1  # - 1 since current tick is counted
-            logging.debug("%s", f"IO write: {IO_EXTRA_TICKS - 1} extra ticks")
-            logging.debug("%s\n", f"In total CPU waited for {extra_ticks} extra ticks")
-            return extra_ticks
+            return self.__io_write(item, extra_ticks)
 
         is_written = self._cache.write(self._AR, item)
         extra_ticks += CACHE_EXTRA_TICKS - 1  # - 1 since current tick is counted
         if not is_written:
-            logging.debug("%s", f"Cache write {self._AR} miss for {CACHE_EXTRA_TICKS - 1} extra ticks")
-            fetching_extra_ticks, _ = self.__fetch_and_insert(self._AR)
-            extra_ticks += fetching_extra_ticks
-            logging.debug("%s", f"Memory store/fetch: {fetching_extra_ticks} extra ticks")
-
-            self._cache.write(self._AR, item)
-            extra_ticks += CACHE_EXTRA_TICKS
-            logging.debug("%s\n", f"Cache write into fetched: {CACHE_EXTRA_TICKS} extra ticks")
-
-            # Starting parallel prefetching
-            self.__parallel_prefetch(self._AR + LINE_SIZE, cur_ticks + extra_ticks)
-
-        else:
-            logging.debug("%s", f"Cache write {self._AR} hit for {CACHE_EXTRA_TICKS - 1} extra ticks")
-        logging.debug("%s\n", f"In total CPU waited for {extra_ticks} extra ticks")
+            extra_ticks = self.__write_miss(item, cur_ticks, extra_ticks)
+        elif self._tracing:
+            self._tracer.cache_access("write", self._AR, True, CACHE_EXTRA_TICKS - 1)
+        if self._tracing:
+            self._tracer.wait_total(extra_ticks)
         return extra_ticks
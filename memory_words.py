@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from array import array
+
+# Backends of MemoryUnit words (MemoryUnit._mem). Engines only index, slice & iterate
+# words, so any backend is a list-like sequence of the very same word objects:
+# ints for data, ISA dicts for instructions & declared data ({"word": n}, but
+# compact memory keeps their ints).
+
+WORD_MIN = -2147483648
+WORD_MAX = 2147483647
+
+PAGE_SIZE = 1024
+
+
+class CompactWords:
+    """
+    Data words are kept in a 32 bit array, declared data words ({"word": n}) as their
+    plain ints, so reading them needs no unwrapping (fetched as instruction they fail
+    just the same, MemoryUnit.read unwraps them anyway). Everything else (instructions
+    & ints not fitting 32 bits) is in a side table by address, marked in a bitmap.
+    Objects are stored as is, so identity based decoding of instructions keeps working
+    """
+
+    def __init__(self, mem_size: int):
+        self._words = array("i", bytes(mem_size * 4))
+        self._objects = {}
+        # 1 for addresses of side table words
+        self._is_object = bytearray(mem_size)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            # Cache lines: the array slice with side table words put in place
+            words = self._words[index].tolist()
+            is_object = self._is_object
+            if 1 in is_object[index]:
+                for offset, adr in enumerate(range(*index.indices(len(is_object)))):
+                    if is_object[adr]:
+                        words[offset] = self._objects[adr]
+            return words
+        if self._is_object[index]:
+            return self._objects[index % len(self._words)]
+        return self._words[index]
+
+    def __setitem__(self, index, value):
+        if type(index) is slice:
+            adrs = range(*index.indices(len(self._words)))
+            try:
+                words = array("i", value)
+            except (TypeError, OverflowError):
+                words = None
+            if words is None or len(words) != len(adrs) or 1 in self._is_object[index]:
+                for adr, word in zip(adrs, value, strict=True):
+                    self[adr] = word
+            else:
+                self._words[index] = words
+            return
+        if index < 0:
+            index += len(self._words)
+        if type(value) is dict and "word" in value:
+            value = value["word"]
+        if type(value) is int and WORD_MIN <= value <= WORD_MAX:
+            self._words[index] = value
+            if self._is_object[index]:
+                self._is_object[index] = 0
+                del self._objects[index]
+        else:
+            self._words[index] = 0
+            self._objects[index] = value
+            self._is_object[index] = 1
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __repr__(self) -> str:
+        # Same dump as of a list
+        return repr(list(self))
+
+    def copy(self) -> CompactWords:
+        words = CompactWords(0)
+        words._words = array("i", self._words)
+        words._objects = dict(self._objects)
+        words._is_object = bytearray(self._is_object)
+        return words
+
+
+class PagedWords:
+    """
+    Words by pages of PAGE_SIZE allocated on the first write, untouched ones read as 0.
+    Copies share pages copy-on-write: a shared page is copied by the first one writing to it
+    """
+
+    def __init__(self, mem_size: int):
+        self._size = mem_size
+        # Page number -> words
+        self._pages = {}
+        # Numbers of pages not shared with any copy
+        self._owned = set()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _address(self, index: int) -> int:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        return index
+
+    def _writable_page(self, number: int) -> list:
+        page = self._pages.get(number)
+        if number not in self._owned:
+            page = [0] * PAGE_SIZE if page is None else page.copy()
+            self._pages[number] = page
+            self._owned.add(number)
+        return page
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._size)
+            number = start // PAGE_SIZE
+            if step == 1 and start < stop and (stop - 1) // PAGE_SIZE == number:
+                # Cache lines never cross pages
+                page = self._pages.get(number)
+                offset = number * PAGE_SIZE
+                return [0] * (stop - start) if page is None else page[start - offset : stop - offset]
+            return [self[adr] for adr in range(start, stop, step)]
+        index = self._address(index)
+        page = self._pages.get(index // PAGE_SIZE)
+        return 0 if page is None else page[index % PAGE_SIZE]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            for adr, word in zip(range(*index.indices(self._size)), value, strict=True):
+                self[adr] = word
+            return
+        index = self._address(index)
+        self._writable_page(index // PAGE_SIZE)[index % PAGE_SIZE] = value
+
+    def __iter__(self):
+        for start in range(0, self._size, PAGE_SIZE):
+            yield from self[start : min(start + PAGE_SIZE, self._size)]
+
+    def populated(self) -> dict[int, list]:
+        """Words of allocated pages by page start address"""
+        return {
+            number * PAGE_SIZE: page[: self._size - number * PAGE_SIZE] for number, page in sorted(self._pages.items())
+        }
+
+    def __repr__(self) -> str:
+        # Dump of allocated pages only
+        return repr(self.populated())
+
+    def copy(self) -> PagedWords:
+        words = PagedWords(self._size)
+        words._pages = dict(self._pages)
+        # All pages are shared from now on
+        self._owned.clear()
+        return words
+
+
+MEMORY_BACKENDS = {
+    "list": lambda mem_size: [0] * mem_size,
+    "compact": CompactWords,
+    "paged": PagedWords,
+}
@@ -0,0 +1,118 @@
+import csv
+import json
+import logging
+from collections import OrderedDict
+
+from memory_unit import LINE_SIZE
+from tracer import Tracer
+
+# Cache miss classification (the three Cs) and access heat maps. Every demand
+# miss is compulsory if its line was never brought into the cache before,
+# capacity if a fully associative LRU cache of the same number of lines misses
+# it too and conflict otherwise, i.e. it is caused by the set mapping &
+# replacement. Lines filled by prefetch go to the shadow cache and count as
+# touched just as they do in the real one. Accesses on micro address 0 are
+# instruction fetches, all the others are data ones (IO device ones aren't
+# cache accesses at all).
+
+MISS_KINDS = ("compulsory", "capacity", "conflict")
+ACCESS_KINDS = ("instruction", "data")
+# Counter columns of heat maps
+COUNTERS = ("accesses", "misses", *MISS_KINDS)
+
+
+class MissClassifier(Tracer):
+    """Misses by kind & per address/line heat maps of instruction and data accesses"""
+
+    enabled = True
+
+    def __init__(self):
+        # Access kind -> address -> counters (same order as COUNTERS)
+        self.addresses = {kind: {} for kind in ACCESS_KINDS}
+        self._shadow = OrderedDict()
+        self._capacity = None
+        self._line_size = LINE_SIZE
+        self._touched = set()
+        self._fetching = False
+
+    def _shadow_insert(self, line: int):
+        self._touched.add(line)
+        self._shadow[line] = True
+        self._shadow.move_to_end(line)
+        if len(self._shadow) > self._capacity:
+            self._shadow.popitem(last=False)
+
+    def tick(self, control_unit):
+        if self._capacity is None:
+            cache = control_unit._mem._cache
+            self._capacity = cache.set_count * cache.ways
+            self._line_size = cache.line_size
+        # Instruction is fetched on the very first tick of FETCH routine
+        self._fetching = control_unit._mPC == 0
+
+    def cache_access(self, op: str, adr: int, hit: bool, ticks: int):
+        line = adr // self._line_size
+        counters = self.addresses["instruction" if self._fetching else "data"].setdefault(adr, [0] * len(COUNTERS))
+        counters[0] += 1
+        if not hit:
+            counters[1] += 1
+            if line not in self._touched:
+                counters[2] += 1
+            elif line not in self._shadow:
+                counters[3] += 1
+            else:
+                counters[4] += 1
+        self._shadow_insert(line)
+
+    def cache_insert(self, adr: int):
+        # Demand fills are already in, prefetch ones are put in here
+        self._shadow_insert(adr // self._line_size)
+
+    def lines(self, kind: str) -> dict:
+        """Line start address -> counters"""
+        lines = {}
+        for adr, counters in self.addresses[kind].items():
+            line = lines.setdefault(adr - adr % self._line_size, [0] * len(COUNTERS))
+            for i, count in enumerate(counters):
+                line[i] += count
+        return lines
+
+    def totals(self) -> dict:
+        totals = {}
+        for kind in ACCESS_KINDS:
+            counters = [sum(column) for column in zip(*self.addresses[kind].values())] or [0] * len(COUNTERS)
+            totals[kind] = dict(zip(COUNTERS, counters))
+        return totals
+
+    def report(self) -> dict:
+        def heat(counters_by_adr: dict) -> dict:
+            return {adr: dict(zip(COUNTERS, counters)) for adr, counters in sorted(counters_by_adr.items())}
+
+        return {
+            "totals": self.totals(),
+            "addresses": {kind: heat(self.addresses[kind]) for kind in ACCESS_KINDS},
+            "lines": {kind: heat(self.lines(kind)) for kind in ACCESS_KINDS},
+        }
+
+    def summary(self) -> str:
+        rows = []
+        for kind, totals in self.totals().items():
+            misses = max(totals["misses"], 1)
+            kinds = ", ".join(f"{miss_kind} {totals[miss_kind] / misses:.1%}" for miss_kind in MISS_KINDS)
+            rows.append(f"Cache {kind} accesses: {totals['accesses']}, misses: {totals['misses']} ({kinds})")
+        return "\n".join(rows)
+
+    def export(self, file: str):
+        """Csv rows (kind, granularity, address, counters) if file name ends with .csv, json otherwise"""
+        if file.endswith(".csv"):
+            with open(file, "w", encoding="utf-8", newline="") as out:
+                writer = csv.writer(out)
+                writer.writerow(["kind", "granularity", "address", *COUNTERS])
+                for kind in ACCESS_KINDS:
+                    for granularity, counters_by_adr in (("address", self.addresses[kind]), ("line", self.lines(kind))):
+                        for adr, counters in sorted(counters_by_adr.items()):
+                            writer.writerow([kind, granularity, adr, *counters])
+        else:
+            with open(file, "w", encoding="utf-8") as out:
+                json.dump(self.report(), out, indent=2)
+        logging.info("Cache heat map is written to %s", file)
@@ -0,0 +1,55 @@
+import csv
+import json
+
+import forthc
+import machine
+import pytest
+from miss_classifier import MISS_KINDS, MissClassifier
+
+INPUT = "banananmanandotherwordstocheckcacheefficient\r"
+
+
+def classify(program: str, cache_size: int) -> tuple[MissClassifier, object]:
+    with open(f"programs/{program}.f", encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    classifier = MissClassifier()
+    control = machine.build_control_unit(code, INPUT, "fast", cache_size=cache_size, tracer=classifier)
+    control.simulate(300000)
+    return classifier, control._mem._cache
+
+
+@pytest.mark.parametrize("program", ["bubble_sort", "ping_pong"])
+def test_misses_are_classified(program):
+    classifier, cache = classify(program, 32)
+    totals = classifier.totals()
+    misses = sum(kind["misses"] for kind in totals.values())
+    # Cache counts a write miss as a miss and a hit of the write into the fetched line
+    assert misses == cache._requests - cache._hits
+    for kind in totals.values():
+        assert sum(kind[miss_kind] for miss_kind in MISS_KINDS) == kind["misses"]
+    assert totals["instruction"]["accesses"] > totals["data"]["accesses"] > 0
+    assert all(totals["instruction"][miss_kind] > 0 for miss_kind in MISS_KINDS)
+
+
+def test_whole_memory_cache_has_no_capacity_misses():
+    classifier, _ = classify("bubble_sort", 1024)
+    for kind in classifier.totals().values():
+        # Bit-PLRU may still replace a used line while an empty one is there
+        assert kind["capacity"] == 0
+        assert kind["compulsory"] > kind["conflict"]
+
+
+def test_heat_map_exports(tmp_path):
+    classifier, _ = classify("ping_pong", 32)
+    classifier.export(str(tmp_path / "heat.csv"))
+    classifier.export(str(tmp_path / "heat.json"))
+
+    with open(tmp_path / "heat.csv", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    report = json.loads((tmp_path / "heat.json").read_text(encoding="utf-8"))
+    for kind, totals in report["totals"].items():
+        for granularity in ("address", "line"):
+            kind_rows = [row for row in rows if row["kind"] == kind and row["granularity"] == granularity]
+            assert sum(int(row["misses"]) for row in kind_rows) == totals["misses"]
+        lines = report["lines"][kind].values()
+        assert sum(line["accesses"] for line in lines) == totals["accesses"]
@@ -0,0 +1,123 @@
+from control_unit import micro_program
+from memory_unit import MEM_EXTRA_TICKS
+from tracer import Tracer
+
+# Performance counters of the simulated machine collected from tracer events.
+# Instructions are told apart on micro address 0 (start of instruction fetch):
+# an instruction takes all the ticks (memory waits included) till the next one
+# starts, its opcode is the one in IR by then. Stall ticks are the extra ticks
+# of memory accesses split by what the processor waits for.
+
+STALL_CAUSES = ("prefetch", "io", "cache", "memory_fetch", "write_back")
+
+
+class PerfCounters(Tracer):
+    """Counters of the run, report() gives them as a json-ready dict"""
+
+    enabled = True
+
+    def __init__(self):
+        self.micro_counts = [0] * len(micro_program)
+        # Opcode -> [count, ticks]
+        self.opcodes = {}
+        self.stalls = dict.fromkeys(STALL_CAUSES, 0)
+        self.max_ds_depth = 0
+        self.max_rs_depth = 0
+        # Demand accesses only: (reads, read misses, writes, write misses)
+        self.accesses = {"read": [0, 0], "write": [0, 0]}
+        self.prefetches = [0, 0]
+        self.instructions = 0
+        self.ticks = 0
+        self._first_tick = None
+        # Tick the current instruction has started on
+        self._instruction_start = None
+        self._prefetching = False
+        self._written_back = False
+
+    def _retire(self, ir, end_tick: int):
+        counter = self.opcodes.setdefault(ir["opcode"].value, [0, 0])
+        counter[0] += 1
+        counter[1] += end_tick - self._instruction_start
+        self.instructions += 1
+
+    def tick(self, control_unit):
+        mpc = control_unit._mPC
+        ticks = control_unit._ticks
+        dp = control_unit._dp
+        if self._first_tick is None:
+            self._first_tick = ticks
+        if mpc == 0:
+            if self._instruction_start is not None:
+                self._retire(dp._IR, ticks)
+            self._instruction_start = ticks
+        self.micro_counts[mpc] += 1
+        self.max_ds_depth = max(self.max_ds_depth, len(dp._DS.stack))
+        self.max_rs_depth = max(self.max_rs_depth, len(dp._RS.stack))
+
+    def prefetch_wait(self, ticks: int):
+        self.stalls["prefetch"] += ticks
+
+    def io_access(self, op: str, ticks: int):
+        self.stalls["io"] += ticks
+
+    def cache_access(self, op: str, adr: int, hit: bool, ticks: int):
+        counter = self.accesses[op]
+        counter[0] += 1
+        counter[1] += 0 if hit else 1
+        self.stalls["cache"] += ticks
+        self._written_back = False
+
+    def line_evicted(self, adr: int):
+        # Write back during prefetch doesn't stall by itself
+        if not self._prefetching:
+            self._written_back = True
+
+    def memory_transfer(self, op: str, ticks: int):
+        write_back = MEM_EXTRA_TICKS if self._written_back else 0
+        self.stalls["write_back"] += write_back
+        self.stalls["memory_fetch"] += ticks - write_back
+
+    def cache_fill_write(self, ticks: int):
+        self.stalls["cache"] += ticks
+
+    def prefetch_start(self, adr: int):
+        self._prefetching = True
+
+    def cache_lookup(self, adr: int, hit: bool):
+        self.prefetches[0] += 1
+        self.prefetches[1] += 0 if hit else 1
+
+    def prefetch_planned(self, tick: int):
+        self._prefetching = False
+
+    def finish(self, control_unit, output: str):
+        if control_unit._stop_reason == "halt" and self._instruction_start is not None:
+            self._retire(control_unit._dp._IR, control_unit._ticks)
+            self._instruction_start = None
+        self.ticks = control_unit._ticks - (self._first_tick or 0)
+
+    def report(self) -> dict:
+        (reads, read_misses), (writes, write_misses) = self.accesses["read"], self.accesses["write"]
+        return {
+            "ticks": self.ticks,
+            "instructions": self.instructions,
+            "cpi": self.ticks / self.instructions if self.instructions else None,
+            "opcodes": {
+                opcode: {"count": count, "ticks": ticks, "cpi": ticks / count}
+                for opcode, (count, ticks) in sorted(self.opcodes.items(), key=lambda item: -item[1][1])
+            },
+            "stall_ticks": {"total": sum(self.stalls.values()), **self.stalls},
+            "max_ds_depth": self.max_ds_depth,
+            "max_rs_depth": self.max_rs_depth,
+            "cache": {
+                "reads": reads,
+                "read_misses": read_misses,
+                "read_miss_rate": read_misses / reads if reads else 0.0,
+                "writes": writes,
+                "write_misses": write_misses,
+                "write_miss_rate": write_misses / writes if writes else 0.0,
+                "prefetch_lookups": self.prefetches[0],
+                "prefetch_misses": self.prefetches[1],
+            },
+            "micro_address_counts": self.micro_counts,
+        }
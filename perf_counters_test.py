@@ -0,0 +1,62 @@
+import contextlib
+import io
+import json
+
+import forthc
+import machine
+import pytest
+from isa import write_code
+from perf_counters import PerfCounters
+from tracer import EventTracer, TeeTracer
+
+PROGRAMS = {"bubble_sort": "banananmanandotherwordstocheckcacheefficient\r", "factorial": "", "cat": "Lorem"}
+
+
+@pytest.mark.parametrize("program", PROGRAMS)
+def test_counters_add_up(program):
+    with open(f"programs/{program}.f", encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    counters = PerfCounters()
+    events = EventTracer()
+    control = machine.build_control_unit(code, PROGRAMS[program], "micro", cache_size=32)
+    control._tracer = control._mem._tracer = TeeTracer(counters, events)
+    control._mem._tracing = True
+    _, ticks, _ = control.simulate(300000)
+    stats = counters.report()
+
+    assert stats["ticks"] == ticks
+    # Unfinished instruction isn't retired
+    retired_ticks = ticks if control._stop_reason == "halt" else counters._instruction_start
+    assert sum(opcode["ticks"] for opcode in stats["opcodes"].values()) == retired_ticks
+    assert sum(opcode["count"] for opcode in stats["opcodes"].values()) == stats["instructions"]
+    assert stats["stall_ticks"]["total"] == sum(
+        event["ticks"] for event in events.events if event["event"] == "wait_total"
+    )
+    assert sum(stats["micro_address_counts"]) == sum(event["event"] == "tick" for event in events.events)
+    assert stats["max_ds_depth"] == max(event["ds_depth"] for event in events.events if event["event"] == "tick")
+
+    cache = control._mem._cache
+    accesses = stats["cache"]
+    # Cache counts a write miss twice: as a miss and as the write into the fetched line
+    assert accesses["reads"] + accesses["writes"] + accesses["write_misses"] == cache._requests
+    assert accesses["read_misses"] + accesses["write_misses"] == cache._requests - cache._hits
+
+
+def test_stats_json_is_same_for_all_engines(tmp_path):
+    target = str(tmp_path / "factorial.o")
+    with open("programs/factorial.f", encoding="utf-8") as file:
+        write_code(target, forthc.translate(file.read(), 0, 10))
+
+    def stats(engine: str) -> dict:
+        with contextlib.redirect_stdout(io.StringIO()):
+            machine.main(
+                machine.parser.parse_args(
+                    [target, "--engine", engine, "--stats", "json", "--stats-file", str(tmp_path / "stats.json")]
+                )
+            )
+        return json.loads((tmp_path / "stats.json").read_text(encoding="utf-8"))
+
+    micro = stats("micro")
+    assert micro["instructions"] > 0
+    assert micro["opcodes"]["halt"]["count"] == 1
+    assert all(stats(engine) == micro for engine in ["compiled", "fast", "block"])
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import random
+from collections import OrderedDict
+
+# Replacement policies of Cache. A policy keeps its own state for every set of
+# the cache: hit() is called on every read & write hit of a way, victim() picks
+# the way to put a new line into on a miss (empty ways are just never used ones)
+# and fill() is called once the line is there. Hits are O(1) (O(log ways) for
+# tree-PLRU), only choosing a victim may go through the ways of the set.
+#
+# state() is json-able and load() takes it back (see snapshots).
+
+
+class BitPLRU:
+    """
+    Bit pseudo-LRU (MRU bits): a hit sets the bit of its way, all the others are cleared
+    once all are set. The first way with clear bit is replaced, a filled line has clear bit
+    """
+
+    def __init__(self, set_count: int, ways: int):
+        self.bits = [[False] * ways for _ in range(set_count)]
+        # Set bits of every set
+        self._set = [0] * set_count
+
+    def hit(self, index: int, way: int):
+        bits = self.bits[index]
+        if bits[way]:
+            return
+        bits[way] = True
+        self._set[index] += 1
+        if self._set[index] == len(bits):
+            bits[:] = [False] * len(bits)
+            bits[way] = True
+            self._set[index] = 1
+
+    def victim(self, index: int) -> int:
+        # All bits are set only with a single way
+        return next((way for way, bit in enumerate(self.bits[index]) if not bit), 0)
+
+    def fill(self, index: int, way: int):
+        bits = self.bits[index]
+        if bits[way]:
+            bits[way] = False
+            self._set[index] -= 1
+
+    def state(self):
+        return self.bits
+
+    def load(self, state):
+        self.bits = [[bool(bit) for bit in bits] for bits in state]
+        self._set = [sum(bits) for bits in self.bits]
+
+
+class TreePLRU:
+    """Binary tree of ways-1 bits per set, every bit points to the half less recently used"""
+
+    def __init__(self, set_count: int, ways: int):
+        assert ways & (ways - 1) == 0, "Tree-PLRU needs a power of 2 ways"
+        self._ways = ways
+        # Heap ordered nodes: children of node i are 2i + 1 (bit 0) and 2i + 2 (bit 1)
+        self.nodes = [[0] * (ways - 1) for _ in range(set_count)]
+
+    def hit(self, index: int, way: int):
+        nodes = self.nodes[index]
+        node = way + self._ways - 1
+        while node > 0:
+            parent = (node - 1) // 2
+            # Pointing away from the used half
+            nodes[parent] = 1 if node == 2 * parent + 1 else 0
+            node = parent
+
+    def victim(self, index: int) -> int:
+        nodes = self.nodes[index]
+        node = 0
+        while node < self._ways - 1:
+            node = 2 * node + 1 + nodes[node]
+        return node - (self._ways - 1)
+
+    def fill(self, index: int, way: int):
+        self.hit(index, way)
+
+    def state(self):
+        return self.nodes
+
+    def load(self, state):
+        self.nodes = [list(nodes) for nodes in state]
+
+
+class LRU:
+    """True LRU: ways of every set in order of use, the least recently used one first"""
+
+    def __init__(self, set_count: int, ways: int):
+        self.orders = [OrderedDict.fromkeys(range(ways)) for _ in range(set_count)]
+
+    def hit(self, index: int, way: int):
+        self.orders[index].move_to_end(way)
+
+    def victim(self, index: int) -> int:
+        return next(iter(self.orders[index]))
+
+    def fill(self, index: int, way: int):
+        self.orders[index].move_to_end(way)
+
+    def state(self):
+        return [list(order) for order in self.orders]
+
+    def load(self, state):
+        self.orders = [OrderedDict.fromkeys(order) for order in state]
+
+
+class FIFO:
+    """Ways are replaced round robin, hits change nothing"""
+
+    def __init__(self, set_count: int, ways: int):
+        self._ways = ways
+        self.next = [0] * set_count
+
+    def hit(self, index: int, way: int):
+        pass
+
+    def victim(self, index: int) -> int:
+        return self.next[index]
+
+    def fill(self, index: int, way: int):
+        self.next[index] = (way + 1) % self._ways
+
+    def state(self):
+        return self.next
+
+    def load(self, state):
+        self.next = list(state)
+
+
+class RandomReplacement:
+    """Empty ways are filled first, then a random way is replaced (seeded, so runs are repeatable)"""
+
+    def __init__(self, set_count: int, ways: int, seed: int = 0):
+        self._ways = ways
+        self._random = random.Random(seed)
+        self.filled = [0] * set_count
+
+    def hit(self, index: int, way: int):
+        pass
+
+    def victim(self, index: int) -> int:
+        filled = self.filled[index]
+        return filled if filled < self._ways else self._random.randrange(self._ways)
+
+    def fill(self, index: int, way: int):
+        if self.filled[index] < self._ways:
+            self.filled[index] += 1
+
+    def state(self):
+        version, internal, gauss = self._random.getstate()
+        return {"filled": self.filled, "random": [version, list(internal), gauss]}
+
+    def load(self, state):
+        self.filled = list(state["filled"])
+        version, internal, gauss = state["random"]
+        self._random.setstate((version, tuple(internal), gauss))
+
+
+class SRRIP:
+    """
+    Static re-reference interval prediction: 2 bit prediction per way, a hit predicts near
+    re-reference (0), a filled line a long one (2). The first way predicted distant (3) is
+    replaced, all predictions age until there is one
+    """
+
+    DISTANT = 3
+
+    def __init__(self, set_count: int, ways: int):
+        self.predictions = [[self.DISTANT] * ways for _ in range(set_count)]
+
+    def hit(self, index: int, way: int):
+        self.predictions[index][way] = 0
+
+    def victim(self, index: int) -> int:
+        predictions = self.predictions[index]
+        age = self.DISTANT - max(predictions)
+        if age:
+            predictions[:] = [prediction + age for prediction in predictions]
+        return predictions.index(self.DISTANT)
+
+    def fill(self, index: int, way: int):
+        self.predictions[index][way] = self.DISTANT - 1
+
+    def state(self):
+        return self.predictions
+
+    def load(self, state):
+        self.predictions = [list(predictions) for predictions in state]
+
+
+REPLACEMENT_POLICIES = {
+    "bit-plru": BitPLRU,
+    "tree-plru": TreePLRU,
+    "lru": LRU,
+    "fifo": FIFO,
+    "random": RandomReplacement,
+    "rrip": SRRIP,
+}
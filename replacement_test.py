@@ -0,0 +1,115 @@
+import contextlib
+import io
+import logging
+import random
+
+import forthc
+import machine
+import pytest
+import snapshot
+from isa import write_code
+from memory_unit import Cache
+from replacement import REPLACEMENT_POLICIES
+from stack_distance_test import lru_misses
+
+
+def cache_misses(cache: Cache, addresses) -> int:
+    misses = 0
+    for adr in addresses:
+        if cache.read(adr) is None:
+            misses += 1
+            line_start = adr - adr % cache.line_size
+            cache.swap(adr, list(range(line_start, line_start + cache.line_size)))
+    return misses
+
+
+@pytest.mark.parametrize(("size", "line_size", "ways"), [(64, 4, 4), (64, 8, 1), (32, 2, 16)])
+def test_lru_matches_lru_simulation(size, line_size, ways):
+    rng = random.Random(0)
+    addresses = [rng.choice([rng.randrange(96), rng.randrange(1024)]) for _ in range(3000)]
+    cache = Cache(size, line_size, ways, "lru")
+    lines = [adr // line_size for adr in addresses]
+    assert cache_misses(cache, addresses) == lru_misses(lines, cache.set_count, ways)
+
+
+@pytest.mark.parametrize("policy", REPLACEMENT_POLICIES.keys())
+def test_policy_keeps_lines_consistent(policy):
+    rng = random.Random(1)
+    cache = Cache(64, 4, 4, policy)
+    for _ in range(2000):
+        adr = rng.randrange(512)
+        word = cache.read(adr)
+        if word is None:
+            line_start = adr - adr % cache.line_size
+            cache.swap(adr, list(range(line_start, line_start + cache.line_size)))
+        else:
+            assert word == adr
+    # No line is in a set twice & the tags point to their ways
+    for cache_set in cache._sets:
+        assert {cache_set.entries[way].tag: way for way in cache_set.tags.values()} == cache_set.tags
+
+
+@pytest.mark.parametrize("engine", [engine for engine in machine.ENGINES if engine != "micro"])
+@pytest.mark.parametrize("policy", REPLACEMENT_POLICIES.keys())
+def test_engine_matches_microcode_with_policy(policy, engine, caplog):
+    caplog.set_level(logging.INFO)
+    with open("programs/bubble_sort.f", encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    buffer = "banananmanandotherwordstocheckcacheefficient\r"
+
+    def simulate(engine: str):
+        control = machine.build_control_unit(
+            code, buffer, engine, cache_size=32, cache_line=2, cache_ways=4, cache_policy=policy
+        )
+        return control.simulate(300000)
+
+    assert simulate(engine) == simulate("micro")
+
+
+@pytest.mark.parametrize("policy", REPLACEMENT_POLICIES.keys())
+def test_policy_is_restored(policy, caplog):
+    caplog.set_level(logging.INFO)
+    with open("programs/bubble_sort.f", encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    config = {"cache_size": 32, "cache_line": 2, "cache_ways": 4, "cache_policy": policy}
+    expected = machine.build_control_unit(code, "banana\r", **config).simulate(300000)
+    control = machine.build_control_unit(code, "banana\r", "fast", **config)
+    control.simulate(3001)
+
+    restored = snapshot.restore_state(snapshot.save_state(control), machine.ENGINES["fast"])
+    assert (restored._mem._cache.policy, restored._mem._cache.ways) == (policy, 4)
+    assert restored.simulate(300000) == expected
+
+
+def test_cache_options(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    target = str(tmp_path / "cat.o")
+    with open("programs/cat.f", encoding="utf-8") as file:
+        write_code(target, forthc.translate(file.read(), 0, 10))
+
+    def run(options: list) -> str:
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            machine.main(machine.parser.parse_args(["-i", "Lorem Ipsum", target, *options]))
+        return stdout.getvalue()
+
+    default = run([]).splitlines()
+    configured = run(["--cache-line", "8", "--cache-ways", "1", "--cache-policy", "fifo"]).splitlines()
+    # Same output, other cache stats
+    assert configured[0] == default[0] == "Lorem Ipsum"
+    assert configured[1] != default[1]
+
+
+@pytest.mark.parametrize(
+    ("options", "error"),
+    [
+        (["--cache-ways", "3"], "Ways must be a power of 2"),
+        (["--cache-line", "3"], "Line size must be a power of 2"),
+        (["-c", "48"], "Cache size must be a power of 2"),
+        (["-c", "16"], "Set size is too small"),
+        (["-c", "16", "--cache-ways", "8"], "Cache size is too small for the ways"),
+    ],
+)
+def test_invalid_cache_geometry_is_rejected(options, error, capsys):
+    with pytest.raises(SystemExit):
+        machine.main(machine.parser.parse_args(["programs/cat.f", *options]))
+    assert error in capsys.readouterr().err
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import pathlib
+import tempfile
+
+# On-disk cache of simulation results. Entries are json files named by a hash of
+# everything result depends on: code image, input & machine configuration. Every
+# engine gives the very same result, so the engine isn't a part of the key.
+# File modification time is the last use time for LRU eviction.
+
+# Bumped whenever results of the same inputs could change
+RESULT_KEY_VERSION = 1
+
+
+def result_key(
+    code,
+    buffer: str,
+    mem_size: int,
+    cache_size: int,
+    start_adr: int,
+    io_adr: int,
+    tick_limit: int,
+    cache_config: dict | None = None,
+) -> str:
+    """cache_config (geometry & replacement policy) is keyed only if given, so the default cache keys are the same"""
+    key = {
+        "version": RESULT_KEY_VERSION,
+        "code": code,
+        "input": buffer,
+        "mem_size": mem_size,
+        "cache_size": cache_size,
+        "start_adr": start_adr,
+        "io_adr": io_adr,
+        "tick_limit": tick_limit,
+    }
+    if cache_config is not None:
+        key["cache"] = cache_config
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Results by key in a directory, least recently used ones are evicted when over max_bytes"""
+
+    def __init__(self, directory, max_bytes: int):
+        self._dir = pathlib.Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self._dir / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            result = json.loads(path.read_text(encoding="utf-8"))
+            # Marking as recently used
+            path.touch()
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return result
+
+    def put(self, key: str, result: dict):
+        # Written to a temporary file first, so that no one ever reads a partial entry
+        with tempfile.NamedTemporaryFile("w", dir=self._dir, suffix=".tmp", delete=False, encoding="utf-8") as file:
+            json.dump(result, file)
+        pathlib.Path(file.name).replace(self._path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self._dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self._max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,51 @@
+import contextlib
+import io
+import json
+import logging
+import os
+
+import forthc
+import machine
+import pytest
+from exceptions import ResultCacheMismatchError
+from isa import write_code
+from result_cache import ResultCache
+
+
+def test_machine_result_cache(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    target = str(tmp_path / "cat.o")
+    with open("programs/cat.f", encoding="utf-8") as file:
+        write_code(target, forthc.translate(file.read(), 0, 10))
+    cache_dir = tmp_path / "results"
+
+    def run(*options: str) -> str:
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            machine.main(machine.parser.parse_args([*options, "-i", "Lorem", "--result-cache", str(cache_dir), target]))
+        return stdout.getvalue()
+
+    expected = run()
+    [entry] = cache_dir.glob("*.json")
+    assert json.loads(entry.read_text(encoding="utf-8"))["output"] == "Lorem"
+
+    # Stored result is used as is
+    entry.write_text(json.dumps({"output": "Ipsum", "ticks": 1, "miss_rate": 0.5, "stop": "halt"}), encoding="utf-8")
+    assert run("--engine", "fast") == "Ipsum\nCache miss rate: 50.000% Ticks: 1\n"
+    with pytest.raises(ResultCacheMismatchError):
+        run("--result-cache-mode", "verify")
+    assert run("--result-cache-mode", "bypass") == expected
+    assert run("--result-cache-mode", "verify") == expected
+
+
+def test_result_cache_eviction(tmp_path):
+    results = ResultCache(tmp_path, 2 * len(json.dumps({"output": "a"})))
+    results.put("a", {"output": "a"})
+    results.put("b", {"output": "b"})
+    os.utime(tmp_path / "a.json", (1000, 1000))
+    os.utime(tmp_path / "b.json", (2000, 2000))
+
+    assert results.get("a") == {"output": "a"}
+    results.put("c", {"output": "c"})
+    assert results.get("b") is None
+    assert results.get("a") == {"output": "a"}
+    assert results.get("c") == {"output": "c"}
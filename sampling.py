@@ -0,0 +1,178 @@
+import math
+
+from control_unit import ControlUnit
+from datapath import Datapath
+from exceptions import BufferEmptyError, HaltError
+from fast_unit import FastControlUnit
+from memory_unit import MemoryUnit
+from tracer import Tracer
+
+# Sampled simulation: most of the execution is fast-forwarded functionally
+# (instruction by instruction, no timing at all) while cache still goes through
+# every state change it would, so it is warm whenever a detailed sample starts.
+# Samples are short cycle accurate runs of a ControlUnit on the very same
+# machine. Ticks per instruction & miss rate are estimated from samples and
+# extrapolated over the fast-forwarded instructions.
+
+# Normal quantile for the 95% confidence interval
+CONFIDENCE_Z = 1.96
+
+
+class FunctionalMemoryUnit(MemoryUnit):
+    """
+    MemoryUnit without timing: the same memory, IO & cache state changes (line fills,
+    write backs, prefetched lines and PLRU) of the given memory unit, but no ticks are counted
+    """
+
+    def __init__(self, memory: MemoryUnit):
+        super().__init__(memory._IO_ADR, 0, [], memory._read_buffer, memory._cache)
+        self._mem = memory._mem
+        self._write_buffer = memory._write_buffer
+
+    def _prefetch(self, adr: int):
+        if not self._cache.lookup(adr):
+            self._fetch_and_insert(adr)
+
+    def read(self, cur_ticks: int) -> int:
+        if self._AR == self._IO_ADR:
+            if len(self._read_buffer) < 1:
+                raise BufferEmptyError()
+            self._data = ord(self._read_buffer.popleft())
+            return 0
+
+        word = self._cache.read(self._AR)
+        if word is None:
+            _, word = self._fetch_and_insert(self._AR)
+            self._prefetch(self._AR + self._cache.line_size)
+        self._data = word["word"] if isinstance(word, dict) and "word" in word else word
+        return 0
+
+    def write(self, item, cur_ticks: int) -> int:
+        if self._AR == self._IO_ADR:
+            self._write_buffer.append(item)
+            return 0
+
+        if not self._cache.write(self._AR, item):
+            self._fetch_and_insert(self._AR)
+            self._cache.write(self._AR, item)
+            self._prefetch(self._AR + self._cache.line_size)
+        return 0
+
+
+class InstructionCounter(Tracer):
+    enabled = True
+
+    def __init__(self):
+        self.count = 0
+
+    def tick(self, control_unit):
+        if control_unit._mPC == 0:
+            self.count += 1
+
+
+def ratio_estimate(samples: list[tuple[int, int]]) -> tuple[float, float]:
+    """Ratio of sums of sampled (numerator, denominator) pairs and half width of its confidence interval"""
+    numerator = sum(num for num, _ in samples)
+    denominator = sum(den for _, den in samples)
+    if denominator == 0:
+        return (0.0, math.inf)
+    ratio = numerator / denominator
+    if len(samples) < 2:
+        return (ratio, math.inf)
+    variance = sum((num - ratio * den) ** 2 for num, den in samples) / (len(samples) - 1)
+    return (ratio, CONFIDENCE_Z * math.sqrt(variance / len(samples)) / (denominator / len(samples)))
+
+
+class SampledSimulation:
+    """
+    Every period instructions a sample of at least sample_ticks ticks (up to the
+    instruction boundary) is simulated by control_class, all the rest is fast-forwarded
+    """
+
+    def __init__(
+        self,
+        datapath: Datapath,
+        memory: MemoryUnit,
+        period: int = 10000,
+        sample_ticks: int = 1000,
+        control_class=ControlUnit,
+    ):
+        assert period > 0, "Sampling period must be positive"
+        assert sample_ticks > 0, "Sample length must be positive"
+        self._dp = datapath
+        self._mem = memory
+        self._period = period
+        self._sample_ticks = sample_ticks
+        self._control_class = control_class
+        self._functional = FastControlUnit(datapath, FunctionalMemoryUnit(memory))
+        # Fast-forwarded instructions
+        self._instructions = 0
+        # (instructions, ticks, cache requests, cache misses) of every sample
+        self._samples = []
+        # Why simulation stopped: "halt", "buffer_empty" or "tick_limit"
+        self._stop_reason = None
+
+    def _fast_forward(self, count: int):
+        control = self._functional
+        dp = self._dp
+        mem = control._mem
+        decoded = control._decoded
+        for _ in range(count):
+            mem._AR = dp._PC
+            mem.read(0)
+            ir = mem._data
+            dp._IR = ir
+            dp._PC += 1
+            self._instructions += 1
+
+            entry = decoded.get(id(ir))
+            handler = entry[1] if entry is not None and entry[0] is ir else control._decode(ir)
+            handler(control, dp, ir)
+
+    def _sample(self):
+        cache = self._mem._cache
+        # Nothing is being prefetched after fast-forwarding
+        cache.prefetch_end = 0
+        requests = cache._requests
+        misses = cache._requests - cache._hits
+        counter = InstructionCounter()
+        control = self._control_class(self._dp, self._mem, counter)
+        try:
+            control._run_traced(self._sample_ticks)
+            while control._mPC != 0:
+                control._run_traced(control._ticks + 1)
+        finally:
+            self._samples.append(
+                (counter.count, control._ticks, cache._requests - requests, cache._requests - cache._hits - misses)
+            )
+
+    def estimate(self) -> dict:
+        """Estimated ticks & miss rate with their 95% confidence interval half widths"""
+        cpi, cpi_error = ratio_estimate([(ticks, count) for count, ticks, _, _ in self._samples])
+        miss_rate, miss_rate_error = ratio_estimate([(misses, requests) for _, _, requests, misses in self._samples])
+        sampled_ticks = sum(ticks for _, ticks, _, _ in self._samples)
+        # Nothing fast-forwarded: the whole run is simulated in detail
+        exact = self._instructions == 0
+        return {
+            "ticks": round(sampled_ticks + cpi * self._instructions),
+            "ticks_error": 0.0 if exact else cpi_error * self._instructions,
+            "miss_rate": miss_rate,
+            "miss_rate_error": 0.0 if exact else miss_rate_error,
+            "instructions": self._instructions + sum(count for count, _, _, _ in self._samples),
+            "samples": len(self._samples),
+        }
+
+    def simulate(self, tick_limit: int) -> dict:
+        try:
+            while self.estimate()["ticks"] < tick_limit:
+                self._sample()
+                # Not fast-forwarding (much) further than the tick limit
+                cpi, _ = ratio_estimate([(ticks, count) for count, ticks, _, _ in self._samples])
+                remaining = (tick_limit - self.estimate()["ticks"]) / cpi if cpi > 0 else self._period
+                self._fast_forward(min(self._period, max(0, math.ceil(remaining))))
+            self._stop_reason = "tick_limit"
+        except HaltError:
+            self._stop_reason = "halt"
+        except BufferEmptyError:
+            self._stop_reason = "buffer_empty"
+        return {"output": "".join(map(chr, self._mem._write_buffer)), "stop": self._stop_reason, **self.estimate()}
@@ -0,0 +1,92 @@
+import contextlib
+import io
+import logging
+import math
+
+import forthc
+import machine
+import pytest
+from isa import write_code
+from sampling import SampledSimulation, ratio_estimate
+
+PROGRAM_INPUTS = {
+    "bubble_sort.f": "banananmanandotherwordstocheckcacheefficient\r",
+    "prob1.f": "",
+}
+
+
+@pytest.mark.parametrize("program", sorted(PROGRAM_INPUTS))
+def test_sampled_estimate(program, caplog):
+    caplog.set_level(logging.INFO)
+    with open(f"programs/{program}", encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    buffer = PROGRAM_INPUTS[program]
+    output, ticks, miss_rate = machine.build_control_unit(code, buffer, "fast").simulate(10**7)
+
+    control = machine.build_control_unit(code, buffer)
+    result = SampledSimulation(control._dp, control._mem, 2000, 300).simulate(10**7)
+    assert result["output"] == output
+    assert result["stop"] == "halt"
+    assert result["samples"] > 2
+    assert abs(result["ticks"] - ticks) <= result["ticks_error"]
+    assert abs(result["miss_rate"] - miss_rate) <= result["miss_rate_error"]
+
+
+def test_sampled_tick_limit(caplog):
+    caplog.set_level(logging.INFO)
+    with open("programs/prob1.f", encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    control = machine.build_control_unit(code)
+
+    result = SampledSimulation(control._dp, control._mem, 1000, 200).simulate(20000)
+    assert result["stop"] == "tick_limit"
+    assert 20000 <= result["ticks"] < 21000
+
+
+def test_ratio_estimate():
+    assert ratio_estimate([]) == (0.0, math.inf)
+    assert ratio_estimate([(10, 2)]) == (5.0, math.inf)
+    assert ratio_estimate([(10, 2), (20, 4)]) == (5.0, 0.0)
+    ratio, error = ratio_estimate([(10, 2), (12, 2)])
+    assert ratio == 5.5
+    assert error == pytest.approx(1.96 * 1 / 2)
+
+
+def test_program_shorter_than_sample(caplog):
+    caplog.set_level(logging.INFO)
+    with open("programs/hello.f", encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    output, ticks, miss_rate = machine.build_control_unit(code).simulate(100000)
+
+    # Whole run is a single sample, so it is exact
+    control = machine.build_control_unit(code)
+    result = SampledSimulation(control._dp, control._mem, 1000, 100000).simulate(100000)
+    assert (result["output"], result["ticks"], result["miss_rate"]) == (output, ticks, miss_rate)
+    assert result["samples"] == 1
+    assert result["ticks_error"] == result["miss_rate_error"] == 0.0
+
+
+def test_single_sample_error_is_not_available(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    target = str(tmp_path / "hello.o")
+    with open("programs/hello.f", encoding="utf-8") as file:
+        write_code(target, forthc.translate(file.read(), 0, 10))
+
+    def run(options: list) -> str:
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            machine.main(machine.parser.parse_args([target, *options]))
+        return stdout.getvalue()
+
+    assert "Ticks: 742 ± 0 " in run(["--sample", "1000", "--sample-ticks", "100000"])
+    # One sample, the rest is fast-forwarded
+    estimated = run(["--sample", "100000", "--sample-ticks", "100"])
+    assert "% ± n/a% Ticks: " in estimated
+    assert " ± n/a (estimated from 1 samples" in estimated
+
+
+@pytest.mark.parametrize("option", [["-j"], ["--trace", "trace"], ["--stats", "json"], ["--save-state", "state"]])
+def test_detailed_options_are_rejected(option, capsys):
+    # Nothing is simulated in detail to journal, trace, count or save
+    with pytest.raises(SystemExit):
+        machine.main(machine.parser.parse_args(["programs/hello.f", "--sample", "100", *option]))
+    assert "can't be used with --sample" in capsys.readouterr().err
@@ -0,0 +1,213 @@
+import gzip
+import json
+
+from control_unit import ControlUnit
+from datapath import Datapath, Stack
+from isa import Opcode
+from memory_unit import Cache, CacheEntry, MemoryUnit
+from memory_words import PagedWords
+from tracer import NULL_TRACER, Tracer
+
+# Machine state is a plain json document (gzipped in snapshot files).
+# Instructions & data word dicts are stored once in "objects" and referenced
+# as [index] from memory, cache lines and registers, so restored machine shares
+# the very same objects between them just as the running one did.
+
+# 2: cache geometry & replacement policy state
+SNAPSHOT_VERSION = 2
+
+
+class ObjectTable:
+    def __init__(self):
+        self.objects = []
+        self._refs = {}
+
+    def encode(self, value):
+        if not isinstance(value, dict):
+            return value
+        ref = self._refs.get(id(value))
+        if ref is None:
+            ref = self._refs[id(value)] = len(self.objects)
+            self.objects.append(value)
+        return [ref]
+
+
+def decode_objects(objects: list) -> list:
+    objects = [dict(obj) for obj in objects]
+    for obj in objects:
+        if "opcode" in obj:
+            obj["opcode"] = Opcode(obj["opcode"])
+    return objects
+
+
+def stack_state(stack: Stack, table: ObjectTable) -> dict:
+    return {
+        "size": stack._size,
+        "stack": [table.encode(item) for item in stack.stack],
+        "data": table.encode(stack._data),
+    }
+
+
+def restore_stack(state: dict, decode) -> Stack:
+    stack = Stack(state["size"])
+    stack.stack = [decode(item) for item in state["stack"]]
+    stack._data = decode(state["data"])
+    return stack
+
+
+def words_state(words, table: ObjectTable) -> dict:
+    if isinstance(words, PagedWords):
+        # Only allocated pages
+        pages = [[start, [table.encode(word) for word in page]] for start, page in words.populated().items()]
+        return {"mem_size": len(words), "pages": pages}
+    return {"mem": [table.encode(word) for word in words]}
+
+
+def restore_words(memory: MemoryUnit, state: dict, decode):
+    if "pages" in state:
+        for start, page in state["pages"]:
+            memory._mem[start : start + len(page)] = [decode(word) for word in page]
+    else:
+        memory._mem[:] = [decode(word) for word in state["mem"]]
+
+
+def save_state(control: ControlUnit, table: ObjectTable | None = None, words: bool = True) -> dict:
+    """
+    Complete state of the machine: control unit, datapath, memory unit & cache.
+    Memory words are left out if words is False
+    """
+    table = table or ObjectTable()
+    dp = control._dp
+    mem = control._mem
+    cache = mem._cache
+    return {
+        "version": SNAPSHOT_VERSION,
+        "control": {"mpc": control._mPC, "ticks": control._ticks},
+        "datapath": {
+            "tos": table.encode(dp._TOS),
+            "alu": dp._ALU,
+            "n": dp._N,
+            "z": dp._Z,
+            "v": dp._V,
+            "ir": table.encode(dp._IR),
+            "pc": dp._PC,
+            "ds": stack_state(dp._DS, table),
+            "rs": stack_state(dp._RS, table),
+        },
+        "memory": {
+            "io_adr": mem._IO_ADR,
+            "ar": mem._AR,
+            "data": table.encode(mem._data),
+            "backend": mem._memory_backend,
+            **(words_state(mem._mem, table) if words else {}),
+            "read_buffer": "".join(mem._read_buffer),
+            "write_buffer": list(mem._write_buffer),
+        },
+        "cache": {
+            "size": cache.size,
+            "line_size": cache.line_size,
+            "ways": cache.ways,
+            "policy": cache.policy,
+            "sets": [
+                {
+                    "entries": [
+                        {"tag": entry.tag, "line": [table.encode(word) for word in entry.line], "dirty": entry.is_dirty}
+                        for entry in cache_set.entries
+                    ]
+                }
+                for cache_set in cache._sets
+            ],
+            "replacement": cache._policy.state(),
+            "hits": cache._hits,
+            "requests": cache._requests,
+            "prefetch_end": cache.prefetch_end,
+        },
+        "objects": table.objects,
+    }
+
+
+def restore_cache(state: dict, decode) -> Cache:
+    def entry(entry_state: dict) -> CacheEntry:
+        return CacheEntry(entry_state["tag"], [decode(word) for word in entry_state["line"]], entry_state["dirty"])
+
+    cache = Cache(state["size"], state["line_size"], state["ways"], state["policy"])
+    for index, set_state in enumerate(state["sets"]):
+        for way, entry_state in enumerate(set_state["entries"]):
+            cache.set_entry(index, way, entry(entry_state))
+    cache._policy.load(state["replacement"])
+    cache._hits = state["hits"]
+    cache._requests = state["requests"]
+    cache.prefetch_end = state["prefetch_end"]
+    return cache
+
+
+def restore_state(
+    state: dict, control_class=ControlUnit, tracer: Tracer = NULL_TRACER, buffer: str | None = None
+) -> ControlUnit:
+    """
+    A new machine in the saved state. Every call gives an independent machine,
+    so many runs can be forked from one state. If buffer is given, it replaces
+    the input left unread in the saved machine
+    """
+    assert state["version"] == SNAPSHOT_VERSION, f"Unsupported snapshot version: {state['version']}"
+    return restore_objects(state, decode_objects(state["objects"]), control_class, tracer, buffer)
+
+
+def restore_objects(
+    state: dict, objects: list, control_class, tracer: Tracer, buffer: str | None, words=None
+) -> ControlUnit:
+    def decode(value):
+        return objects[value[0]] if isinstance(value, list) else value
+
+    cache = restore_cache(state["cache"], decode)
+    mem_state = state["memory"]
+    read_buffer = [*(mem_state["read_buffer"] if buffer is None else buffer)]
+    # States saved before memory backends were added have list ones
+    backend = mem_state.get("backend", "list")
+    if words is None:
+        mem_size = mem_state["mem_size"] if "pages" in mem_state else len(mem_state["mem"])
+        memory = MemoryUnit(mem_state["io_adr"], mem_size, [], read_buffer, cache, tracer, backend)
+        restore_words(memory, mem_state, decode)
+    else:
+        memory = MemoryUnit(mem_state["io_adr"], 0, [], read_buffer, cache, tracer, backend)
+        memory._mem = words
+    memory._AR = mem_state["ar"]
+    memory._data = decode(mem_state["data"])
+    memory._write_buffer = list(mem_state["write_buffer"])
+
+    dp_state = state["datapath"]
+    datapath = Datapath(dp_state["pc"], memory)
+    datapath._TOS = decode(dp_state["tos"])
+    datapath._ALU = dp_state["alu"]
+    datapath._N = dp_state["n"]
+    datapath._Z = dp_state["z"]
+    datapath._V = dp_state["v"]
+    datapath._IR = decode(dp_state["ir"])
+    datapath._DS = restore_stack(dp_state["ds"], decode)
+    datapath._RS = restore_stack(dp_state["rs"], decode)
+
+    control = control_class(datapath, memory, tracer)
+    control._mPC = state["control"]["mpc"]
+    control._ticks = state["control"]["ticks"]
+    return control
+
+
+def fork(control: ControlUnit, control_class=None, tracer: Tracer = NULL_TRACER) -> ControlUnit:
+    """
+    An independent copy of the running machine (of the same class by default). Memory words
+    are copied by their backend, so paged memory pages are shared copy-on-write
+    """
+    table = ObjectTable()
+    state = save_state(control, table, words=False)
+    # Objects are immutable, so they are shared as is
+    return restore_objects(state, table.objects, control_class or type(control), tracer, None, control._mem._mem.copy())
+
+
+def write_snapshot(file, control: ControlUnit):
+    with gzip.open(file, "wt", encoding="utf-8") as file:
+        json.dump(save_state(control), file, separators=(",", ":"))
+
+
+def read_snapshot(file) -> dict:
+    with gzip.open(file, "rt", encoding="utf-8") as file:
+        return json.load(file)
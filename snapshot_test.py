@@ -0,0 +1,131 @@
+import contextlib
+import io
+import logging
+
+import forthc
+import machine
+import pytest
+import snapshot
+from isa import write_code
+from memory_words import MEMORY_BACKENDS
+
+
+def translate(program: str):
+    with open(f"programs/{program}", encoding="utf-8") as file:
+        return forthc.translate(file.read(), 0, 10)
+
+
+@pytest.mark.parametrize("engine", machine.ENGINES.keys())
+def test_restored_machine_runs_on(engine, tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    code = translate("bubble_sort.f")
+    buffer = "banananmanandotherwordstocheckcacheefficient\r"
+    expected = machine.build_control_unit(code, buffer).simulate(300000)
+
+    # 3001 is in the middle of an instruction
+    control = machine.build_control_unit(code, buffer, engine)
+    control.simulate(3001)
+    snapshot.write_snapshot(tmp_path / "state", control)
+
+    restored = snapshot.restore_state(snapshot.read_snapshot(tmp_path / "state"), machine.ENGINES[engine])
+    assert restored.simulate(300000) == expected
+
+
+def test_forked_runs(caplog):
+    caplog.set_level(logging.INFO)
+    code = translate("hello_user_name.f")
+    # Greeting is printed, but nothing is read yet
+    control = machine.build_control_unit(code, "", "fast")
+    control.simulate(2000)
+    state = snapshot.save_state(control)
+
+    for name in ["Alice\r", "Bob\r"]:
+        forked = snapshot.restore_state(state, machine.ENGINES["fast"], buffer=name)
+        assert forked.simulate(300000) == machine.build_control_unit(code, name).simulate(300000)
+
+
+def test_machine_save_and_load_state(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    target = str(tmp_path / "cat.o")
+    write_code(target, translate("cat.f"))
+    state = str(tmp_path / "state")
+
+    def run(options: list) -> str:
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            machine.main(machine.parser.parse_args(options))
+        return stdout.getvalue()
+
+    expected = run(["-i", "Lorem Ipsum", target])
+    run(["-i", "Lorem Ipsum", "-t", "500", "--save-state", state, target])
+    assert run(["--load-state", state, "--engine", "block"]) == expected
+
+
+def test_memory_backend_is_restored(caplog):
+    caplog.set_level(logging.INFO)
+    code = translate("bubble_sort.f")
+    expected = machine.build_control_unit(code, "banana\r").simulate(300000)
+    control = machine.build_control_unit(code, "banana\r", "fast", memory_backend="compact")
+    control.simulate(3001)
+
+    restored = snapshot.restore_state(snapshot.save_state(control), machine.ENGINES["fast"])
+    assert restored._mem._memory_backend == "compact"
+    assert restored.simulate(300000) == expected
+
+
+@pytest.mark.parametrize("memory_backend", MEMORY_BACKENDS.keys())
+def test_fork(memory_backend, caplog):
+    caplog.set_level(logging.INFO)
+    code = translate("bubble_sort.f")
+    expected = machine.build_control_unit(code, "banana\r", "fast", mem_size=1 << 20)
+    expected_result = expected.simulate(300000)
+    control = machine.build_control_unit(code, "banana\r", "fast", mem_size=1 << 20, memory_backend=memory_backend)
+    control.simulate(3001)
+
+    forked = snapshot.fork(control)
+    assert forked.simulate(300000) == expected_result
+    assert control.simulate(300000) == expected_result
+    assert list(forked._mem._mem) == list(control._mem._mem) == expected._mem._mem
+
+
+def test_paged_memory_is_shared_and_saved_by_pages(caplog):
+    caplog.set_level(logging.INFO)
+    code = translate("bubble_sort.f")
+    control = machine.build_control_unit(code, "banana\r", "fast", mem_size=1 << 24, memory_backend="paged")
+    control.simulate(3001)
+    words = control._mem._mem
+    assert list(words.populated()) == [0]
+
+    forked = snapshot.fork(control)
+    assert forked._mem._mem._pages[0] is words._pages[0]
+    forked._mem._mem[5] = 1
+    assert forked._mem._mem._pages[0] is not words._pages[0]
+    assert words[5] == 0
+
+    state = snapshot.save_state(control)
+    assert "mem" not in state["memory"]
+    restored = snapshot.restore_state(state, machine.ENGINES["fast"])
+    assert restored.simulate(300000) == control.simulate(300000)
+    assert restored._mem._mem.populated() == control._mem._mem.populated()
+
+
+@pytest.mark.parametrize("option", [["--input-file", "input"], ["--stream-output", "-"]])
+def test_streams_are_not_saved(option, tmp_path, capsys):
+    target = str(tmp_path / "cat.o")
+    write_code(target, translate("cat.f"))
+    with pytest.raises(SystemExit):
+        machine.main(machine.parser.parse_args([target, "--save-state", str(tmp_path / "state"), *option]))
+    assert "--save-state can't be used with --input-file or --stream-output" in capsys.readouterr().err
+    assert not (tmp_path / "state").exists()
+
+
+def test_other_version_is_rejected():
+    state = snapshot.save_state(machine.build_control_unit(translate("cat.f")))
+    state["version"] = 1
+    with pytest.raises(AssertionError, match="Unsupported snapshot version: 1"):
+        snapshot.restore_state(state)
+
+
+def test_source_or_state_is_required(capsys):
+    with pytest.raises(SystemExit):
+        machine.main(machine.parser.parse_args(["-i", "abc"]))
+    assert "Either SOURCE or --load-state is required" in capsys.readouterr().err
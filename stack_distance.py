@@ -0,0 +1,250 @@
+import argparse
+import json
+import logging
+from array import array
+
+from memory_unit import ENTRIES_PER_SET, LINE_SIZE, Cache, geometry_error
+from tracer import Tracer
+
+# Stack distance (Mattson) analysis: the demand access stream of one run gives
+# LRU miss rates of every cache size & associativity. An access hits an LRU set
+# of A lines if fewer than A other lines of its set were accessed since the same
+# line was, so a histogram of such distances per number of sets gives misses of
+# all associativities at once. Distances are counted with a Fenwick tree over
+# the accesses of a set: the latest access of every line is marked in it.
+#
+# Miss rates are of demand accesses (reads & writes) under LRU without prefetch,
+# the machine's cache (its number of sets, whatever replacement policy, next line
+# prefetch) is predicted by the same geometry. Ticks are predicted with the
+# memory transfer ticks per miss of the recorded run.
+
+ASSOCIATIVITIES = (1, 2, 4, 8, 16)
+
+
+class Fenwick:
+    def __init__(self, size: int):
+        self._tree = [0] * (size + 1)
+
+    def add(self, i: int, delta: int):
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        """Sum of items 0..i"""
+        i += 1
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+def distance_histograms(lines, set_counts) -> dict:
+    """
+    Set count -> cold accesses & histogram of LRU stack distances within sets (line % set count),
+    all of them in a single pass over the lines
+    """
+    # Set count -> Fenwick trees, accesses & distinct lines of every set so far
+    states = {}
+    for set_count in set_counts:
+        accesses = [0] * set_count
+        for line in lines:
+            accesses[line % set_count] += 1
+        states[set_count] = ([Fenwick(count) for count in accesses], [0] * set_count, [0] * set_count)
+    last = {set_count: {} for set_count in set_counts}
+    cold = dict.fromkeys(set_counts, 0)
+    histograms = {set_count: [0] for set_count in set_counts}
+    # Repeated accesses of a line have distance 0 in every geometry, they are only counted
+    repeats = 0
+    previous_line = None
+    for line in lines:
+        if line == previous_line:
+            repeats += 1
+            continue
+        previous_line = line
+        for set_count, (trees, times, active) in states.items():
+            index = line % set_count
+            tree = trees[index]
+            time = times[index]
+            times[index] = time + 1
+            previous = last[set_count].get(line)
+            if previous is None:
+                cold[set_count] += 1
+                active[index] += 1
+            else:
+                # Lines of the set accessed after the previous access of this one
+                distance = active[index] - tree.prefix(previous)
+                histogram = histograms[set_count]
+                if distance >= len(histogram):
+                    histogram.extend([0] * (distance + 1 - len(histogram)))
+                histogram[distance] += 1
+                tree.add(previous, -1)
+            tree.add(time, 1)
+            last[set_count][line] = time
+    for histogram in histograms.values():
+        histogram[0] += repeats
+    return {set_count: (cold[set_count], histograms[set_count]) for set_count in set_counts}
+
+
+class AddressRecorder(Tracer):
+    """Demand accesses (as line numbers) with the run figures needed for tick prediction"""
+
+    enabled = True
+
+    def __init__(self, line_size: int = LINE_SIZE, set_count: int = ENTRIES_PER_SET):
+        self.addresses = array("q")
+        self.misses = 0
+        self.transfer_ticks = 0
+        self.ticks = 0
+        self.cache_size = None
+        # Geometry of the recorded cache (given for events, taken from the machine on finish)
+        self.line_size = line_size
+        self.set_count = set_count
+
+    def cache_access(self, op: str, adr: int, hit: bool, ticks: int):
+        self.addresses.append(adr)
+        self.misses += 0 if hit else 1
+
+    def memory_transfer(self, op: str, ticks: int):
+        self.transfer_ticks += ticks
+
+    def finish(self, control_unit, output: str):
+        cache = control_unit._mem._cache
+        self.ticks = control_unit._ticks
+        self.cache_size = cache.size
+        self.line_size = cache.line_size
+        self.set_count = cache.set_count
+
+
+def read_events(file, line_size: int = LINE_SIZE, set_count: int = ENTRIES_PER_SET) -> AddressRecorder:
+    """Recorder filled from --events jsonl of a run"""
+    recorder = AddressRecorder(line_size, set_count)
+    for line in file:
+        event = json.loads(line)
+        if event["event"] == "cache_access":
+            recorder.cache_access(event["op"], event["adr"], event["hit"], event["ticks"])
+        elif event["event"] == "memory_transfer":
+            recorder.memory_transfer(event["op"], event["ticks"])
+        elif event["event"] == "finish":
+            recorder.ticks = event["tick"]
+    return recorder
+
+
+def miss_curves(recorder: AddressRecorder, cache_size: int | None = None) -> dict:
+    """
+    Misses of power of two cache sizes (in words) for every associativity, fully associative
+    and the machine geometry. cache_size (recorded one by default) is the base of tick prediction
+    """
+    line_size = recorder.line_size
+    lines = [adr // line_size for adr in recorder.addresses]
+    accesses = len(lines)
+    base_size = cache_size or recorder.cache_size
+    # Sizes up to holding every line accessed (and at least up to the base one)
+    max_lines = 1
+    while max_lines < max(len(set(lines)), (base_size or 0) // line_size):
+        max_lines *= 2
+    sizes = [line_size * 2**k for k in range(max_lines.bit_length())]
+    histograms = distance_histograms(lines, [2**k for k in range(max_lines.bit_length())])
+
+    def misses(set_count: int, ways: int) -> int:
+        cold, histogram = histograms[set_count]
+        return cold + sum(histogram[ways:])
+
+    curves = {str(ways): {} for ways in ASSOCIATIVITIES}
+    curves["full"] = {}
+    curves["machine"] = {}
+    for size in sizes:
+        size_lines = size // line_size
+        for ways in ASSOCIATIVITIES:
+            if ways <= size_lines:
+                curves[str(ways)][size] = misses(size_lines // ways, ways)
+        curves["full"][size] = misses(1, size_lines)
+        if size_lines >= recorder.set_count:
+            curves["machine"][size] = misses(recorder.set_count, size_lines // recorder.set_count)
+
+    # Memory transfer ticks per miss of the recorded run
+    penalty = recorder.transfer_ticks / recorder.misses if recorder.misses else 0
+    base = curves["machine"].get(base_size)
+    predicted = {}
+    if base is not None and recorder.ticks:
+        predicted = {
+            size: round(recorder.ticks + (count - base) * penalty) for size, count in curves["machine"].items()
+        }
+    return {
+        "accesses": accesses,
+        "sizes": sizes,
+        "misses": curves,
+        "miss_rates": {
+            geometry: {size: count / accesses for size, count in counts.items()} if accesses else {}
+            for geometry, counts in curves.items()
+        },
+        "miss_penalty": penalty,
+        "base_cache_size": base_size,
+        "predicted_ticks": predicted,
+    }
+
+
+def format_table(curves: dict) -> str:
+    geometries = list(curves["miss_rates"])
+    names = [f"{geometry}-way" if geometry.isdigit() else geometry for geometry in geometries]
+    rows = [
+        f"Stack distance analysis: {curves['accesses']} accesses, {curves['miss_penalty']:.1f} ticks per miss",
+        f"{'size':>6} " + " ".join(f"{name:>8}" for name in names) + f" {'ticks':>10}",
+    ]
+    for size in curves["sizes"]:
+        rates = [curves["miss_rates"][geometry].get(size) for geometry in geometries]
+        cells = " ".join(f"{'-':>8}" if rate is None else f"{rate:>8.2%}" for rate in rates)
+        ticks = curves["predicted_ticks"].get(size)
+        marker = " *" if size == curves["base_cache_size"] else ""
+        rows.append(f"{size:>6} {cells} {'-' if ticks is None else ticks:>10}{marker}")
+    return "\n".join(rows)
+
+
+def write_curves(file: str, curves: dict):
+    with open(file, "w", encoding="utf-8") as out:
+        json.dump(curves, out, indent=2)
+    logging.info("Miss curves are written to %s", file)
+
+
+def main(args):
+    cache_error = geometry_error(args.cache_size, args.line_size, args.ways)
+    if cache_error is not None:
+        parser.error(cache_error)
+    cache = Cache(args.cache_size, args.line_size, args.ways)
+    with open(args.events_file, encoding="utf-8") as file:
+        recorder = read_events(file, cache.line_size, cache.set_count)
+    curves = miss_curves(recorder, args.cache_size)
+    print(format_table(curves))
+    if args.out_file:
+        write_curves(args.out_file, curves)
+
+
+parser = argparse.ArgumentParser(description="Miss rates of all cache sizes from the accesses of one run")
+parser.add_argument("events_file", metavar="EVENTS", help="events jsonl written by machine.py --events")
+parser.add_argument(
+    "-c",
+    "--cache_size",
+    dest="cache_size",
+    type=int,
+    required=True,
+    help="cache size of the recorded run (ticks are predicted relative to it)",
+)
+parser.add_argument(
+    "--cache-line",
+    dest="line_size",
+    type=int,
+    default=LINE_SIZE,
+    help=f"cache line size of the recorded run. Default: {LINE_SIZE}",
+)
+parser.add_argument(
+    "--cache-ways",
+    dest="ways",
+    type=int,
+    help=f"cache ways of the recorded run. Default: as many as there are for {ENTRIES_PER_SET} sets",
+)
+parser.add_argument("-o", "--output_file", dest="out_file", metavar="OUT", help="file to write json curves to")
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    main(parser.parse_args())
@@ -0,0 +1,69 @@
+import contextlib
+import io
+import json
+import random
+from collections import OrderedDict
+
+import forthc
+import machine
+import pytest
+import stack_distance
+from isa import write_code
+from memory_unit import LINE_SIZE
+
+
+def lru_misses(lines, set_count: int, ways: int) -> int:
+    sets = [OrderedDict() for _ in range(set_count)]
+    misses = 0
+    for line in lines:
+        cache_set = sets[line % set_count]
+        if line in cache_set:
+            cache_set.move_to_end(line)
+            continue
+        misses += 1
+        cache_set[line] = True
+        if len(cache_set) > ways:
+            cache_set.popitem(last=False)
+    return misses
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_misses_match_lru_simulation(seed):
+    rng = random.Random(seed)
+    recorder = stack_distance.AddressRecorder()
+    for _ in range(3000):
+        # Some locality, so that all the distances show up
+        adr = rng.choice([rng.randrange(64), rng.randrange(1024)])
+        recorder.cache_access("read", adr, True, 0)
+    curves = stack_distance.miss_curves(recorder)
+    lines = [adr // LINE_SIZE for adr in recorder.addresses]
+    for size in curves["sizes"]:
+        size_lines = size // LINE_SIZE
+        assert curves["misses"]["full"][size] == lru_misses(lines, 1, size_lines)
+        for ways in stack_distance.ASSOCIATIVITIES:
+            if ways <= size_lines:
+                assert curves["misses"][str(ways)][size] == lru_misses(lines, size_lines // ways, ways)
+
+
+def test_curves_from_run_and_events_are_same(tmp_path):
+    target = str(tmp_path / "bubble_sort.o")
+    with open("programs/bubble_sort.f", encoding="utf-8") as file:
+        write_code(target, forthc.translate(file.read(), 0, 10))
+    common = [target, "-i", "banananmanandotherwordstocheckcacheefficient\r", "-c", "64"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.main(machine.parser.parse_args([*common, "--miss-curves", str(tmp_path / "curves.json")]))
+        machine.main(machine.parser.parse_args([*common, "--events", str(tmp_path / "events.jsonl")]))
+        stack_distance.main(
+            stack_distance.parser.parse_args(
+                [str(tmp_path / "events.jsonl"), "-c", "64", "-o", str(tmp_path / "from_events.json")]
+            )
+        )
+    curves = json.loads((tmp_path / "curves.json").read_text(encoding="utf-8"))
+    assert curves == json.loads((tmp_path / "from_events.json").read_text(encoding="utf-8"))
+    # Bigger caches never miss more & the base size predicts the recorded run
+    machine_misses = list(curves["misses"]["machine"].values())
+    assert machine_misses == sorted(machine_misses, reverse=True)
+    events = (tmp_path / "events.jsonl").read_text(encoding="utf-8").splitlines()
+    finish = json.loads(events[-1])
+    assert finish["event"] == "finish"
+    assert curves["predicted_ticks"]["64"] == finish["tick"]
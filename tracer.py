@@ -0,0 +1,238 @@
+import logging
+
+# Tracers receive everything the machine wants to tell about its execution:
+# per-tick state and the memory/cache events happening in between.
+# Units only call a tracer when it's enabled, so with the base (no-op)
+# tracer nothing gets formatted or even called on a tick
+
+
+class Tracer:
+    """No-op tracer. Base for all the others"""
+
+    enabled = False
+
+    def tick(self, control_unit):
+        pass
+
+    def prefetch_wait(self, ticks: int):
+        pass
+
+    def io_access(self, op: str, ticks: int):
+        pass
+
+    def cache_access(self, op: str, adr: int, hit: bool, ticks: int):
+        pass
+
+    def memory_transfer(self, op: str, ticks: int):
+        pass
+
+    def cache_fill_write(self, ticks: int):
+        pass
+
+    def cache_insert(self, adr: int):
+        pass
+
+    def line_evicted(self, adr: int):
+        pass
+
+    def prefetch_start(self, adr: int):
+        pass
+
+    def cache_lookup(self, adr: int, hit: bool):
+        pass
+
+    def prefetch_planned(self, tick: int):
+        pass
+
+    def wait_total(self, ticks: int):
+        pass
+
+    def finish(self, control_unit, output: str):
+        pass
+
+
+NULL_TRACER = Tracer()
+
+
+class JournalTracer(Tracer):
+    """Human readable journal written through logging on DEBUG (JRNL) level"""
+
+    enabled = True
+
+    def __init__(self, log=logging.debug):
+        # Called as logging.debug is, e.g. to render the journal from a binary trace
+        self._log = log
+
+    def tick(self, control_unit):
+        # Separating journal entry into lines for readability
+        lines = str(control_unit).split("\n")
+        for line in lines[:-1]:
+            self._log("%s", line)
+        self._log("%s\n", lines[-1])
+
+    def prefetch_wait(self, ticks: int):
+        self._log("Prefetch finishing: %d extra ticks", ticks)
+
+    def io_access(self, op: str, ticks: int):
+        self._log("IO %s: %d extra ticks", op, ticks)
+
+    def cache_access(self, op: str, adr: int, hit: bool, ticks: int):
+        self._log("Cache %s %d %s for %d extra ticks", op, adr, "hit" if hit else "miss", ticks)
+
+    def memory_transfer(self, op: str, ticks: int):
+        # On write miss the block goes on with cache write into the fetched line
+        self._log("Memory store/fetch: %d extra ticks" + ("\n" if op == "read" else ""), ticks)
+
+    def cache_fill_write(self, ticks: int):
+        self._log("Cache write into fetched: %d extra ticks\n", ticks)
+
+    def cache_insert(self, adr: int):
+        self._log("Cache insert %d", adr)
+
+    def line_evicted(self, adr: int):
+        self._log("Writing evicted line %d to memory", adr)
+
+    def prefetch_start(self, adr: int):
+        self._log("Started PARALLEL FETCHING of %d:", adr)
+
+    def cache_lookup(self, adr: int, hit: bool):
+        self._log("Cache %s on lookup %d", "hit" if hit else "miss", adr)
+
+    def prefetch_planned(self, tick: int):
+        self._log("planned finish on %d tick:\n", tick)
+
+    def wait_total(self, ticks: int):
+        self._log("In total CPU waited for %d extra ticks\n", ticks)
+
+    def finish(self, control_unit, output: str):
+        mem = control_unit._mem
+        self._log("Output Buffer: %s", output)
+        self._log("Output Buffer(ASCII codes): %s", ", ".join(map(str, mem._write_buffer)))
+        self._log("Memory Dump: %s", mem._mem)
+        self._log("Cache Dump: \n%s", "\n".join([f"{entry.line}" for entry in mem._cache.entries()]))
+
+
+class EventTracer(Tracer):
+    """
+    Structured events: every event is a plain dict with "event" key.
+    Events are passed to sink callable if given, otherwise collected in events list
+    """
+
+    enabled = True
+
+    def __init__(self, sink=None):
+        self.events = []
+        self._sink = sink if sink is not None else self.events.append
+
+    def tick(self, control_unit):
+        dp = control_unit._dp
+        self._sink(
+            {
+                "event": "tick",
+                "tick": control_unit._ticks,
+                "mpc": control_unit._mPC,
+                "pc": dp._PC,
+                "tos": dp._TOS,
+                "alu": dp._ALU,
+                "ds_depth": len(dp._DS.stack),
+                "rs_depth": len(dp._RS.stack),
+                "ar": control_unit._mem._AR,
+            }
+        )
+
+    def prefetch_wait(self, ticks: int):
+        self._sink({"event": "prefetch_wait", "ticks": ticks})
+
+    def io_access(self, op: str, ticks: int):
+        self._sink({"event": "io_access", "op": op, "ticks": ticks})
+
+    def cache_access(self, op: str, adr: int, hit: bool, ticks: int):
+        self._sink({"event": "cache_access", "op": op, "adr": adr, "hit": hit, "ticks": ticks})
+
+    def memory_transfer(self, op: str, ticks: int):
+        self._sink({"event": "memory_transfer", "op": op, "ticks": ticks})
+
+    def cache_fill_write(self, ticks: int):
+        self._sink({"event": "cache_fill_write", "ticks": ticks})
+
+    def cache_insert(self, adr: int):
+        self._sink({"event": "cache_insert", "adr": adr})
+
+    def line_evicted(self, adr: int):
+        self._sink({"event": "line_evicted", "adr": adr})
+
+    def prefetch_start(self, adr: int):
+        self._sink({"event": "prefetch_start", "adr": adr})
+
+    def cache_lookup(self, adr: int, hit: bool):
+        self._sink({"event": "cache_lookup", "adr": adr, "hit": hit})
+
+    def prefetch_planned(self, tick: int):
+        self._sink({"event": "prefetch_planned", "tick": tick})
+
+    def wait_total(self, ticks: int):
+        self._sink({"event": "wait_total", "ticks": ticks})
+
+    def finish(self, control_unit, output: str):
+        self._sink({"event": "finish", "tick": control_unit._ticks, "output": output})
+
+
+class TeeTracer(Tracer):
+    """Passes everything to all of the tracers, e.g. performance counters along with a journal"""
+
+    enabled = True
+
+    def __init__(self, *tracers: Tracer):
+        self._tracers = tracers
+
+    def tick(self, control_unit):
+        for tracer in self._tracers:
+            tracer.tick(control_unit)
+
+    def prefetch_wait(self, ticks: int):
+        for tracer in self._tracers:
+            tracer.prefetch_wait(ticks)
+
+    def io_access(self, op: str, ticks: int):
+        for tracer in self._tracers:
+            tracer.io_access(op, ticks)
+
+    def cache_access(self, op: str, adr: int, hit: bool, ticks: int):
+        for tracer in self._tracers:
+            tracer.cache_access(op, adr, hit, ticks)
+
+    def memory_transfer(self, op: str, ticks: int):
+        for tracer in self._tracers:
+            tracer.memory_transfer(op, ticks)
+
+    def cache_fill_write(self, ticks: int):
+        for tracer in self._tracers:
+            tracer.cache_fill_write(ticks)
+
+    def cache_insert(self, adr: int):
+        for tracer in self._tracers:
+            tracer.cache_insert(adr)
+
+    def line_evicted(self, adr: int):
+        for tracer in self._tracers:
+            tracer.line_evicted(adr)
+
+    def prefetch_start(self, adr: int):
+        for tracer in self._tracers:
+            tracer.prefetch_start(adr)
+
+    def cache_lookup(self, adr: int, hit: bool):
+        for tracer in self._tracers:
+            tracer.cache_lookup(adr, hit)
+
+    def prefetch_planned(self, tick: int):
+        for tracer in self._tracers:
+            tracer.prefetch_planned(tick)
+
+    def wait_total(self, ticks: int):
+        for tracer in self._tracers:
+            tracer.wait_total(ticks)
+
+    def finish(self, control_unit, output: str):
+        for tracer in self._tracers:
+            tracer.finish(control_unit, output)
@@ -0,0 +1,53 @@
+import logging
+import os
+
+import forthc
+import machine
+import pytest
+
+vector_unit = pytest.importorskip("vector_unit", exc_type=ImportError)
+
+# Inputs of different length make machines diverge on the very first loop
+PROGRAM_INPUTS = {
+    "cat.f": ["", "a", "Lorem Ipsum", "Lorem Ipsum dolor sit amet"],
+    "guess_game.f": ["5\r12\r", "50\r", "1\r2\r3\r4\r5\r6\r7\r", ""],
+    "hello_user_name.f": ["OneLoneCoder Fan\r", "Bob\r", "\r", "Bob"],
+    "bubble_sort.f": ["wordstocheck\r", "ba\r", "\r"],
+}
+
+
+def expected_outcome(code, buffer: str, cache_size: int, tick_limit: int):
+    control = machine.build_control_unit(code, buffer, "micro", cache_size=cache_size)
+    try:
+        return (*control.simulate(tick_limit), control._stop_reason)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("tick_limit", [300000, 1500])
+@pytest.mark.parametrize("cache_size", [32, 128])
+@pytest.mark.parametrize("program", sorted(PROGRAM_INPUTS))
+def test_vector_matches_microcode(program, cache_size, tick_limit, caplog):
+    caplog.set_level(logging.INFO)
+    with open(os.path.join("programs", program), encoding="utf-8") as file:
+        code = forthc.translate(file.read(), 0, 10)
+    buffers = PROGRAM_INPUTS[program]
+
+    machines = vector_unit.VectorMachines(code, buffers, cache_size=cache_size)
+    outcomes = [
+        type(outcome) if isinstance(outcome, Exception) else outcome for outcome in machines.simulate(tick_limit)
+    ]
+    assert outcomes == [expected_outcome(code, buffer, cache_size, tick_limit) for buffer in buffers]
+
+
+def test_vector_machine_errors(caplog):
+    caplog.set_level(logging.INFO)
+    # Second machine overflows data stack, third one divides by zero
+    code = forthc.translate(": main key dup 10 swap / drop begin dup 1 - dup 0 = until ; main", 0, 10)
+    buffers = ["\x05", "\xff", "\x00"]
+
+    outcomes = [
+        type(outcome) if isinstance(outcome, Exception) else outcome
+        for outcome in vector_unit.VectorMachines(code, buffers).simulate(300000)
+    ]
+    assert outcomes == [expected_outcome(code, buffer, 64, 300000) for buffer in buffers]
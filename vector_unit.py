@@ -0,0 +1,567 @@
+import numpy as np
+from datapath import Datapath
+from fast_unit import (
+    CALL_TICKS,
+    CPSTASH_TICKS,
+    DUP_TICKS,
+    EQUAL_TICKS,
+    FETCH_OP_TICKS,
+    FETCH_TICKS,
+    GREATEQ_TICKS,
+    HALT_TICKS,
+    JMP_TICKS,
+    JMPZ_TAKEN_TICKS,
+    JMPZ_TICKS,
+    LESS_TICKS,
+    LOOP_TICKS,
+    MAX_INSTRUCTION_TICKS,
+    POP_TICKS,
+    PUSH_TICKS,
+    RET_TICKS,
+    STASH_TICKS,
+    STORE_TICKS,
+    SWAP_TICKS,
+    UNSTASH_TICKS,
+    FastControlUnit,
+    routine_ticks,
+)
+from isa import Opcode
+from memory_unit import (
+    CACHE_EXTRA_TICKS,
+    EMPTY_LINE_TAG,
+    IO_EXTRA_TICKS,
+    MEM_EXTRA_TICKS,
+    Cache,
+    CacheEntry,
+    MemoryUnit,
+)
+
+# Lockstep engine: N machines running the same code image with different
+# inputs. Registers, stacks, memory and cache state of all machines are numpy
+# arrays, and on every step each running machine executes one instruction:
+# machines are grouped by the opcode they fetched, so diverged ones are just
+# masked out of other groups.
+#
+# Memory holds the latest value of every word, cache arrays keep only what
+# timing depends on (tags, dirty & PLRU bits): cache always has the latest
+# value of a line it holds, so values never have to be taken from lines.
+#
+# Everything rare (stack over/underflow, division by zero, instruction used as
+# data and vice versa, empty input buffer, addresses near memory bounds and
+# approaching tick limit) is left for the scalar engine: such a machine is
+# exported into Datapath/MemoryUnit/Cache objects on instruction boundary and
+# finished by FastControlUnit, so results always match the scalar ones.
+
+STACK_SIZE = 128
+WORD_MASK = 2**32 - 1
+WORD_SIGN = 2**31
+
+OPCODES = list(Opcode)
+OPCODE_IDX = {opcode: idx for idx, opcode in enumerate(OPCODES)}
+NO_OPCODE = -1
+
+# Stack depths (min, max) that keep an opcode clear of stack under/overflow
+DS_BOUNDS = {
+    Opcode.PUSH: (0, STACK_SIZE - 1),
+    Opcode.POP: (1, STACK_SIZE),
+    Opcode.DUP: (0, STACK_SIZE - 1),
+    Opcode.SWAP: (1, STACK_SIZE),
+    Opcode.STORE: (2, STACK_SIZE),
+    Opcode.ADD: (1, STACK_SIZE),
+    Opcode.SUB: (1, STACK_SIZE),
+    Opcode.MUL: (1, STACK_SIZE),
+    Opcode.DIV: (1, STACK_SIZE),
+    Opcode.MOD: (1, STACK_SIZE),
+    Opcode.OR: (1, STACK_SIZE),
+    Opcode.AND: (1, STACK_SIZE),
+    Opcode.EQUAL: (1, STACK_SIZE),
+    Opcode.LESS: (1, STACK_SIZE),
+    Opcode.GREATEQ: (1, STACK_SIZE),
+    Opcode.JMPZ: (1, STACK_SIZE),
+    Opcode.STASH: (1, STACK_SIZE),
+    Opcode.UNSTASH: (0, STACK_SIZE - 1),
+    Opcode.CPSTASH: (0, STACK_SIZE - 1),
+    Opcode.LOOP: (0, STACK_SIZE - 1),
+}
+RS_BOUNDS = {
+    Opcode.SWAP: (0, STACK_SIZE - 1),
+    Opcode.STASH: (0, STACK_SIZE - 1),
+    Opcode.UNSTASH: (1, STACK_SIZE),
+    Opcode.CPSTASH: (1, STACK_SIZE),
+    Opcode.LOOP: (2, STACK_SIZE),
+    Opcode.CALL: (0, STACK_SIZE - 1),
+    Opcode.RET: (1, STACK_SIZE),
+}
+
+
+def opcode_table(values: dict, default) -> np.ndarray:
+    # Indexed by opcode index, the last item is the one for NO_OPCODE (-1)
+    return np.array([values.get(opcode, default) for opcode in OPCODES] + [default])
+
+
+DS_MIN = opcode_table({opcode: bounds[0] for opcode, bounds in DS_BOUNDS.items()}, 0)
+DS_MAX = opcode_table({opcode: bounds[1] for opcode, bounds in DS_BOUNDS.items()}, STACK_SIZE)
+RS_MIN = opcode_table({opcode: bounds[0] for opcode, bounds in RS_BOUNDS.items()}, 0)
+RS_MAX = opcode_table({opcode: bounds[1] for opcode, bounds in RS_BOUNDS.items()}, STACK_SIZE)
+NEEDS_OPERAND = opcode_table(
+    dict.fromkeys([Opcode.PUSH, Opcode.JMPZ, Opcode.JMP, Opcode.LOOP, Opcode.CALL], True), False
+)
+NEEDS_DIVISOR = opcode_table(dict.fromkeys([Opcode.DIV, Opcode.MOD], True), False)
+ACCESSES_DATA = opcode_table(dict.fromkeys([Opcode.FETCH, Opcode.STORE], True), False)
+FETCH_IDX = OPCODE_IDX[Opcode.FETCH]
+
+BINARY_OPS = {
+    Opcode.ADD: np.add,
+    Opcode.SUB: np.subtract,
+    Opcode.MUL: np.multiply,
+    Opcode.DIV: np.floor_divide,
+    Opcode.MOD: np.remainder,
+    Opcode.OR: np.bitwise_or,
+    Opcode.AND: np.bitwise_and,
+}
+
+RUNNING = 0
+HALTED = 1
+EXPORTED = 2
+
+
+def fit_words(values):
+    # Extracting numbers that fit 32 bit int
+    return ((values + WORD_SIGN) & WORD_MASK) - WORD_SIGN
+
+
+def overflows(values):
+    return (values < -WORD_SIGN) | (values >= WORD_SIGN)
+
+
+def binary_op(operation, ticks: int):
+    def op(machines, idx, adr):
+        machines._tos[idx] = fit_words(operation(machines._ds_pop(idx), machines._tos[idx]))
+        machines._ticks[idx] += ticks
+
+    return op
+
+
+class VectorMachines:
+    """N machines with the same code and different input buffers simulated in lockstep"""
+
+    def __init__(
+        self,
+        code,
+        buffers: list,
+        mem_size: int = 1024,
+        cache_size: int = 64,
+        start_adr: int = 10,
+        io_adr: int = 0,
+    ):
+        n = len(buffers)
+        self._code = code
+        self._mem_size = mem_size
+        self._cache_size = cache_size
+        self._io_adr = io_adr
+        self._buffers = buffers
+        # Default geometry & bit-PLRU replacement of the cache
+        cache = Cache(cache_size)
+        ways = cache.ways
+        self._set_count = cache.set_count
+        self._line_size = cache.line_size
+
+        # Shared decoded code image
+        self._op_idx = np.full(mem_size, NO_OPCODE, dtype=np.int8)
+        self._operand = np.zeros(mem_size, dtype=np.int64)
+        self._has_operand = np.zeros(mem_size, dtype=bool)
+        # Initial memory: plain words are data, everything else is left as is
+        initial = np.zeros(mem_size, dtype=np.int64)
+        plain = np.ones(mem_size, dtype=bool)
+        self._objects = {}
+        for word in code:
+            adr = word["offset"]
+            if "opcode" in word:
+                self._objects[adr] = word
+                plain[adr] = False
+                self._op_idx[adr] = OPCODE_IDX[word["opcode"]]
+                if isinstance(word.get("operand"), int):
+                    self._operand[adr] = word["operand"]
+                    self._has_operand[adr] = True
+            elif isinstance(word.get("word"), int):
+                initial[adr] = word["word"]
+            else:
+                self._objects[adr] = word
+                plain[adr] = False
+
+        self._mem = np.tile(initial, (n, 1))
+        self._plain = np.tile(plain, (n, 1))
+
+        self._pc = np.full(n, start_adr, dtype=np.int64)
+        self._tos = np.zeros(n, dtype=np.int64)
+        self._ticks = np.zeros(n, dtype=np.int64)
+        self._status = np.full(n, RUNNING, dtype=np.int8)
+        self._ds = np.zeros((n, STACK_SIZE), dtype=np.int64)
+        self._ds_len = np.zeros(n, dtype=np.int64)
+        self._rs = np.zeros((n, STACK_SIZE), dtype=np.int64)
+        self._rs_len = np.zeros(n, dtype=np.int64)
+
+        self._inputs = np.zeros((n, max([len(buffer) for buffer in buffers] + [1])), dtype=np.int64)
+        for i, buffer in enumerate(buffers):
+            self._inputs[i, : len(buffer)] = [ord(char) for char in buffer]
+        self._input_len = np.array([len(buffer) for buffer in buffers], dtype=np.int64)
+        self._input_pos = np.zeros(n, dtype=np.int64)
+        self._outputs = [[] for _ in range(n)]
+
+        self._tags = np.full((n, ways, self._set_count), EMPTY_LINE_TAG, dtype=np.int64)
+        self._dirty = np.zeros((n, ways, self._set_count), dtype=bool)
+        self._plrum = np.zeros((n, ways, self._set_count), dtype=bool)
+        self._prefetch_end = np.zeros(n, dtype=np.int64)
+        self._hits = np.zeros(n, dtype=np.int64)
+        self._requests = np.zeros(n, dtype=np.int64)
+
+        # Results of machines finished by scalar engine
+        self._exported = {}
+
+    # ------------------------------
+    # Cache
+    # ------------------------------
+    def _lookup(self, idx, adr):
+        entry = (adr // self._line_size) % self._set_count
+        tag = adr // self._line_size // self._set_count
+        matches = self._tags[idx, :, entry] == tag[:, None]
+        return matches.any(axis=1), matches.argmax(axis=1), entry, tag
+
+    def _update_plrum(self, idx, way, entry):
+        self._plrum[idx, way, entry] = True
+        full = self._plrum[idx, :, entry].all(axis=1)
+        if full.any():
+            self._plrum[idx[full], :, entry[full]] = False
+            self._plrum[idx[full], way[full], entry[full]] = True
+
+    def _insert(self, idx, entry, tag):
+        victim = (~self._plrum[idx, :, entry]).argmax(axis=1)
+        ticks = MEM_EXTRA_TICKS + MEM_EXTRA_TICKS * self._dirty[idx, victim, entry]
+        self._tags[idx, victim, entry] = tag
+        self._dirty[idx, victim, entry] = False
+        self._plrum[idx, victim, entry] = False
+        return victim, ticks
+
+    def _prefetch(self, idx, adr, start_tick):
+        is_hit, _, entry, tag = self._lookup(idx, adr)
+        ticks = np.full(len(idx), CACHE_EXTRA_TICKS, dtype=np.int64)
+        missed = ~is_hit
+        if missed.any():
+            _, fetch_ticks = self._insert(idx[missed], entry[missed], tag[missed])
+            ticks[missed] += fetch_ticks
+        self._prefetch_end[idx] = start_tick + ticks
+
+    def _read(self, idx, adr, cur_ticks):
+        extra = np.maximum(self._prefetch_end[idx] - cur_ticks, 0) + (CACHE_EXTRA_TICKS - 1)
+        self._requests[idx] += 1
+        is_hit, way, entry, tag = self._lookup(idx, adr)
+        if is_hit.any():
+            self._hits[idx[is_hit]] += 1
+            self._update_plrum(idx[is_hit], way[is_hit], entry[is_hit])
+        missed = ~is_hit
+        if missed.any():
+            _, fetch_ticks = self._insert(idx[missed], entry[missed], tag[missed])
+            extra[missed] += fetch_ticks
+            self._prefetch(idx[missed], adr[missed] + self._line_size, cur_ticks[missed] + extra[missed])
+        return extra
+
+    def _write(self, idx, adr, values, cur_ticks):
+        extra = np.maximum(self._prefetch_end[idx] - cur_ticks, 0) + (CACHE_EXTRA_TICKS - 1)
+        self._mem[idx, adr] = values
+        self._plain[idx, adr] = True
+        self._requests[idx] += 1
+        is_hit, way, entry, tag = self._lookup(idx, adr)
+        missed = ~is_hit
+        if missed.any():
+            victim, fetch_ticks = self._insert(idx[missed], entry[missed], tag[missed])
+            way[missed] = victim
+            # Write into just fetched line is counted as one more (hit) request
+            self._requests[idx[missed]] += 1
+            extra[missed] += fetch_ticks + CACHE_EXTRA_TICKS
+        self._hits[idx] += 1
+        self._dirty[idx, way, entry] = True
+        self._update_plrum(idx, way, entry)
+        if missed.any():
+            self._prefetch(idx[missed], adr[missed] + self._line_size, cur_ticks[missed] + extra[missed])
+        return extra
+
+    # ------------------------------
+    # Stacks
+    # ------------------------------
+    def _ds_push(self, idx, values):
+        self._ds[idx, self._ds_len[idx]] = values
+        self._ds_len[idx] += 1
+
+    def _ds_pop(self, idx):
+        self._ds_len[idx] -= 1
+        return self._ds[idx, self._ds_len[idx]]
+
+    def _rs_push(self, idx, values):
+        self._rs[idx, self._rs_len[idx]] = values
+        self._rs_len[idx] += 1
+
+    def _rs_pop(self, idx):
+        self._rs_len[idx] -= 1
+        return self._rs[idx, self._rs_len[idx]]
+
+    # ------------------------------
+    # Export to scalar engine
+    # ------------------------------
+    def _safe_adr(self, adr):
+        # Address, its line and the line prefetched after it are inside memory
+        return (adr >= 0) & (adr - adr % self._line_size + 2 * self._line_size <= self._mem_size)
+
+    def _words(self, i: int) -> list:
+        words = self._mem[i].tolist()
+        for adr in np.flatnonzero(~self._plain[i]).tolist():
+            words[adr] = self._objects[adr]
+        return words
+
+    def export(self, i: int) -> FastControlUnit:
+        """Scalar machine in the very same state as machine i"""
+        words = self._words(i)
+        cache = Cache(self._cache_size)
+        for way in range(cache.ways):
+            for entry in range(cache.set_count):
+                tag = int(self._tags[i, way, entry])
+                if tag != EMPTY_LINE_TAG:
+                    line_start = (tag * cache.set_count + entry) * cache.line_size
+                    line = words[line_start : line_start + cache.line_size]
+                    cache.set_entry(entry, way, CacheEntry(tag, line, bool(self._dirty[i, way, entry])))
+        cache._policy.load(self._plrum[i].T.tolist())
+        cache._hits = int(self._hits[i])
+        cache._requests = int(self._requests[i])
+        cache.prefetch_end = int(self._prefetch_end[i])
+
+        read_buffer = list(self._buffers[i][int(self._input_pos[i]) :])
+        memory = MemoryUnit(self._io_adr, self._mem_size, self._code, read_buffer, cache)
+        memory._mem = words
+        memory._write_buffer = list(self._outputs[i])
+
+        datapath = Datapath(int(self._pc[i]), memory)
+        datapath._DS.stack = self._ds[i, : self._ds_len[i]].tolist()
+        datapath._RS.stack = self._rs[i, : self._rs_len[i]].tolist()
+        datapath._TOS = int(self._tos[i])
+
+        control = FastControlUnit(datapath, memory)
+        control._ticks = int(self._ticks[i])
+        return control
+
+    def _finish_exported(self, idx, tick_limit: int):
+        for i in idx.tolist():
+            control = self.export(i)
+            try:
+                self._exported[i] = (*control.simulate(tick_limit), control._stop_reason)
+            except Exception as e:
+                # Same error scalar simulation would end with
+                self._exported[i] = e
+            self._status[i] = EXPORTED
+
+    # ------------------------------
+    # Step
+    # ------------------------------
+    def _needs_export(self, act, op, tick_limit: int):
+        pc = self._pc[act]
+        ds_len = self._ds_len[act]
+        rs_len = self._rs_len[act]
+        export = (self._ticks[act] + MAX_INSTRUCTION_TICKS >= tick_limit) | ~self._safe_adr(pc) | (pc == self._io_adr)
+        pc = np.where(export, 0, pc)
+        export |= self._plain[act, pc] | (op == NO_OPCODE)
+        export |= (ds_len < DS_MIN[op]) | (ds_len > DS_MAX[op]) | (rs_len < RS_MIN[op]) | (rs_len > RS_MAX[op])
+        export |= NEEDS_OPERAND[op] & ~self._has_operand[pc]
+
+        tos = self._tos[act]
+        export |= NEEDS_DIVISOR[op] & (tos == 0)
+        is_fetch = op == FETCH_IDX
+        is_io = tos == self._io_adr
+        export |= is_fetch & is_io & (self._input_pos[act] >= self._input_len[act])
+        is_data = ACCESSES_DATA[op] & ~is_io
+        is_safe = self._safe_adr(tos)
+        export |= is_data & ~is_safe
+        export |= is_fetch & is_data & ~self._plain[act, np.where(is_safe, tos, 0)]
+        return export
+
+    def step(self, tick_limit: int):
+        act = np.flatnonzero(self._status == RUNNING)
+        pc = self._pc[act]
+        op = self._op_idx[np.clip(pc, 0, self._mem_size - 1)]
+        export = self._needs_export(act, op, tick_limit)
+        if export.any():
+            self._finish_exported(act[export], tick_limit)
+            act, pc, op = act[~export], pc[~export], op[~export]
+        if len(act) == 0:
+            return
+
+        # Instruction fetch
+        cur = self._ticks[act] + 1
+        self._ticks[act] = cur + self._read(act, pc, cur) + (FETCH_TICKS - 1)
+        self._pc[act] = pc + 1
+
+        for opcode_idx in np.unique(op).tolist():
+            group = op == opcode_idx
+            OPCODE_HANDLERS[OPCODES[opcode_idx]](self, act[group], pc[group])
+
+    def simulate(self, tick_limit: int) -> list:
+        """
+        Per machine (output, ticks, miss_rate, stop reason) tuples, or the exception
+        scalar simulation of that machine would raise
+        """
+        while (self._status == RUNNING).any():
+            self.step(tick_limit)
+        results = []
+        for i in range(len(self._status)):
+            if self._status[i] == EXPORTED:
+                results.append(self._exported[i])
+                continue
+            output = "".join(map(chr, self._outputs[i]))
+            miss_rate = (self._requests[i] - self._hits[i]) / self._requests[i]
+            results.append((output, int(self._ticks[i]), float(miss_rate), "halt"))
+        return results
+
+    # ------------------------------
+    # Opcodes
+    # ------------------------------
+    def op_push(self, idx, adr):
+        self._ds_push(idx, self._tos[idx])
+        self._tos[idx] = self._operand[adr]
+        self._ticks[idx] += PUSH_TICKS
+
+    def op_pop(self, idx, adr):
+        self._tos[idx] = self._ds_pop(idx)
+        self._ticks[idx] += POP_TICKS
+
+    def op_dup(self, idx, adr):
+        self._ds_push(idx, self._tos[idx])
+        self._ticks[idx] += DUP_TICKS
+
+    def op_swap(self, idx, adr):
+        top = self._ds_len[idx] - 1
+        tos = self._tos[idx]
+        self._tos[idx] = self._ds[idx, top]
+        self._ds[idx, top] = tos
+        self._ticks[idx] += SWAP_TICKS
+
+    def op_fetch(self, idx, adr):
+        cur = self._ticks[idx] + 1
+        data_adr = self._tos[idx]
+        extra = np.zeros(len(idx), dtype=np.int64)
+        is_io = data_adr == self._io_adr
+        if is_io.any():
+            io_idx = idx[is_io]
+            wait = np.maximum(self._prefetch_end[io_idx] - cur[is_io], 0)
+            extra[is_io] = wait + IO_EXTRA_TICKS - 1
+            self._tos[io_idx] = self._inputs[io_idx, self._input_pos[io_idx]]
+            self._input_pos[io_idx] += 1
+        is_mem = ~is_io
+        if is_mem.any():
+            mem_idx = idx[is_mem]
+            extra[is_mem] = self._read(mem_idx, data_adr[is_mem], cur[is_mem])
+            self._tos[mem_idx] = self._mem[mem_idx, data_adr[is_mem]]
+        self._ticks[idx] = cur + extra + FETCH_OP_TICKS - 1
+
+    def op_store(self, idx, adr):
+        cur = self._ticks[idx] + 2
+        data_adr = self._tos[idx]
+        values = self._ds_pop(idx)
+        extra = np.zeros(len(idx), dtype=np.int64)
+        is_io = data_adr == self._io_adr
+        if is_io.any():
+            io_idx = idx[is_io]
+            wait = np.maximum(self._prefetch_end[io_idx] - cur[is_io], 0)
+            extra[is_io] = wait + IO_EXTRA_TICKS - 1
+            for i, value in zip(io_idx.tolist(), values[is_io].tolist()):
+                self._outputs[i].append(value)
+        is_mem = ~is_io
+        if is_mem.any():
+            extra[is_mem] = self._write(idx[is_mem], data_adr[is_mem], values[is_mem], cur[is_mem])
+        self._tos[idx] = self._ds_pop(idx)
+        self._ticks[idx] = cur + extra + STORE_TICKS - 2
+
+    def op_equal(self, idx, adr):
+        self._tos[idx] = fit_words(self._ds_pop(idx) - self._tos[idx]) == 0
+        self._ticks[idx] += EQUAL_TICKS
+
+    def less_than(self, idx):
+        # Just as microcode does it: N xor V of (a - b)
+        diff = self._ds_pop(idx) - self._tos[idx]
+        return (fit_words(diff) < 0) != overflows(diff)
+
+    def op_less(self, idx, adr):
+        self._tos[idx] = self.less_than(idx)
+        self._ticks[idx] += LESS_TICKS
+
+    def op_greateq(self, idx, adr):
+        self._tos[idx] = ~self.less_than(idx)
+        self._ticks[idx] += GREATEQ_TICKS
+
+    def op_jmpz(self, idx, adr):
+        is_zero = self._tos[idx] == 0
+        self._tos[idx] = self._ds_pop(idx)
+        self._pc[idx] = np.where(is_zero, self._operand[adr], self._pc[idx])
+        self._ticks[idx] += np.where(is_zero, JMPZ_TAKEN_TICKS, JMPZ_TICKS)
+
+    def op_jmp(self, idx, adr):
+        self._pc[idx] = self._operand[adr]
+        self._ticks[idx] += JMP_TICKS
+
+    def op_stash(self, idx, adr):
+        self._rs_push(idx, self._tos[idx])
+        self._tos[idx] = self._ds_pop(idx)
+        self._ticks[idx] += STASH_TICKS
+
+    def op_unstash(self, idx, adr):
+        self._ds_push(idx, self._tos[idx])
+        self._tos[idx] = self._rs_pop(idx)
+        self._ticks[idx] += UNSTASH_TICKS
+
+    def op_cpstash(self, idx, adr):
+        self._ds_push(idx, self._tos[idx])
+        self._tos[idx] = self._rs[idx, self._rs_len[idx] - 1]
+        self._ticks[idx] += CPSTASH_TICKS
+
+    def op_loop(self, idx, adr):
+        counter = self._rs[idx, self._rs_len[idx] - 1]
+        limit = self._rs[idx, self._rs_len[idx] - 2]
+        is_done = fit_words(counter - limit) == 0
+        self._rs_len[idx[is_done]] -= 2
+        going = ~is_done
+        self._rs[idx[going], self._rs_len[idx[going]] - 1] = fit_words(counter[going] + 1)
+        self._pc[idx[going]] = self._operand[adr[going]]
+        self._ticks[idx] += LOOP_TICKS
+
+    def op_call(self, idx, adr):
+        self._rs_push(idx, self._pc[idx])
+        self._pc[idx] = self._operand[adr]
+        self._ticks[idx] += CALL_TICKS
+
+    def op_ret(self, idx, adr):
+        self._pc[idx] = self._rs_pop(idx)
+        self._ticks[idx] += RET_TICKS
+
+    def op_halt(self, idx, adr):
+        self._ticks[idx] += HALT_TICKS
+        self._status[idx] = HALTED
+
+
+OPCODE_HANDLERS = {
+    Opcode.PUSH: VectorMachines.op_push,
+    Opcode.POP: VectorMachines.op_pop,
+    Opcode.DUP: VectorMachines.op_dup,
+    Opcode.SWAP: VectorMachines.op_swap,
+    Opcode.FETCH: VectorMachines.op_fetch,
+    Opcode.STORE: VectorMachines.op_store,
+    Opcode.EQUAL: VectorMachines.op_equal,
+    Opcode.LESS: VectorMachines.op_less,
+    Opcode.GREATEQ: VectorMachines.op_greateq,
+    Opcode.JMPZ: VectorMachines.op_jmpz,
+    Opcode.JMP: VectorMachines.op_jmp,
+    Opcode.STASH: VectorMachines.op_stash,
+    Opcode.UNSTASH: VectorMachines.op_unstash,
+    Opcode.CPSTASH: VectorMachines.op_cpstash,
+    Opcode.LOOP: VectorMachines.op_loop,
+    Opcode.CALL: VectorMachines.op_call,
+    Opcode.RET: VectorMachines.op_ret,
+    Opcode.HALT: VectorMachines.op_halt,
+}
+for binary_opcode, operation in BINARY_OPS.items():
+    OPCODE_HANDLERS[binary_opcode] = binary_op(operation, routine_ticks(binary_opcode))
@@ -0,0 +1,117 @@
+from isa import Opcode
+from tracer import Tracer
+
+# Per Forth word tick profile. Instructions are told apart on micro address 0
+# just as for performance counters, so all the ticks of an instruction (memory
+# & IO waits included) go to it, to its source line and to the stack of words
+# it was executed in. The stack is kept by CALL (pushes the word named by the
+# call token) and RET (pops it), code outside of words is the "main" frame.
+
+MAIN_FRAME = "main"
+
+
+def word_name(ir: dict) -> str:
+    # Calls emitted without a token (none by now) are named by their target
+    return ir["token"]["val"] if "token" in ir else f"@{ir['operand']}"
+
+
+def instruction_name(pc: int, ir) -> str:
+    if not isinstance(ir, dict) or "opcode" not in ir:
+        return f"{pc} {ir}"
+    token = f" '{ir['token']['val']}'" if "token" in ir else ""
+    return f"{pc} {ir['opcode'].name}{token}"
+
+
+class WordProfiler(Tracer):
+    """Ticks by call stack, instruction & source line, see collapsed() and table()"""
+
+    enabled = True
+
+    def __init__(self):
+        # Call stack (tuple of words) -> ticks
+        self.stacks = {}
+        # PC -> [instruction, executions, ticks]
+        self.instructions = {}
+        # Word -> calls
+        self.calls = {}
+        self._stack = [MAIN_FRAME]
+        # Tick & PC the current instruction has started on
+        self._start = None
+        self._pc = None
+
+    def _close(self, ir, end_tick: int):
+        ticks = end_tick - self._start
+        stack = tuple(self._stack)
+        self.stacks[stack] = self.stacks.get(stack, 0) + ticks
+        entry = self.instructions.setdefault(self._pc, [ir, 0, 0])
+        entry[1] += 1
+        entry[2] += ticks
+        if not isinstance(ir, dict) or "opcode" not in ir:
+            return
+        if ir["opcode"] is Opcode.CALL:
+            name = word_name(ir)
+            self._stack.append(name)
+            self.calls[name] = self.calls.get(name, 0) + 1
+        elif ir["opcode"] is Opcode.RET and len(self._stack) > 1:
+            self._stack.pop()
+
+    def tick(self, control_unit):
+        if control_unit._mPC == 0:
+            if self._start is not None:
+                self._close(control_unit._dp._IR, control_unit._ticks)
+            self._start = control_unit._ticks
+            self._pc = control_unit._dp._PC
+
+    def finish(self, control_unit, output: str):
+        # The last instruction (halt or an unfinished one) is in memory, IR may have the previous one yet
+        if self._start is not None:
+            self._close(control_unit._mem.peek(self._pc), control_unit._ticks)
+            self._start = None
+
+    def total_ticks(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> str:
+        """Collapsed stacks ("main;word;inner ticks" lines) for flamegraph.pl, speedscope, etc."""
+        return "".join(f"{';'.join(stack)} {ticks}\n" for stack, ticks in sorted(self.stacks.items()))
+
+    def words(self) -> dict:
+        """Word -> [self ticks, total ticks], the total one counts recursive calls once"""
+        words = {}
+        for stack, ticks in self.stacks.items():
+            words.setdefault(stack[-1], [0, 0])[0] += ticks
+            for word in set(stack):
+                words.setdefault(word, [0, 0])[1] += ticks
+        return words
+
+    def lines(self) -> dict:
+        """Source line (None for code without tokens) -> ticks"""
+        lines = {}
+        for ir, _, ticks in self.instructions.values():
+            line = ir["token"]["line"] if isinstance(ir, dict) and "token" in ir else None
+            lines[line] = lines.get(line, 0) + ticks
+        return lines
+
+    def table(self, top: int = 15) -> str:
+        total = max(self.total_ticks(), 1)
+        words = sorted(self.words().items(), key=lambda item: -item[1][0])[:top]
+        lines = sorted(self.lines().items(), key=lambda item: -item[1])[:top]
+        instructions = sorted(self.instructions.items(), key=lambda item: -item[1][2])[:top]
+        rows = [
+            f"Word profile: {self.total_ticks()} ticks",
+            f"{'word':<24} {'self ticks':>10} {'self %':>7} {'total ticks':>11} {'total %':>7} {'calls':>8}",
+            *(
+                f"{word:<24} {own:>10} {own / total:>7.1%} {incl:>11} {incl / total:>7.1%} {self.calls.get(word, 0):>8}"
+                for word, (own, incl) in words
+            ),
+            "",
+            f"{'line':<24} {'ticks':>10} {'%':>7}",
+            *(f"{'-' if line is None else line:<24} {ticks:>10} {ticks / total:>7.1%}" for line, ticks in lines),
+            "",
+            f"{'instruction':<24} {'ticks':>10} {'%':>7} {'executions':>11}",
+            *(
+                f"{instruction_name(pc, ir):<24} {ticks:>10} {ticks / total:>7.1%} {count:>11}"
+                for pc, (ir, count, ticks) in instructions
+            ),
+        ]
+        return "\n".join(rows)
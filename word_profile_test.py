@@ -0,0 +1,34 @@
+import contextlib
+import io
+import logging
+
+import forthc
+import machine
+import pytest
+from isa import write_code
+
+
+@pytest.mark.parametrize("engine", ["micro", "fast"])
+def test_every_tick_is_attributed(engine, tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    target = str(tmp_path / "factorial.o")
+    with open("programs/factorial.f", encoding="utf-8") as file:
+        write_code(target, forthc.translate(file.read(), 0, 10))
+    folded = tmp_path / "factorial.folded"
+    args = [target, "--engine", engine, "--word-profile", str(folded), "--word-profile-top", "3"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.main(machine.parser.parse_args(args))
+
+    stacks = {}
+    for line in folded.read_text(encoding="utf-8").splitlines():
+        stack, ticks = line.rsplit(" ", 1)
+        stacks[stack] = int(ticks)
+    assert sum(stacks.values()) == 1645
+    # 10 factorial recurses down to 1 and prints the result with the preamble word
+    assert "main;" + ";".join(["factorial"] * 10) in stacks
+    assert max(stacks, key=stacks.get) == "main;."
+
+    table = next(record.getMessage() for record in caplog.records if record.getMessage().startswith("Word profile"))
+    words = table.split("\n\n")[0].splitlines()[2:]
+    assert [row.split()[0] for row in words] == [".", "factorial", "main"]
+    assert words[1].split()[-1] == "10"